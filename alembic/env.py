@@ -64,6 +64,10 @@ for model in model_classes:
         if hasattr(model, '__indexes__'):
             setattr(table, '__indexes__', model.__indexes__)
 
+        # Associate continuous aggregates metadata
+        if hasattr(model, '__continuous_aggregates__'):
+            setattr(table, '__continuous_aggregates__', model.__continuous_aggregates__)
+
 
 # --- MIGRATION BEHAVIOR CUSTOMIZATION ---
 
@@ -79,7 +83,7 @@ def include_object(object, name, type_, reflected, compare_to):
 def process_revision_directives(context, revision, directives):
     """
     Hook to modify the autogenerated alembic migration file before it's generated.
-    Injects hypertable and index creation SQL.
+    Injects hypertable, index and continuous aggregate creation SQL.
     """
     if directives[0].upgrade_ops is not None:
         process_ops(
@@ -158,6 +162,70 @@ def create_index_ops(table_name, indexes_meta):
     return upgrade_ops, downgrade_ops
 
 
+def create_continuous_aggregate_ops(table_name, time_col, cagg_meta):
+    """
+    Generate SQL operations for a TimescaleDB continuous aggregate, its refresh policy and indexes.
+    """
+    upgrade_ops = []
+    downgrade_ops = []
+
+    view_name = cagg_meta['name']
+    bucket = f"time_bucket(INTERVAL '{cagg_meta['bucket_width']}', {time_col})"
+    group_by = ', '.join(cagg_meta['group_by'])
+    aggregates = ', '.join(f"{expr} AS {name}" for name, expr in cagg_meta['aggregates'].items())
+
+    # WITH NO DATA allows creating the view in the migration transaction, the
+    # refresh policy then materializes it. materialized_only = false adds the
+    # buckets not materialized yet to query results (real-time aggregation).
+    create_view_sql = (
+        f"CREATE MATERIALIZED VIEW {view_name} "
+        f"WITH (timescaledb.continuous, timescaledb.materialized_only = false) AS "
+        f"SELECT {bucket} AS {time_col}, {group_by}, {aggregates} "
+        f"FROM {table_name} "
+        f"GROUP BY {bucket}, {group_by} "
+        f"WITH NO DATA;"
+    )
+    upgrade_ops.append(ops.ExecuteSQLOp(create_view_sql))
+
+    policy_sql = (
+        f"SELECT add_continuous_aggregate_policy('{view_name}', "
+        f"start_offset => INTERVAL '{cagg_meta['start_offset']}', "
+        f"end_offset => INTERVAL '{cagg_meta['end_offset']}', "
+        f"schedule_interval => INTERVAL '{cagg_meta['schedule_interval']}');"
+    )
+    upgrade_ops.append(ops.ExecuteSQLOp(policy_sql))
+
+    index_upgrade, _ = create_index_ops(view_name, cagg_meta.get('indexes', []))
+    upgrade_ops.extend(index_upgrade)
+
+    # Dropping the view also drops its policy and indexes
+    downgrade_ops.append(ops.ExecuteSQLOp(f"DROP MATERIALIZED VIEW IF EXISTS {view_name};"))
+
+    return upgrade_ops, downgrade_ops
+
+
+def check_continuous_aggregate_exists(context, view_name):
+    """
+    Query TimescaleDB's catalog to determine if a continuous aggregate already exists.
+    """
+    # In offline mode, assume the continuous aggregate doesn't exist
+    if not hasattr(context, 'bind'):
+        return False
+
+    sql = text("""
+    SELECT EXISTS (
+        SELECT 1
+        FROM timescaledb_information.continuous_aggregates
+        WHERE view_name = :view_name
+    );
+    """)
+
+    try:
+        return context.bind.execute(sql, {'view_name': view_name}).scalar()
+    except Exception:
+        return False
+
+
 def check_index_exists(context, table_name, index_name):
     """
     Query PostgreSQL system tables to determine if an index already exists.
@@ -229,6 +297,21 @@ def process_ops(context, upgrade_ops, downgrade_ops):
                 final_upgrade_ops.extend(upgrade)
                 new_downgrade_ops.extend(downgrade)
 
+    # Handle continuous aggregates, created after their hypertable
+    for table_name in all_tables:
+        table_obj = target_metadata.tables.get(table_name)
+        caggs_meta = getattr(table_obj, '__continuous_aggregates__', None)
+        hypertable_meta = getattr(table_obj, '__hypertable__', None)
+
+        if caggs_meta and hypertable_meta:
+            for cagg_meta in caggs_meta:
+                if check_continuous_aggregate_exists(context, cagg_meta['name']):
+                    continue
+                upgrade, downgrade = create_continuous_aggregate_ops(
+                    table_name, hypertable_meta['time_column'], cagg_meta)
+                final_upgrade_ops.extend(upgrade)
+                new_downgrade_ops.extend(downgrade)
+
     # Update operations
     upgrade_ops.ops = final_upgrade_ops
     downgrade_ops.ops = new_downgrade_ops + downgrade_ops.ops
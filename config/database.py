@@ -1,7 +1,12 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from config.metrics import instrument_pool
+from utils import release_session
 import os
 from dotenv import load_dotenv
+import asyncio
 import warnings
 
 # Load environment variables from .env file
@@ -16,6 +21,14 @@ POOL_TIMEOUT = int(os.getenv("POOL_TIMEOUT"))
 POOL_RECYCLE = int(os.getenv("POOL_RECYCLE"))
 REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT"))
 _statement_timeout_ms = int(REQUEST_TIMEOUT * 1000)
+# Serve requests with SQLAlchemy asyncio and asyncpg instead of psycopg2 worker threads
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+# Compiled SQL kept by SQLAlchemy, keyed by statement structure (e.g. a route with
+# a given set of filters). Each route compiles a few statements (count, page, export).
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1200))
+# Server-side prepared statements kept by asyncpg per connection, 0 to disable them
+# (required behind pgbouncer in transaction pooling mode)
+PREPARED_STATEMENT_CACHE_SIZE = int(os.getenv("PREPARED_STATEMENT_CACHE_SIZE", 500))
 
 # Read the database URL from the environment variable
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -32,10 +45,31 @@ if DATABASE_URL is not None:
         pool_timeout=POOL_TIMEOUT,
         pool_recycle=POOL_RECYCLE,
         pool_pre_ping=True,
+        query_cache_size=QUERY_CACHE_SIZE,
         connect_args={"options": f"-c statement_timeout={_statement_timeout_ms}"},
     )
+    instrument_pool(engine, "sync")
     # Create a session factory
     SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    if DB_ASYNC:
+        # Same pool limits and statement_timeout as the synchronous engine, which is
+        # still used by background tasks. The driver of DATABASE_URL is replaced by asyncpg,
+        # which prepares statements on the server and reuses them for identical SQL.
+        async_engine = create_async_engine(
+            make_url(DATABASE_URL).set(drivername="postgresql+asyncpg").update_query_dict(
+                {"prepared_statement_cache_size": str(PREPARED_STATEMENT_CACHE_SIZE)}),
+            pool_size=POOL_SIZE,
+            max_overflow=MAX_OVERFLOW,
+            pool_timeout=POOL_TIMEOUT,
+            pool_recycle=POOL_RECYCLE,
+            pool_pre_ping=True,
+            query_cache_size=QUERY_CACHE_SIZE,
+            connect_args={"server_settings": {"statement_timeout": str(_statement_timeout_ms)}},
+        )
+        instrument_pool(async_engine.sync_engine, "async")
+        AsyncSessionLocal = async_sessionmaker(
+            async_engine, autoflush=False, expire_on_commit=False)
 else:
     warnings.warn("DATABASE_URL is not configured in the ENV")
 
@@ -45,13 +79,29 @@ else:
 class Base(DeclarativeBase):
     pass
 
-# Dependency to get a DB session for FastAPI routes (used in controllers)
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    except Exception:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+# Dependency to get a DB session for FastAPI routes (used in controllers).
+# Once the session is closed, the admission slot taken by its first query is released.
+if DB_ASYNC:
+    async def get_db():
+        db = AsyncSessionLocal()
+        try:
+            yield db
+        except Exception:
+            await db.rollback()
+            raise
+        finally:
+            await db.close()
+            release_session(db)
+else:
+    async def get_db():
+        # Async so that the admission slot is released on the event loop. Closing
+        # the session may talk to the database, which is done in a worker thread.
+        db = SessionLocal()
+        try:
+            yield db
+        except Exception:
+            await asyncio.to_thread(db.rollback)
+            raise
+        finally:
+            await asyncio.to_thread(db.close)
+            release_session(db)
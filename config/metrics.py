@@ -0,0 +1,107 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import time
+
+# Prometheus metrics of the API, exposed by the /metrics endpoint.
+# Every metric is labelled with the route template (e.g. /hegemony/) of the request.
+
+REQUEST_DURATION = Histogram(
+    "ihr_http_request_duration_seconds", "Time to send the whole response",
+    ["route", "method", "status"])
+DB_CALL_DURATION = Histogram(
+    "ihr_db_call_duration_seconds", "Time spent in run_with_timeout (queries and DTO building)",
+    ["route"])
+POOL_WAIT_DURATION = Histogram(
+    "ihr_db_pool_wait_seconds", "Time waiting for a database connection from the pool",
+    ["route"])
+QUERY_DURATION = Histogram(
+    "ihr_db_query_duration_seconds", "Execution time of SQL statements, by kind of query",
+    ["route", "query"])
+QUERY_ROWS = Histogram(
+    "ihr_db_query_rows", "Rows returned by SQL statements, by kind of query",
+    ["route", "query"], buckets=(0, 1, 10, 100, 1000, 10000, 100000, 1000000))
+SERIALIZATION_DURATION = Histogram(
+    "ihr_serialization_duration_seconds", "Time to render results to the response format",
+    ["route", "format"])
+# Summed over the workers when running in multiprocess mode
+POOL_CHECKED_OUT = Gauge(
+    "ihr_db_pool_checked_out", "Connections currently checked out of the pool",
+    ["engine"], multiprocess_mode="livesum")
+POOL_OVERFLOW = Gauge(
+    "ihr_db_pool_overflow", "Connections opened beyond pool_size",
+    ["engine"], multiprocess_mode="livesum")
+ADMISSION_QUEUED = Gauge(
+    "ihr_admission_queued", "Database calls waiting for a free connection slot",
+    multiprocess_mode="livesum")
+COALESCED_CALLS = Counter(
+    "ihr_coalesced_calls", "Service calls that shared the result of an identical call in flight",
+    ["route"])
+STATEMENT_CACHE = Counter(
+    "ihr_db_statement_cache", "SQL statements executed, by result of SQLAlchemy's compiled cache lookup",
+    ["query", "result"])
+ADMISSION_REJECTED = Counter(
+    "ihr_admission_rejected", "Requests answered with a 503 by the admission controller",
+    ["route"])
+
+# ASGI scope of the request being handled. Worker threads started with asyncio.to_thread
+# inherit it, which lets the engine events below know which route ran a query.
+current_scope: ContextVar[Optional[dict]] = ContextVar("current_scope", default=None)
+
+
+def route_label() -> str:
+    scope = current_scope.get()
+    if scope is None:
+        # Queries made outside of requests, e.g. the background refresh
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+@contextmanager
+def timed(histogram: Histogram, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.labels(route=route_label(), **labels).observe(time.perf_counter() - start)
+
+
+# Statements are labelled with execution_options(query_label=...), e.g. count, page, estimate
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start", None)
+    if start is None:
+        return
+    route = route_label()
+    query = context.execution_options.get("query_label", "other")
+    QUERY_DURATION.labels(route=route, query=query).observe(time.perf_counter() - start)
+    # e.g. cache_hit, cache_miss, or no_cache_key for statements that can't be cached
+    STATEMENT_CACHE.labels(query=query, result=context.cache_hit.name.lower()).inc()
+    # rowcount is -1 when unknown, e.g. with server-side cursors
+    if cursor.rowcount is not None and cursor.rowcount >= 0:
+        QUERY_ROWS.labels(route=route, query=query).observe(cursor.rowcount)
+
+
+def instrument_pool(engine: Engine, name: str) -> None:
+    """
+    Keep the pool gauges of engine up to date, labelled with name.
+    """
+    pool = engine.pool
+
+    def update(*args):
+        POOL_CHECKED_OUT.labels(engine=name).set(pool.checkedout())
+        # overflow() is negative while fewer than pool_size connections are open
+        POOL_OVERFLOW.labels(engine=name).set(max(pool.overflow(), 0))
+
+    event.listen(pool, "checkout", update)
+    event.listen(pool, "checkin", update)
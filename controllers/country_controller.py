@@ -5,7 +5,7 @@ from dtos.generic_response_dto import GenericResponseDTO, build_url
 from dtos.country_dto import CountryDTO
 from config.database import get_db
 from typing import Optional
-from utils import page_size, run_with_timeout
+from utils import page_size, run_with_timeout, next_page_number
 
 # Define a router for all endpoints under /countries
 router = APIRouter(prefix="/countries", tags=["Countries"])
@@ -26,8 +26,10 @@ class CountryController:
             None, description="Search by country code"),
         name: Optional[str] = Query(
             None, description="Search for a substring in countries name"),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results")
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -name.")
     ) -> GenericResponseDTO[CountryDTO]:
         """Retrieves paginated countries with optional filters."""
 
@@ -39,10 +41,11 @@ class CountryController:
             name=name,
             page=page,
             order_by=ordering,
+            count_mode=count,
         )
 
         # Calculate next and previous pages
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, countries, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
         return GenericResponseDTO(
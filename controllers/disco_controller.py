@@ -6,7 +6,7 @@ from dtos.disco_events_dto import DiscoEventsDTO
 from config.database import get_db
 from typing import Optional
 from datetime import datetime
-from utils import page_size, run_with_timeout
+from utils import page_size, run_with_timeout, next_page_number
 
 router = APIRouter(prefix="/disco", tags=["Disco"])
 
@@ -60,8 +60,10 @@ class DiscoController:
             False, description="Include per-probe details in the response."),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results")
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -starttime.")
     ) -> GenericResponseDTO[DiscoEventsDTO]:
         """
         List network disconnections detected with RIPE Atlas.
@@ -98,9 +100,10 @@ class DiscoController:
             include_probe_details=include_probe_details,
             page=page,
             order_by=ordering,
+            count_mode=count,
         )
 
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, events_data, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
         return GenericResponseDTO(
@@ -1,15 +1,24 @@
 from dtos.hegemony_country_dto import HegemonyCountryDTO
 from dtos.hegemony_dto import HegemonyDTO
+from dtos.hegemony_aggregate_dto import HegemonyAggregateDTO
+from dtos.hegemony_batch_dto import HegemonyBatchRequestDTO
+from dtos.hegemony_diff_dto import HegemonyDiffDTO
 from dtos.hegemony_prefix_dto import HegemonyPrefixDTO
 from fastapi import APIRouter, Depends, Query, Request, Response, HTTPException, status
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from services.hegemony_service import HegemonyService
-from dtos.generic_response_dto import GenericResponseDTO, build_url
+from services.response_cache import response_cache
+from models.hegemony import Hegemony
+from models.hegemony_cone import HegemonyCone
+from models.hegemony_alarms import HegemonyAlarms
+from models.hegemony_country import HegemonyCountry
+from models.hegemony_prefix import HegemonyPrefix
+from dtos.generic_response_dto import GenericResponseDTO, build_url, render_response
 from dtos.hegemony_cone_dto import HegemonyConeDTO
 from dtos.hegemony_alarms_dto import HegemonyAlarmsDTO
 from config.database import get_db
-from typing import Optional, List
+from typing import Optional, List, Union
 from utils import page_size
 from utils import *
 
@@ -20,10 +29,11 @@ class HegemonyController:
     service = HegemonyService()
 
     @staticmethod
-    @router.get("", response_model=GenericResponseDTO[HegemonyDTO])
-    @router.get("/", response_model=GenericResponseDTO[HegemonyDTO], include_in_schema=False)
+    @router.get("", response_model=GenericResponseDTO[Union[HegemonyDTO, HegemonyAggregateDTO]])
+    @router.get("/", response_model=GenericResponseDTO[Union[HegemonyDTO, HegemonyAggregateDTO]], include_in_schema=False)
     async def get_hegemony(
         request: Request,
+        response: Response,
         db: Session = Depends(get_db),
         timebin: Optional[datetime] = Query(
             None, description="Timestamp of reported value."),
@@ -45,18 +55,31 @@ class HegemonyController:
             None, description="AS Hegemony is the estimated fraction of paths towards the originasn. The values range between 0 and 1, low values represent a small number of path (low dependency) and values close to 1 represent strong dependencies."),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set"),
+        cursor: Optional[str] = Query(
+            None, description="Opaque position of the next results, as returned in the 'next' url. Faster than page for walking through large result sets."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results")
-    ) -> GenericResponseDTO[HegemonyDTO]:
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -timebin."),
+        format: str = Query(
+            "json", pattern="^(json|ndjson|csv|arrow|parquet)$", description=EXPORT_FORMAT_DESCRIPTION),
+        top: Optional[int] = Query(
+            None, ge=1, description="Only return the top dependencies of each originasn, af and timebin, the ones with the highest AS hegemony among those matching the other parameters. For example top=10 returns the 10 main dependencies of each AS."),
+        resolution: Optional[str] = Query(
+            None, pattern="^(1h|1d|1w)$", description="Downsample the results to hourly (1h), daily (1d) or weekly (1w) buckets, with the average (hege_avg), minimum (hege_min) and maximum (hege_max) AS hegemony of each bucket. The hege filters then apply to hege_avg. Up to 31 days of hourly data, 366 days of daily data and 3660 days of weekly data can be fetched per request.")
+    ) -> GenericResponseDTO[Union[HegemonyDTO, HegemonyAggregateDTO]]:
         """
         List AS dependencies for all ASes visible in monitored BGP data. This endpoint also provides the AS dependency to the entire IP space (a.k.a. global graph) which is available by setting the originasn parameter to 0.
         <ul>
         <li><b>Required parameters:</b> timebin or a range of timebins (using the two parameters timebin__lte and timebin__gte).</li>
-        <li><b>Limitations:</b> At most 7 days of data can be fetched per request. For bulk downloads see: <a href="https://archive.ihr.live/" target="_blank">https://archive.ihr.live/</a>.</li>
+        <li><b>Limitations:</b> At most 7 days of data can be fetched per request, or more when exporting results with the format parameter or downsampling them with the resolution parameter. For bulk downloads see: <a href="https://archive.ihr.live/" target="_blank">https://archive.ihr.live/</a>.</li>
         </ul>
         """
+        format = negotiate_format(request, format)
+        max_days = RESOLUTION_MAX_DAYS[resolution] if resolution else 7
         timebin__gte, timebin__lte = validate_timebin_params(
-            timebin, timebin__gte, timebin__lte)
+            timebin, timebin__gte, timebin__lte,
+            max_days=max_days if format == "json" else max(max_days, EXPORT_MAX_DAYS))
 
         # Convert comma-separated ASNs to lists
         asn_list = [int(x.strip()) for x in asn.split(",")] if asn else None
@@ -70,9 +93,52 @@ class HegemonyController:
                 detail="Required parameter missing. Please provide one of the following parameters: ['originasn', 'asn']"
             )
 
-        hegemony_data, total_count = await run_with_timeout(
+        if resolution and top is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The top parameter cannot be combined with resolution."
+            )
+
+        if resolution:
+            return await HegemonyController._get_hegemony_aggregates(
+                request, response, db, resolution, format,
+                timebin_gte=timebin__gte,
+                timebin_lte=timebin__lte,
+                asn_ids=asn_list,
+                originasn_ids=originasn_list,
+                af=af,
+                hege=hege,
+                hege_gte=hege__gte,
+                hege_lte=hege__lte,
+                page=page,
+                cursor=cursor,
+                count=count,
+                ordering=ordering,
+            )
+
+        if format != "json":
+            return stream_export(
+                HegemonyController.service.stream_hegemony,
+                format,
+                "hegemony",
+                timebin_gte=timebin__gte,
+                timebin_lte=timebin__lte,
+                asn_ids=asn_list,
+                originasn_ids=originasn_list,
+                af=af,
+                hege=hege,
+                hege_gte=hege__gte,
+                hege_lte=hege__lte,
+                top=top,
+                order_by=ordering,
+            )
+
+        hegemony_data, total_count, next_cursor = await response_cache.run(
+            Hegemony,
             HegemonyController.service.get_hegemony,
             db,
+            request=request,
+            response=response,
             timebin_gte=timebin__gte,
             timebin_lte=timebin__lte,
             asn_ids=asn_list,
@@ -81,19 +147,195 @@ class HegemonyController:
             hege=hege,
             hege_gte=hege__gte,
             hege_lte=hege__lte,
+            top=top,
             page=page,
             order_by=ordering,
+            cursor=decode_cursor(cursor, ordering),
+            count_mode=count,
         )
 
         # Calculate pagination
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, hegemony_data, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
-        return GenericResponseDTO(
+        return render_response(
+            count=total_count,
+            next=build_url(request, next_page, next_cursor),
+            previous=build_url(request, prev_page),
+            results=hegemony_data,
+            headers=response.headers
+        )
+
+    @staticmethod
+    async def _get_hegemony_aggregates(request: Request, response: Response, db: Session,
+                                       resolution: str, format: str, page: int, cursor: Optional[str],
+                                       count: str, ordering: Optional[str], **filters):
+        if cursor is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The cursor parameter cannot be combined with resolution."
+            )
+
+        if format != "json":
+            return stream_export(
+                HegemonyController.service.stream_hegemony_aggregates,
+                format,
+                f"hegemony_{resolution}",
+                resolution=resolution,
+                order_by=ordering,
+                **filters,
+            )
+
+        aggregates, total_count, _ = await response_cache.run(
+            Hegemony,
+            HegemonyController.service.get_hegemony_aggregates,
+            db,
+            request=request,
+            response=response,
+            resolution=resolution,
+            page=page,
+            order_by=ordering,
+            count_mode=count,
+            **filters,
+        )
+
+        # Calculate pagination
+        next_page = next_page_number(page, aggregates, total_count, count)
+        prev_page = page - 1 if page > 1 else None
+
+        return render_response(
+            count=total_count,
+            next=build_url(request, next_page),
+            previous=build_url(request, prev_page),
+            results=aggregates,
+            headers=response.headers
+        )
+
+    @staticmethod
+    @router.post("/batch", response_class=StreamingResponse,
+                 responses={200: {"content": {EXPORT_MEDIA_TYPES["ndjson"]: {}}}})
+    async def post_hegemony_batch(body: HegemonyBatchRequestDTO) -> StreamingResponse:
+        """
+        Fetch the AS dependencies of many origin ASes at once, e.g. all the monitored networks of a timebin.
+        The origin ASNs and the filters of <a href="#/Hegemony/get_hegemony_hegemony_get">/hegemony</a> are given in a JSON body, so thousands of ASNs can be sent in a single request.
+        <ul>
+        <li><b>Response:</b> newline delimited JSON, one line per origin AS with its dependencies: {"originasn": ..., "originasn_name": ..., "dependencies": [{"timebin": ..., "asn": ..., "asn_name": ..., "hege": ..., "af": ...}, ...]}. Origins are sorted by ASN, and those without dependencies are omitted.</li>
+        <li><b>Limitations:</b> At most 10000 origin ASes and 7 days of data per request. Without timebin parameters the latest timebin is fetched.</li>
+        </ul>
+        """
+        timebin__gte, timebin__lte = validate_timebin_params(
+            body.timebin, body.timebin__gte, body.timebin__lte)
+
+        if len(body.originasn) > HEGEMONY_BATCH_MAX_ASNS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Too many origin ASNs, at most {HEGEMONY_BATCH_MAX_ASNS} are allowed per request."
+            )
+
+        # All the origins are fetched by a single query, the ASN list being sent as one array
+        return stream_export(
+            HegemonyController.service.stream_hegemony_by_origin,
+            "ndjson",
+            "hegemony_batch",
+            timebin_gte=timebin__gte,
+            timebin_lte=timebin__lte,
+            asn_ids=body.asn,
+            originasn_ids=body.originasn,
+            af=body.af,
+            hege_gte=body.hege__gte,
+            hege_lte=body.hege__lte,
+            top=body.top,
+        )
+
+    @staticmethod
+    @router.get("/diff", response_model=GenericResponseDTO[HegemonyDiffDTO])
+    @router.get("/diff/", response_model=GenericResponseDTO[HegemonyDiffDTO], include_in_schema=False)
+    async def get_hegemony_diff(
+        request: Request,
+        response: Response,
+        db: Session = Depends(get_db),
+        timebin: Optional[datetime] = Query(
+            None, description="Timebin whose AS dependencies are compared to the previous ones. Defaults to the latest timebin."),
+        previous_timebin: Optional[datetime] = Query(
+            None, description="Timebin the AS dependencies are compared to. Defaults to the timebin preceding timebin."),
+        threshold: float = Query(
+            0, ge=0, description="Only return dependencies whose AS hegemony changed by more than this value, besides the ones that appeared or disappeared."),
+        asn: Optional[str] = Query(
+            None, description="Dependency. Transit network commonly seen in BGP paths towards originasn. Can be a single value or a list of comma separated values."),
+        originasn: Optional[str] = Query(
+            None, description="Dependent network, it can be any public ASN. Can be a single value or a list of comma separated values."),
+        af: Optional[int] = Query(
+            None, description="Address Family (IP version), values are either 4 or 6."),
+        page: Optional[int] = Query(
+            1, ge=1, description="A page number within the paginated result set"),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
+        ordering: Optional[str] = Query(
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -delta."),
+        format: str = Query(
+            "json", pattern="^(json|ndjson|csv|arrow|parquet)$", description=EXPORT_FORMAT_DESCRIPTION)
+    ) -> GenericResponseDTO[HegemonyDiffDTO]:
+        """
+        List the AS dependencies that changed between two timebins: the ones whose AS hegemony changed by more than threshold (with the change in delta), and the ones that appeared or disappeared (with a missing hege or previous_hege). The change field is either 'changed', 'appeared' or 'disappeared'.
+        <ul>
+        <li><b>Required parameters:</b> originasn or asn.</li>
+        </ul>
+        """
+        format = negotiate_format(request, format)
+
+        # Convert comma-separated ASNs to lists
+        asn_list = [int(x.strip()) for x in asn.split(",")] if asn else None
+        originasn_list = [int(x.strip())
+                          for x in originasn.split(",")] if originasn else None
+
+        # Ensure either asn or originasn is provided
+        if not asn and not originasn:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Required parameter missing. Please provide one of the following parameters: ['originasn', 'asn']"
+            )
+
+        if format != "json":
+            return stream_export(
+                HegemonyController.service.stream_hegemony_diff,
+                format,
+                "hegemony_diff",
+                timebin=timebin,
+                previous_timebin=previous_timebin,
+                threshold=threshold,
+                asn_ids=asn_list,
+                originasn_ids=originasn_list,
+                af=af,
+                order_by=ordering,
+            )
+
+        changes, total_count, _ = await response_cache.run(
+            Hegemony,
+            HegemonyController.service.get_hegemony_diff,
+            db,
+            request=request,
+            response=response,
+            timebin=timebin,
+            previous_timebin=previous_timebin,
+            threshold=threshold,
+            asn_ids=asn_list,
+            originasn_ids=originasn_list,
+            af=af,
+            page=page,
+            order_by=ordering,
+            count_mode=count,
+        )
+
+        # Calculate pagination
+        next_page = next_page_number(page, changes, total_count, count)
+        prev_page = page - 1 if page > 1 else None
+
+        return render_response(
             count=total_count,
             next=build_url(request, next_page),
             previous=build_url(request, prev_page),
-            results=hegemony_data
+            results=changes,
+            headers=response.headers
         )
 
     @staticmethod
@@ -101,6 +343,7 @@ class HegemonyController:
     @router.get("/cones/", response_model=GenericResponseDTO[HegemonyConeDTO], include_in_schema=False)
     async def get_hegemony_cones(
         request: Request,
+        response: Response,
         db: Session = Depends(get_db),
         timebin: Optional[datetime] = Query(
             None, description="Get results for exact timestamp"),
@@ -114,43 +357,69 @@ class HegemonyController:
             None, description="Address Family (IP version) either 4 or 6"),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set"),
+        cursor: Optional[str] = Query(
+            None, description="Opaque position of the next results, as returned in the 'next' url. Faster than page for walking through large result sets."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results")
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -timebin."),
+        format: str = Query(
+            "json", pattern="^(json|ndjson|csv|arrow|parquet)$", description=EXPORT_FORMAT_DESCRIPTION)
     ) -> GenericResponseDTO[HegemonyConeDTO]:
         """
          The number of networks that depend on a given network. This is similar to CAIDA's customer cone size.
          <ul>
          <li><b>Required parameters:</b> timebin or a range of timebins (using the two parameters timebin__lte and timebin__gte).</li>
-         <li><b>Limitations:</b> At most 7 days of data can be fetched per request. For bulk downloads see: <a href="https://archive.ihr.live/" target="_blank">https://archive.ihr.live/</a>.</li>
+         <li><b>Limitations:</b> At most 7 days of data can be fetched per request, or more when exporting results with the format parameter. For bulk downloads see: <a href="https://archive.ihr.live/" target="_blank">https://archive.ihr.live/</a>.</li>
          </ul>
          networks).
         """
+        format = negotiate_format(request, format)
         timebin__gte, timebin__lte = validate_timebin_params(
-            timebin, timebin__gte, timebin__lte)
+            timebin, timebin__gte, timebin__lte,
+            max_days=7 if format == "json" else EXPORT_MAX_DAYS)
 
         # Convert comma-separated ASNs to list
         asn_list = [int(x.strip()) for x in asn.split(",")] if asn else None
 
-        cones, total_count = await run_with_timeout(
+        if format != "json":
+            return stream_export(
+                HegemonyController.service.stream_hegemony_cones,
+                format,
+                "hegemony_cones",
+                timebin_gte=timebin__gte,
+                timebin_lte=timebin__lte,
+                asn_ids=asn_list,
+                af=af,
+                order_by=ordering,
+            )
+
+        cones, total_count, next_cursor = await response_cache.run(
+            HegemonyCone,
             HegemonyController.service.get_hegemony_cones,
             db,
+            request=request,
+            response=response,
             timebin_gte=timebin__gte,
             timebin_lte=timebin__lte,
             asn_ids=asn_list,
             af=af,
             page=page,
             order_by=ordering,
+            cursor=decode_cursor(cursor, ordering),
+            count_mode=count,
         )
 
         # Calculate pagination
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, cones, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
-        return GenericResponseDTO(
+        return render_response(
             count=total_count,
-            next=build_url(request, next_page),
+            next=build_url(request, next_page, next_cursor),
             previous=build_url(request, prev_page),
-            results=cones
+            results=cones,
+            headers=response.headers
         )
 
     @staticmethod
@@ -158,6 +427,7 @@ class HegemonyController:
     @router.get("/alarms/", response_model=GenericResponseDTO[HegemonyAlarmsDTO], include_in_schema=False)
     async def get_hegemony_alarms(
         request: Request,
+        response: Response,
         db: Session = Depends(get_db),
         timebin: Optional[datetime] = Query(
             None, description="Timestamp of reported alarm."),
@@ -177,8 +447,12 @@ class HegemonyController:
             None, description="Significance of the AS Hegemony change."),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set"),
+        cursor: Optional[str] = Query(
+            None, description="Opaque position of the next results, as returned in the 'next' url. Faster than page for walking through large result sets."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results")
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -timebin.")
     ) -> GenericResponseDTO[HegemonyAlarmsDTO]:
         """
         List significant AS dependency changes detected by IHR anomaly detector.
@@ -195,9 +469,12 @@ class HegemonyController:
         originasn_list = [int(x.strip())
                           for x in originasn.split(",")] if originasn else None
 
-        alarms, total_count = await run_with_timeout(
+        alarms, total_count, next_cursor = await response_cache.run(
+            HegemonyAlarms,
             HegemonyController.service.get_hegemony_alarms,
             db,
+            request=request,
+            response=response,
             timebin_gte=timebin__gte,
             timebin_lte=timebin__lte,
             asn_ids=asn_list,
@@ -207,15 +484,17 @@ class HegemonyController:
             deviation_lte=deviation__lte,
             page=page,
             order_by=ordering,
+            cursor=decode_cursor(cursor, ordering),
+            count_mode=count,
         )
 
         # Calculate pagination
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, alarms, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
         return GenericResponseDTO(
             count=total_count,
-            next=build_url(request, next_page),
+            next=build_url(request, next_page, next_cursor),
             previous=build_url(request, prev_page),
             results=alarms
         )
@@ -225,6 +504,7 @@ class HegemonyController:
     @router.get("/countries/", response_model=GenericResponseDTO[HegemonyCountryDTO], include_in_schema=False)
     async def get_hegemony_countries(
         request: Request,
+        response: Response,
         db: Session = Depends(get_db),
         timebin: Optional[datetime] = Query(
             None, description="Timestamp of reported value."),
@@ -250,18 +530,26 @@ class HegemonyController:
             None, description="AS Hegemony is the estimated fraction of paths towards the monitored country. The values range between 0 and 1, low values represent a small number of path (low dependency) and values close to 1 represent strong dependencies."),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set"),
+        cursor: Optional[str] = Query(
+            None, description="Opaque position of the next results, as returned in the 'next' url. Faster than page for walking through large result sets."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results")
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -timebin."),
+        format: str = Query(
+            "json", pattern="^(json|ndjson|csv|arrow|parquet)$", description=EXPORT_FORMAT_DESCRIPTION)
     ) -> GenericResponseDTO[HegemonyCountryDTO]:
         """
         List AS dependencies of countries. A country infrastructure is defined by its ASes registed in RIRs delegated files. Emphasis can be put on eyeball users with the eyeball weighting scheme (i.e. weightscheme='eyeball').
         <ul>
         <li><b>Required parameters:</b> timebin or a range of timebins (using the two parameters timebin__lte and timebin__gte).</li>
-        <li><b>Limitations:</b> At most 31 days of data can be fetched per request. For bulk downloads see: <a href="https://archive.ihr.live/" target="_blank">https://archive.ihr.live/</a>.</li>
+        <li><b>Limitations:</b> At most 31 days of data can be fetched per request, or more when exporting results with the format parameter. For bulk downloads see: <a href="https://archive.ihr.live/" target="_blank">https://archive.ihr.live/</a>.</li>
         </ul>
         """
+        format = negotiate_format(request, format)
         timebin__gte, timebin__lte = validate_timebin_params(
-            timebin, timebin__gte, timebin__lte, max_days=31)
+            timebin, timebin__gte, timebin__lte,
+            max_days=31 if format == "json" else EXPORT_MAX_DAYS)
 
         # Ensure either `asn` or `country` is provided
         if not asn and not country:
@@ -275,9 +563,30 @@ class HegemonyController:
         country_list = [x.strip()
                         for x in country.split(",")] if country else None
 
-        countries, total_count = await run_with_timeout(
+        if format != "json":
+            return stream_export(
+                HegemonyController.service.stream_hegemony_countries,
+                format,
+                "hegemony_countries",
+                timebin_gte=timebin__gte,
+                timebin_lte=timebin__lte,
+                asn_ids=asn_list,
+                countries=country_list,
+                af=af,
+                weightscheme=weightscheme,
+                transitonly=transitonly,
+                hege=hege,
+                hege_gte=hege__gte,
+                hege_lte=hege__lte,
+                order_by=ordering,
+            )
+
+        countries, total_count, next_cursor = await response_cache.run(
+            HegemonyCountry,
             HegemonyController.service.get_hegemony_countries,
             db,
+            request=request,
+            response=response,
             timebin_gte=timebin__gte,
             timebin_lte=timebin__lte,
             asn_ids=asn_list,
@@ -290,17 +599,20 @@ class HegemonyController:
             hege_lte=hege__lte,
             page=page,
             order_by=ordering,
+            cursor=decode_cursor(cursor, ordering),
+            count_mode=count,
         )
 
         # Calculate pagination
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, countries, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
-        return GenericResponseDTO(
+        return render_response(
             count=total_count,
-            next=build_url(request, next_page),
+            next=build_url(request, next_page, next_cursor),
             previous=build_url(request, prev_page),
-            results=countries
+            results=countries,
+            headers=response.headers
         )
 
     @staticmethod
@@ -308,6 +620,7 @@ class HegemonyController:
     @router.get("/prefixes/", response_model=GenericResponseDTO[HegemonyPrefixDTO], include_in_schema=False)
     async def get_hegemony_prefixes(
         request: Request,
+        response: Response,
         db: Session = Depends(get_db),
         timebin: Optional[datetime] = Query(
             None, description="Timestamp of reported value."),
@@ -343,14 +656,20 @@ class HegemonyController:
             None, description="Filter out dependency results and provide only prefix/origin ASN results"),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set"),
+        cursor: Optional[str] = Query(
+            None, description="Opaque position of the next results, as returned in the 'next' url. Faster than page for walking through large result sets."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results")
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -timebin."),
+        format: str = Query(
+            "json", pattern="^(json|ndjson|csv|arrow|parquet)$", description=EXPORT_FORMAT_DESCRIPTION)
     ) -> GenericResponseDTO[HegemonyPrefixDTO]:
         """
         List AS dependencies of prefixes. 
         <ul>
         <li><b>Required parameters:</b> timebin or a range of timebins (using the two parameters timebin__lte and timebin__gte). And one of the following: prefix, originasn, country, rpki_status, irr_status, delegated_prefix_status, delegated_asn_status.</li>
-        <li><b>Limitations:</b> At most 3 days of data can be fetched per request. For bulk downloads see: <a href="https://archive.ihr.live/" target="_blank">https://archive.ihr.live/</a>.</li>
+        <li><b>Limitations:</b> At most 3 days of data can be fetched per request, or more when exporting results with the format parameter. For bulk downloads see: <a href="https://archive.ihr.live/" target="_blank">https://archive.ihr.live/</a>.</li>
         </ul>
         """
         # Ensure at least one filter is provided
@@ -361,8 +680,10 @@ class HegemonyController:
                 detail="Required parameter missing. Please provide one of the following parameter: ['prefix', 'originasn', 'country', 'rpki_status', 'irr_status', 'delegated_prefix_status', 'delegated_asn_status']"
             )
 
+        format = negotiate_format(request, format)
         timebin__gte, timebin__lte = validate_timebin_params(
-            timebin, timebin__gte, timebin__lte, max_days=3)
+            timebin, timebin__gte, timebin__lte,
+            max_days=3 if format == "json" else EXPORT_MAX_DAYS)
 
         # Convert comma-separated values to lists
         prefix_list = [x.strip()
@@ -373,9 +694,35 @@ class HegemonyController:
         country_list = [x.strip()
                         for x in country.split(",")] if country else None
 
-        prefixes, total_count = await run_with_timeout(
+        if format != "json":
+            return stream_export(
+                HegemonyController.service.stream_hegemony_prefixes,
+                format,
+                "hegemony_prefixes",
+                timebin_gte=timebin__gte,
+                timebin_lte=timebin__lte,
+                prefixes=prefix_list,
+                asn_ids=asn_list,
+                originasn_ids=originasn_list,
+                countries=country_list,
+                rpki_status=rpki_status,
+                irr_status=irr_status,
+                delegated_prefix_status=delegated_prefix_status,
+                delegated_asn_status=delegated_asn_status,
+                af=af,
+                hege=hege,
+                hege_gte=hege__gte,
+                hege_lte=hege__lte,
+                origin_only=origin_only,
+                order_by=ordering,
+            )
+
+        prefixes, total_count, next_cursor = await response_cache.run(
+            HegemonyPrefix,
             HegemonyController.service.get_hegemony_prefixes,
             db,
+            request=request,
+            response=response,
             timebin_gte=timebin__gte,
             timebin_lte=timebin__lte,
             prefixes=prefix_list,
@@ -393,15 +740,18 @@ class HegemonyController:
             origin_only=origin_only,
             page=page,
             order_by=ordering,
+            cursor=decode_cursor(cursor, ordering),
+            count_mode=count,
         )
 
         # Calculate pagination
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, prefixes, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
-        return GenericResponseDTO(
+        return render_response(
             count=total_count,
-            next=build_url(request, next_page),
+            next=build_url(request, next_page, next_cursor),
             previous=build_url(request, prev_page),
-            results=prefixes
+            results=prefixes,
+            headers=response.headers
         )
@@ -1,13 +1,16 @@
-from fastapi import APIRouter, Depends, Query, Request
+from fastapi import APIRouter, Depends, Query, Request, Response
 from datetime import datetime, timedelta, date
 from sqlalchemy.orm import Session
 from services.metis_service import MetisService
+from services.response_cache import response_cache
+from models.metis_atlas_deployment import MetisAtlasDeployment
+from models.metis_atlas_selection import MetisAtlasSelection
 from dtos.generic_response_dto import GenericResponseDTO, build_url
 from dtos.metis_atlas_deployment_dto import MetisAtlasDeploymentDTO
 from dtos.metis_atlas_selection_dto import MetisAtlasSelectionDTO
 from config.database import get_db
 from typing import Optional
-from utils import page_size, run_with_timeout, validate_timebin_params
+from utils import page_size, validate_timebin_params, decode_cursor, next_page_number
 
 router = APIRouter(prefix="/metis/atlas", tags=["Metis"])
 
@@ -20,6 +23,7 @@ class MetisController:
     @router.get("/deployment/", response_model=GenericResponseDTO[MetisAtlasDeploymentDTO], include_in_schema=False)
     async def get_metis_atlas_deployments(
         request: Request,
+        response: Response,
         db: Session = Depends(get_db),
         timebin: Optional[datetime] = Query(
             None, description="Time when the ranking is computed. The ranking uses 24 weeks of data, hence 2022-05-23T00:00 means the ranking using data from 2021-12-06T00:00 to 2022-05-23T00:00."),
@@ -39,8 +43,12 @@ class MetisController:
             None, description="Address Family (IP version), values are either 4 or 6"),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set"),
+        cursor: Optional[str] = Query(
+            None, description="Opaque position of the next results, as returned in the 'next' url. Faster than page for walking through large result sets."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results.")
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -timebin.")
     ) -> GenericResponseDTO[MetisAtlasDeploymentDTO]:
         """
         Metis identifies ASes that are far from Atlas probes. Deploying Atlas probes in these ASes would be beneficial for Atlas coverage.
@@ -51,9 +59,12 @@ class MetisController:
         timebin__gte, timebin__lte = validate_timebin_params(
             timebin, timebin__gte, timebin__lte, max_days=31)
 
-        deployments, total_count = await run_with_timeout(
+        deployments, total_count, next_cursor = await response_cache.run(
+            MetisAtlasDeployment,
             MetisController.service.get_metis_atlas_deployments,
             db,
+            request=request,
+            response=response,
             timebin=timebin,
             timebin_gte=timebin__gte,
             timebin_lte=timebin__lte,
@@ -64,15 +75,17 @@ class MetisController:
             af=af,
             page=page,
             order_by=ordering,
+            cursor=decode_cursor(cursor, ordering),
+            count_mode=count,
         )
 
         # Calculate pagination
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, deployments, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
         return GenericResponseDTO(
             count=total_count,
-            next=build_url(request, next_page),
+            next=build_url(request, next_page, next_cursor),
             previous=build_url(request, prev_page),
             results=deployments
         )
@@ -82,6 +95,7 @@ class MetisController:
     @router.get("/selection/", response_model=GenericResponseDTO[MetisAtlasSelectionDTO], include_in_schema=False)
     async def get_metis_atlas_selections(
         request: Request,
+        response: Response,
         db: Session = Depends(get_db),
         timebin: Optional[datetime] = Query(
             None, description="Time when the ranking is computed. The ranking uses four weeks of data, hence 2022-03-28T00:00 means the ranking using data from 2022-02-28T00:00 to 2022-03-28T00:00."),
@@ -101,8 +115,12 @@ class MetisController:
             None, description="Address Family (IP version), values are either 4 or 6"),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set"),
+        cursor: Optional[str] = Query(
+            None, description="Opaque position of the next results, as returned in the 'next' url. Faster than page for walking through large result sets."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results.")
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -timebin.")
     ) -> GenericResponseDTO[MetisAtlasSelectionDTO]:
         """
         Metis helps to select a set of diverse Atlas probes in terms of different topological metrics. (e.g. AS path, RTT)
@@ -113,9 +131,12 @@ class MetisController:
         timebin__gte, timebin__lte = validate_timebin_params(
             timebin, timebin__gte, timebin__lte, max_days=31)
 
-        selections, total_count = await run_with_timeout(
+        selections, total_count, next_cursor = await response_cache.run(
+            MetisAtlasSelection,
             MetisController.service.get_metis_atlas_selections,
             db,
+            request=request,
+            response=response,
             timebin=timebin,
             timebin_gte=timebin__gte,
             timebin_lte=timebin__lte,
@@ -126,15 +147,17 @@ class MetisController:
             af=af,
             page=page,
             order_by=ordering,
+            cursor=decode_cursor(cursor, ordering),
+            count_mode=count,
         )
 
         # Calculate pagination
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, selections, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
         return GenericResponseDTO(
             count=total_count,
-            next=build_url(request, next_page),
+            next=build_url(request, next_page, next_cursor),
             previous=build_url(request, prev_page),
             results=selections
         )
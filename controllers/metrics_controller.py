@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Response
+from prometheus_client import CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST, generate_latest, multiprocess, values
+import logging
+import os
+
+# Whether metrics are written to PROMETHEUS_MULTIPROC_DIR, shared by several uvicorn workers
+# (see the prometheus_client multiprocess documentation). prometheus_client only reads
+# the variable from the environment when imported, i.e. before .env is loaded.
+MULTIPROCESS = values.ValueClass is not values.MutexValue
+
+if not MULTIPROCESS and os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    logging.getLogger("ihr.metrics").warning(
+        "PROMETHEUS_MULTIPROC_DIR must be set in the environment rather than in .env, "
+        "metrics are kept by each worker")
+
+router = APIRouter(prefix="", tags=["Metrics"])
+
+class MetricsController:
+    @staticmethod
+    @router.get("/metrics", include_in_schema=False)
+    def get_metrics():
+        registry = REGISTRY
+        if MULTIPROCESS:
+            # Aggregate the metrics written by every worker
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
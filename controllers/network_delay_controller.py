@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Depends, Query, Request, HTTPException
+from fastapi import APIRouter, Depends, Query, Request, Response, HTTPException, status
 from sqlalchemy.orm import Session
 from services.network_delay_service import NetworkDelayService
-from dtos.generic_response_dto import GenericResponseDTO, build_url
+from services.response_cache import response_cache
+from models.atlas_delay import AtlasDelay
+from models.atlas_delay_alarms import AtlasDelayAlarms
+from dtos.generic_response_dto import GenericResponseDTO, build_url, render_response
 from dtos.network_delay_locations_dto import NetworkDelayLocationsDTO
 from dtos.network_delay_dto import NetworkDelayDTO
+from dtos.network_delay_aggregate_dto import NetworkDelayAggregateDTO
 from dtos.network_delay_alarms_dto import NetworkDelayAlarmsDTO
 from config.database import get_db
-from typing import Optional, List
+from typing import Optional, List, Union
 from datetime import datetime
 from utils import page_size
 from utils import *
@@ -34,8 +38,10 @@ class NetworkDelayController:
             None, description="Address Family (IP version), values are either 4 or 6."),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set"),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results.")
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. type,name.")
     ) -> GenericResponseDTO[NetworkDelayLocationsDTO]:
         """
         List locations monitored for network delay measurements. A location can be, for example, an AS, city, Atlas probe.
@@ -48,10 +54,11 @@ class NetworkDelayController:
             af=af,
             page=page,
             order_by=ordering,
+            count_mode=count,
         )
 
         # Calculate pagination
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, locations, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
         return GenericResponseDTO(
@@ -62,10 +69,11 @@ class NetworkDelayController:
         )
 
     @staticmethod
-    @router.get("", response_model=GenericResponseDTO[NetworkDelayDTO])
-    @router.get("/", response_model=GenericResponseDTO[NetworkDelayDTO], include_in_schema=False)
+    @router.get("", response_model=GenericResponseDTO[Union[NetworkDelayDTO, NetworkDelayAggregateDTO]])
+    @router.get("/", response_model=GenericResponseDTO[Union[NetworkDelayDTO, NetworkDelayAggregateDTO]], include_in_schema=False)
     async def get_network_delays(
         request: Request,
+        response: Response,
         db: Session = Depends(get_db),
         timebin: Optional[datetime] = Query(
             None,
@@ -119,21 +127,81 @@ class NetworkDelayController:
             None, description="Estimated median RTT. RTT values are directly extracted from traceroute (a.k.a. realrtts) and estimated via differential RTTs."),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set"),
+        cursor: Optional[str] = Query(
+            None, description="Opaque position of the next results, as returned in the 'next' url. Faster than page for walking through large result sets."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results.")
-    ) -> GenericResponseDTO[NetworkDelayDTO]:
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -timebin."),
+        format: str = Query(
+            "json", pattern="^(json|ndjson|csv|arrow|parquet)$", description=EXPORT_FORMAT_DESCRIPTION),
+        resolution: Optional[str] = Query(
+            None, pattern="^(1h|1d|1w)$", description="Aggregate the delays of each pair of locations in hourly (1h), daily (1d) or weekly (1w) buckets, with the average, minimum and maximum median RTT, the average number of probes and entropy, and the number of aggregated timebins. The median filters apply to the timebins before aggregation. Up to 31 days of hourly data, 366 days of daily data and 3660 days of weekly data can be fetched per request.")
+    ) -> GenericResponseDTO[Union[NetworkDelayDTO, NetworkDelayAggregateDTO]]:
         """
         List estimated network delays between two potentially remote locations. A location can be, for example, an AS, city, Atlas probe.
         <ul>
         <li><b>Required parameters:</b> timebin or a range of timebins (using the two parameters timebin__lte and timebin__gte).</li>
-        <li><b>Limitations:</b> At most 7 days of data can be fetched per request. For bulk downloads see: <a href="https://archive.ihr.live/" target="_blank">https://archive.ihr.live/</a>.</li>
+        <li><b>Limitations:</b> At most 7 days of data can be fetched per request, or more when exporting results with the format parameter or aggregating them with the resolution parameter. For bulk downloads see: <a href="https://archive.ihr.live/" target="_blank">https://archive.ihr.live/</a>.</li>
         </ul>
         """
+        format = negotiate_format(request, format)
+        max_days = RESOLUTION_MAX_DAYS[resolution] if resolution else 7
         timebin__gte, timebin__lte = validate_timebin_params(
-            timebin, timebin__gte, timebin__lte)
-        delays, total_count = await run_with_timeout(
+            timebin, timebin__gte, timebin__lte,
+            max_days=max_days if format == "json" else max(max_days, EXPORT_MAX_DAYS))
+
+        if resolution:
+            return await NetworkDelayController._get_network_delay_aggregates(
+                request, response, db, resolution, format,
+                timebin=timebin,
+                timebin_gte=timebin__gte,
+                timebin_lte=timebin__lte,
+                startpoint_names=startpoint_name,
+                endpoint_names=endpoint_name,
+                startpoint_type=startpoint_type,
+                endpoint_type=endpoint_type,
+                startpoint_af=startpoint_af,
+                endpoint_af=endpoint_af,
+                median=median,
+                median_gte=median__gte,
+                median_lte=median__lte,
+                startpoint_key=startpoint_key,
+                endpoint_key=endpoint_key,
+                page=page,
+                cursor=cursor,
+                count=count,
+                ordering=ordering,
+            )
+
+        if format != "json":
+            return stream_export(
+                NetworkDelayController.service.stream_network_delays,
+                format,
+                "network_delay",
+                timebin=timebin,
+                timebin_gte=timebin__gte,
+                timebin_lte=timebin__lte,
+                startpoint_names=startpoint_name,
+                endpoint_names=endpoint_name,
+                startpoint_type=startpoint_type,
+                endpoint_type=endpoint_type,
+                startpoint_af=startpoint_af,
+                endpoint_af=endpoint_af,
+                median=median,
+                median_gte=median__gte,
+                median_lte=median__lte,
+                startpoint_key=startpoint_key,
+                endpoint_key=endpoint_key,
+                order_by=ordering,
+            )
+
+        delays, total_count, next_cursor = await response_cache.run(
+            AtlasDelay,
             NetworkDelayController.service.get_network_delays,
             db,
+            request=request,
+            response=response,
             timebin=timebin,
             timebin_gte=timebin__gte,
             timebin_lte=timebin__lte,
@@ -150,16 +218,63 @@ class NetworkDelayController:
             endpoint_key=endpoint_key,
             page=page,
             order_by=ordering,
+            cursor=decode_cursor(cursor, ordering),
+            count_mode=count,
         )
 
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, delays, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
-        return GenericResponseDTO(
+        return render_response(
+            count=total_count,
+            next=build_url(request, next_page, next_cursor),
+            previous=build_url(request, prev_page),
+            results=delays,
+            headers=response.headers
+        )
+
+    @staticmethod
+    async def _get_network_delay_aggregates(request: Request, response: Response, db: Session,
+                                            resolution: str, format: str, page: int, cursor: Optional[str],
+                                            count: str, ordering: Optional[str], **filters):
+        if cursor is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="The cursor parameter cannot be combined with resolution."
+            )
+
+        if format != "json":
+            return stream_export(
+                NetworkDelayController.service.stream_network_delay_aggregates,
+                format,
+                f"network_delay_{resolution}",
+                resolution=resolution,
+                order_by=ordering,
+                **filters,
+            )
+
+        aggregates, total_count, _ = await response_cache.run(
+            AtlasDelay,
+            NetworkDelayController.service.get_network_delay_aggregates,
+            db,
+            request=request,
+            response=response,
+            resolution=resolution,
+            page=page,
+            order_by=ordering,
+            count_mode=count,
+            **filters,
+        )
+
+        next_page = next_page_number(page, aggregates, total_count, count)
+        prev_page = page - 1 if page > 1 else None
+
+        return render_response(
             count=total_count,
             next=build_url(request, next_page),
             previous=build_url(request, prev_page),
-            results=delays
+            results=aggregates,
+            headers=response.headers
         )
 
     @staticmethod
@@ -167,6 +282,7 @@ class NetworkDelayController:
     @router.get("/alarms/", response_model=GenericResponseDTO[NetworkDelayAlarmsDTO], include_in_schema=False)
     async def get_network_delay_alarms(
         request: Request,
+        response: Response,
         db: Session = Depends(get_db),
         timebin: Optional[datetime] = Query(
             None,
@@ -224,9 +340,13 @@ class NetworkDelayController:
             1, ge=1,
             description="A page number within the paginated result set"
         ),
+        cursor: Optional[str] = Query(
+            None, description="Opaque position of the next results, as returned in the 'next' url. Faster than page for walking through large result sets."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
             None,
-            description="Which field to use when ordering the results."
+            description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -timebin."
         )
     ) -> GenericResponseDTO[NetworkDelayAlarmsDTO]:
         """
@@ -239,9 +359,12 @@ class NetworkDelayController:
         timebin__gte, timebin__lte = validate_timebin_params(
             timebin, timebin__gte, timebin__lte)
 
-        alarms, total_count = await run_with_timeout(
+        alarms, total_count, next_cursor = await response_cache.run(
+            AtlasDelayAlarms,
             NetworkDelayController.service.get_network_delay_alarms,
             db,
+            request=request,
+            response=response,
             timebin=timebin,
             timebin_gte=timebin__gte,
             timebin_lte=timebin__lte,
@@ -257,14 +380,16 @@ class NetworkDelayController:
             deviation_lte=deviation__lte,
             page=page,
             order_by=ordering,
+            cursor=decode_cursor(cursor, ordering),
+            count_mode=count,
         )
 
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, alarms, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
         return GenericResponseDTO(
             count=total_count,
-            next=build_url(request, next_page),
+            next=build_url(request, next_page, next_cursor),
             previous=build_url(request, prev_page),
             results=alarms
         )
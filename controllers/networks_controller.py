@@ -5,7 +5,7 @@ from services.networks_service import NetworksService
 from dtos.networks_dto import NetworksDTO
 from dtos.generic_response_dto import GenericResponseDTO, build_url
 from config.database import get_db
-from utils import page_size, run_with_timeout
+from utils import page_size, run_with_timeout, next_page_number
 
 router = APIRouter(prefix="/networks", tags=["Networks"])
 
@@ -31,8 +31,10 @@ class NetworksController:
             None, description="Search for both ASN/IXPID and substring in names"),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results.")
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -number.")
     ) -> GenericResponseDTO[NetworksDTO]:
         """
         List networks referenced on IHR (see. /network_delay/locations/ for network delay locations). 
@@ -52,10 +54,11 @@ class NetworksController:
             search=search,
             page=page,
             order_by=ordering,
+            count_mode=count,
         )
 
         # Calculate pagination
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, networks, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
         return GenericResponseDTO(
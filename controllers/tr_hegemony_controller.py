@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, Query, Request
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.orm import Session
 from services.tr_hegemony_service import TRHegemonyService
+from services.response_cache import response_cache
+from models.tr_hegemony import TRHegemony
 from dtos.generic_response_dto import GenericResponseDTO, build_url
 from dtos.tr_hegemony_dto import TRHegemonyDTO
 from config.database import get_db
 from typing import Optional
 from datetime import datetime
-from utils import page_size, run_with_timeout, validate_timebin_params
+from utils import page_size, validate_timebin_params, decode_cursor, next_page_number
 
 router = APIRouter(prefix="/tr_hegemony", tags=["TR Hegemony"])
 
@@ -19,6 +21,7 @@ class TRHegemonyController:
     @router.get("/", response_model=GenericResponseDTO[TRHegemonyDTO], include_in_schema=False)
     async def get_hegemony(
         request: Request,
+        response: Response,
         db: Session = Depends(get_db),
         timebin: Optional[datetime] = Query(
             None, description="Timestamp of reported value. The computation uses four weeks of data, hence 2022-03-28T00:00 means the values are based on data from 2022-02-28T00:00 to 2022-03-28T00:00."),
@@ -48,8 +51,12 @@ class TRHegemonyController:
             None, description="Address family (IP version), values are either 4 or 6."),
         page: Optional[int] = Query(
             1, ge=1, description="A page number within the paginated result set"),
+        cursor: Optional[str] = Query(
+            None, description="Opaque position of the next results, as returned in the 'next' url. Faster than page for walking through large result sets."),
+        count: str = Query(
+            "exact", pattern="^(exact|estimated|none)$", description="How the total number of results is computed: 'exact', 'estimated' by the query planner (faster for large results), or 'none' to skip it."),
         ordering: Optional[str] = Query(
-            None, description="Which field to use when ordering the results.")
+            None, description="Which fields to use when ordering the results, separated by commas. Prefix a field with - to sort it in descending order, e.g. -timebin.")
     ) -> GenericResponseDTO[TRHegemonyDTO]:
         """
         List AS and IXP dependencies for all ASes visible in monitored traceroute data.
@@ -60,9 +67,12 @@ class TRHegemonyController:
         timebin__gte, timebin__lte = validate_timebin_params(
             timebin, timebin__gte, timebin__lte, max_days=31)
 
-        hegemony_data, total_count = await run_with_timeout(
+        hegemony_data, total_count, next_cursor = await response_cache.run(
+            TRHegemony,
             TRHegemonyController.service.get_tr_hegemony,
             db,
+            request=request,
+            response=response,
             timebin=timebin,
             timebin_gte=timebin__gte,
             timebin_lte=timebin__lte,
@@ -78,14 +88,16 @@ class TRHegemonyController:
             af=af,
             page=page,
             order_by=ordering,
+            cursor=decode_cursor(cursor, ordering),
+            count_mode=count,
         )
 
-        next_page = page + 1 if (page * page_size) < total_count else None
+        next_page = next_page_number(page, hegemony_data, total_count, count)
         prev_page = page - 1 if page > 1 else None
 
         return GenericResponseDTO(
             count=total_count,
-            next=build_url(request, next_page),
+            next=build_url(request, next_page, next_cursor),
             previous=build_url(request, prev_page),
             results=hegemony_data
         )
@@ -0,0 +1,102 @@
+from typing import Iterator, List, Any
+from datetime import date, datetime
+from fastapi import HTTPException
+import io
+
+# pyarrow is an optional dependency, only needed by the arrow and parquet formats
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+def require_pyarrow() -> None:
+    if pyarrow is None:
+        raise HTTPException(
+            status_code=406,
+            detail="The arrow and parquet formats are not available on this server."
+        )
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file collecting what the writers produce, so that it can be
+    # sent while the following batches are being written
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_type(sql_type):
+    # Arrow type of the values of a SQL type, None when it should be inferred from
+    # the values (e.g. the NullType of placeholders, or numerics returned as Decimal)
+    try:
+        python_type = sql_type.python_type
+    except (AttributeError, NotImplementedError):
+        return None
+    if python_type is datetime:
+        return pyarrow.timestamp("us", tz="UTC" if getattr(sql_type, "timezone", False) else None)
+    return {
+        bool: pyarrow.bool_(),
+        int: pyarrow.int64(),
+        float: pyarrow.float64(),
+        str: pyarrow.string(),
+        date: pyarrow.date32(),
+    }.get(python_type)
+
+
+def _record_batch(rows: List[Any], schema=None):
+    # Rows are transposed into columns, the trailing id column only used for cursors is dropped
+    keys = [key for key in rows[0]._fields if key != "id"]
+    columns = list(zip(*rows))
+    if schema is not None:
+        types = [schema.field(i).type for i in range(len(keys))]
+    else:
+        # Typing the columns from the statement keeps columns that are null in
+        # the first batch from being inferred as null for the whole export
+        sql_types = getattr(rows, "types", {})
+        types = [_arrow_type(sql_types[key]) if key in sql_types else None for key in keys]
+    arrays = [pyarrow.array(columns[i], type=types[i]) for i in range(len(keys))]
+    return pyarrow.RecordBatch.from_arrays(arrays, names=keys)
+
+
+def _new_writer(sink, schema, format: str):
+    if format == "parquet":
+        return pyarrow.parquet.ParquetWriter(sink, schema)
+    return pyarrow.ipc.new_stream(sink, schema)
+
+
+def encode_columnar(batches: Iterator[List[Any]], format: str) -> Iterator[bytes]:
+    """
+    Encode batches of result rows as an Arrow IPC stream or a Parquet file, one
+    record batch (or row group) per batch of rows. The schema is built from the
+    SQL types of the first batch (see RowBatch), or else inferred from its values.
+    """
+    sink = _ChunkSink()
+    writer = schema = None
+    for rows in batches:
+        batch = _record_batch(rows, schema)
+        if writer is None:
+            schema = batch.schema
+            writer = _new_writer(sink, schema, format)
+        writer.write_batch(batch)
+        yield sink.drain()
+
+    if writer is None:
+        # No results: only an empty schema is sent
+        writer = _new_writer(sink, pyarrow.schema([]), format)
+    writer.close()
+    yield sink.drain()
+
@@ -1,10 +1,16 @@
-from typing import TypeVar, List, Optional, Generic
-from fastapi import Request
+from typing import TypeVar, List, Optional, Generic, Mapping
+from datetime import datetime
+from fastapi import Request, Response
 from urllib.parse import urlencode, urlunparse
 from pydantic import BaseModel
 from dotenv import load_dotenv
+from config.metrics import timed, SERIALIZATION_DURATION
 import os
 import ast
+import csv
+import io
+import json
+import math
 
 try:
     load_dotenv()
@@ -19,17 +25,23 @@ T = TypeVar("T")
 
 # The generic response format returned by all endpoints
 class GenericResponseDTO(BaseModel, Generic[T]):
-    count: int
+    count: Optional[int]
     next: Optional[str]
     previous: Optional[str]
     results: List[T]
 
-# Builds the url returned by "next" and "previous" fields in the GenericResponseDTO
-def build_url(request: Request, page: Optional[int]) -> Optional[str]:
-    if page is None:
-        return None
+# Builds the url returned by "next" and "previous" fields in the GenericResponseDTO.
+# When a cursor is given the url points to the rows following that cursor instead of a page number.
+def build_url(request: Request, page: Optional[int], cursor: Optional[str] = None) -> Optional[str]:
     query_params = dict(request.query_params)
-    query_params["page"] = str(page)
+    if cursor is not None:
+        query_params.pop("page", None)
+        query_params["cursor"] = cursor
+    elif page is None or "cursor" in query_params:
+        # Cursor-based results can only be walked forward, one cursor at a time
+        return None
+    else:
+        query_params["page"] = str(page)
     scheme = request.headers.get("cf-visitor", request.url.scheme)
     if "scheme" in scheme:
         scheme = ast.literal_eval(scheme)["scheme"]
@@ -43,3 +55,67 @@ def build_url(request: Request, page: Optional[int]) -> Optional[str]:
         urlencode(query_params),
         ""
     ))
+
+
+def format_datetime(value: datetime) -> str:
+    # Same format as pydantic: a UTC offset is rendered as Z
+    text = value.isoformat()
+    return text[:-6] + "Z" if text.endswith("+00:00") else text
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return format_datetime(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _finite(results: List[dict]) -> List[dict]:
+    # NaN and infinite floats (e.g. from the database) aren't valid JSON, they're rendered as null like pydantic does
+    return [
+        {key: None if isinstance(value, float) and not math.isfinite(value) else value for key, value in result.items()}
+        for result in results
+    ]
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_json_default)
+
+
+# Renders a GenericResponseDTO body straight to JSON bytes, for endpoints whose services
+# return plain dicts. This skips the per-row validation done by the response_model, which
+# dominates the response time of large pages. The endpoint's response_model is still used
+# to document the response schema.
+def render_response(count: Optional[int], next: Optional[str], previous: Optional[str],
+                    results: List[dict], headers: Optional[Mapping[str, str]] = None) -> Response:
+    with timed(SERIALIZATION_DURATION, format="json"):
+        try:
+            body = _dumps({"count": count, "next": next, "previous": previous, "results": results})
+        except ValueError:
+            # Only pages holding non-finite floats pay for a second pass
+            body = _dumps({"count": count, "next": next, "previous": previous, "results": _finite(results)})
+        body = body.encode("utf-8")
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Encodes a batch of results as newline delimited JSON, one object per line.
+def encode_ndjson(results: List[dict]) -> bytes:
+    try:
+        lines = [_dumps(result) for result in results]
+    except ValueError:
+        lines = [_dumps(result) for result in _finite(results)]
+    return "".join(line + "\n" for line in lines).encode("utf-8")
+
+
+# Encodes a batch of results as CSV rows, preceded by the column names if header is set.
+def encode_csv(results: List[dict], header: bool = False) -> bytes:
+    if not results:
+        return b""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(results[0].keys())
+    writer.writerows(
+        [format_datetime(value) if isinstance(value, datetime) else value for value in result.values()]
+        for result in results
+    )
+    return buffer.getvalue().encode("utf-8")
@@ -0,0 +1,17 @@
+from pydantic import BaseModel, ConfigDict
+from datetime import datetime
+from typing import Optional
+
+
+class HegemonyAggregateDTO(BaseModel):
+    timebin: datetime
+    originasn: int
+    asn: int
+    hege_avg: float
+    hege_min: float
+    hege_max: float
+    af: int
+    asn_name: Optional[str] = None
+    originasn_name: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
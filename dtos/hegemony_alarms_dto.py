@@ -1,5 +1,6 @@
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
+from typing import Optional
 
 
 class HegemonyAlarmsDTO(BaseModel):
@@ -8,7 +9,7 @@ class HegemonyAlarmsDTO(BaseModel):
     asn: int
     deviation: float
     af: int
-    asn_name: str
-    originasn_name: str
+    asn_name: Optional[str] = None
+    originasn_name: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,27 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Optional, List
+
+
+class HegemonyBatchRequestDTO(BaseModel):
+    """
+    Body of POST /hegemony/batch, with the filters of GET /hegemony.
+    """
+    originasn: List[int] = Field(
+        ..., min_length=1, description="Dependent networks whose dependencies are fetched.")
+    asn: Optional[List[int]] = Field(
+        None, description="Only fetch dependencies on these transit networks.")
+    timebin: Optional[datetime] = Field(
+        None, description="Timestamp of reported value. The latest timebin is used when no timebin is given.")
+    timebin__gte: Optional[datetime] = Field(
+        None, description="Timestamp of reported value.")
+    timebin__lte: Optional[datetime] = Field(
+        None, description="Timestamp of reported value.")
+    af: Optional[int] = Field(
+        None, description="Address Family (IP version), values are either 4 or 6.")
+    hege__gte: Optional[float] = Field(
+        None, description="Minimum AS Hegemony of the dependencies.")
+    hege__lte: Optional[float] = Field(
+        None, description="Maximum AS Hegemony of the dependencies.")
+    top: Optional[int] = Field(
+        None, ge=1, description="Only fetch the top dependencies of each origin, af and timebin, by AS hegemony.")
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
+from typing import Optional
 
 
 class HegemonyCountryDTO(BaseModel):
@@ -8,7 +9,7 @@ class HegemonyCountryDTO(BaseModel):
     asn: int
     hege: float
     af: int
-    asn_name: str
+    asn_name: Optional[str] = None
     weight: float
     weightscheme: str
     transitonly: bool
@@ -0,0 +1,19 @@
+from pydantic import BaseModel, ConfigDict
+from datetime import datetime
+from typing import Optional
+
+
+class HegemonyDiffDTO(BaseModel):
+    timebin: datetime
+    previous_timebin: Optional[datetime]
+    originasn: int
+    asn: int
+    af: int
+    previous_hege: Optional[float]
+    hege: Optional[float]
+    delta: float
+    change: str
+    asn_name: Optional[str] = None
+    originasn_name: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
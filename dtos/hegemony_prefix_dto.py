@@ -1,5 +1,6 @@
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
+from typing import Optional
 
 
 class HegemonyPrefixDTO(BaseModel):
@@ -17,7 +18,7 @@ class HegemonyPrefixDTO(BaseModel):
     delegated_asn_status: str
     descr: str
     moas: bool
-    originasn_name: str
-    asn_name: str
+    originasn_name: Optional[str] = None
+    asn_name: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
+from typing import Optional
 
 
 class MetisAtlasDeploymentDTO(BaseModel):
@@ -9,6 +10,6 @@ class MetisAtlasDeploymentDTO(BaseModel):
     asn: int
     af: int
     nbsamples: int
-    asn_name: str
+    asn_name: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
+from typing import Optional
 
 
 class MetisAtlasSelectionDTO(BaseModel):
@@ -8,6 +9,6 @@ class MetisAtlasSelectionDTO(BaseModel):
     rank: int
     asn: int
     af: int
-    asn_name: str
+    asn_name: Optional[str] = None
 
     model_config = ConfigDict(from_attributes=True)
@@ -0,0 +1,20 @@
+from pydantic import BaseModel, ConfigDict
+from datetime import datetime
+
+
+class NetworkDelayAggregateDTO(BaseModel):
+    timebin: datetime
+    startpoint_type: str
+    startpoint_name: str
+    startpoint_af: int
+    endpoint_type: str
+    endpoint_name: str
+    endpoint_af: int
+    median_avg: float
+    median_min: float
+    median_max: float
+    nbprobes_avg: float
+    entropy_avg: float
+    nbsamples: int
+
+    model_config = ConfigDict(from_attributes=True)
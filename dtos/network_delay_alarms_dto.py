@@ -15,14 +15,17 @@ class NetworkDelayAlarmsDTO(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     @staticmethod
-    def from_model(atlas_delay_alarm):
+    def from_model(atlas_delay_alarm, startpoint, endpoint):
+        """
+        startpoint and endpoint are the locations (with type, name and af) of the alarm.
+        """
         return NetworkDelayAlarmsDTO(
             timebin=atlas_delay_alarm.timebin,
-            startpoint_type=atlas_delay_alarm.startpoint_relation.type,
-            startpoint_name=atlas_delay_alarm.startpoint_relation.name,
-            startpoint_af=atlas_delay_alarm.startpoint_relation.af,
-            endpoint_type=atlas_delay_alarm.endpoint_relation.type,
-            endpoint_name=atlas_delay_alarm.endpoint_relation.name,
-            endpoint_af=atlas_delay_alarm.endpoint_relation.af,
+            startpoint_type=startpoint.type,
+            startpoint_name=startpoint.name,
+            startpoint_af=startpoint.af,
+            endpoint_type=endpoint.type,
+            endpoint_name=endpoint.name,
+            endpoint_af=endpoint.af,
             deviation=atlas_delay_alarm.deviation
         )
@@ -1,16 +1,24 @@
 import importlib
 import pkgutil
-from fastapi import FastAPI, Request, Response
+from fastapi import FastAPI, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.routing import APIRoute
 from fastapi.responses import JSONResponse
 from controllers import __path__ as controllers_path
 from dotenv import load_dotenv
 import os
-from starlette.routing import Match
+from contextlib import asynccontextmanager
+from repositories.latest_timebin_registry import refresh_latest_timebins, LATEST_TIMEBIN_REFRESH_INTERVAL
+from repositories.asn_directory import refresh_asn_directory, ASN_DIRECTORY_REFRESH_INTERVAL
+from repositories.location_index import refresh_location_index, LOCATION_INDEX_REFRESH_INTERVAL
+from middlewares.compression import CompressionMiddleware
+from middlewares.metrics import MetricsMiddleware
+from middlewares.rate_limit import RateLimitMiddleware
+from config.database import POOL_TIMEOUT
+import asyncio
 import time
 import logging
-from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
 
 try:
     load_dotenv()
@@ -48,8 +56,55 @@ logger.addHandler(handler)
 logger.setLevel(logging.INFO)
 logger.propagate = False  # prevent bubbling up to the root logger
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the ASN names and the Atlas locations, and keep them and optionally the
+    # latest timebin of each table fresh in the background
+    refresh_tasks = []
+    if LATEST_TIMEBIN_REFRESH_INTERVAL > 0:
+        refresh_tasks.append(asyncio.create_task(refresh_latest_timebins()))
+    if ASN_DIRECTORY_REFRESH_INTERVAL > 0:
+        refresh_tasks.append(asyncio.create_task(refresh_asn_directory()))
+    if LOCATION_INDEX_REFRESH_INTERVAL > 0:
+        refresh_tasks.append(asyncio.create_task(refresh_location_index()))
+    yield
+    for task in refresh_tasks:
+        task.cancel()
+
+class UnknownQueryParamsError(Exception):
+    def __init__(self, unexpected: set, allowed: frozenset):
+        self.unexpected = unexpected
+        self.allowed = allowed
+
+# Query parameters accepted by each route (keyed by id as routes aren't hashable),
+# filled once all routers are registered
+ALLOWED_QUERY_PARAMS = {}
+
+# Global dependency rejecting query parameters unknown to the matched route.
+# It runs after Starlette's routing (which stores the route in the scope),
+# so the check costs a single lookup in ALLOWED_QUERY_PARAMS.
+async def reject_unknown_query_params(request: Request):
+    allowed_params = ALLOWED_QUERY_PARAMS.get(id(request.scope.get("route")))
+    if allowed_params is None:
+        return
+    extra = request.query_params.keys() - allowed_params
+    if extra:
+        raise UnknownQueryParamsError(extra, allowed_params)
+
+async def unknown_query_params_handler(request: Request, exc: UnknownQueryParamsError):
+    return JSONResponse(
+        {
+            "error": "invalid_query_params",
+            "unexpected": sorted(exc.unexpected),
+            "allowed": sorted(exc.allowed),
+        },
+        status_code=400,
+    )
+
 # The base URL of the app
 app = FastAPI(
+    lifespan=lifespan,
+    dependencies=[Depends(reject_unknown_query_params)],
     root_path="" if PROXY_PATH is None else f"/{PROXY_PATH}",
     title="IHR API",
     description=description,
@@ -58,31 +113,6 @@ app = FastAPI(
     swagger_ui_parameters={ "defaultModelsExpandDepth": -1 },
 )
 
-@app.middleware("http")
-async def reject_unknown_query_params(request: Request, call_next):
-    scope = request.scope
-    allowed_params = None
-    for route in app.routes:
-        if not isinstance(route, APIRoute):
-            continue
-        # Use Starlette's own matching — handles path params, methods, everything
-        match, _ = route.matches(scope)
-        if match == Match.FULL:
-            allowed_params = {p.name for p in route.dependant.query_params}
-            break
-    if allowed_params is not None:
-        extra = set(request.query_params.keys()) - allowed_params
-        if extra:
-            return JSONResponse(
-                {
-                    "error": "invalid_query_params",
-                    "unexpected": sorted(extra),
-                    "allowed": sorted(allowed_params),
-                },
-                status_code=400,
-            )
-    return await call_next(request)
-
 @app.middleware("http")
 async def access_logging_middleware(request: Request, call_next):
     start = time.perf_counter()
@@ -110,7 +140,17 @@ async def db_error_handler(request: Request, exc: OperationalError):
         return JSONResponse({"error": "query_timeout", "message": "The request took too long"}, status_code=504)
     return JSONResponse({"error": "database_error"}, status_code=500)
 
+# No connection was freed within POOL_TIMEOUT, e.g. because of exports or background tasks
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    return JSONResponse(
+        {"error": "server_overloaded", "message": "The server is overloaded, please retry later"},
+        status_code=503,
+        headers={"Retry-After": str(POOL_TIMEOUT)},
+    )
+
 app.add_exception_handler(OperationalError, db_error_handler)
+app.add_exception_handler(PoolTimeoutError, pool_timeout_handler)
+app.add_exception_handler(UnknownQueryParamsError, unknown_query_params_handler)
 
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
@@ -122,15 +162,27 @@ for _, module_name, _ in pkgutil.iter_modules(controllers_path):
     if hasattr(module, "router"):
         app.include_router(module.router)
 
+for route in app.routes:
+    if isinstance(route, APIRoute):
+        ALLOWED_QUERY_PARAMS[id(route)] = frozenset(p.name for p in route.dependant.query_params)
+
 origins = [
     "http://localhost:5173",
     "http://www.ihr.live",
     "https://www.ihr.live"
 ]
 
+# Inside CORS so that browsers can read the 429 responses
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
-    allow_methods=["GET"],
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
-)
\ No newline at end of file
+    expose_headers=["ETag", "Retry-After", "RateLimit-Limit", "RateLimit-Remaining", "RateLimit-Reset"],
+)
+
+app.add_middleware(CompressionMiddleware)
+# Outermost, so that the measured latency includes every other middleware
+app.add_middleware(MetricsMiddleware)
\ No newline at end of file
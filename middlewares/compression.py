@@ -0,0 +1,191 @@
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from dotenv import load_dotenv
+from typing import Optional
+import os
+import zlib
+
+# brotli and zstandard are optional, their encodings are only offered when installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    load_dotenv()
+except:
+    pass
+
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_LEVEL = int(os.getenv("COMPRESSION_BROTLI_LEVEL", 4))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
+
+# Content types that are already compressed
+UNCOMPRESSIBLE_MEDIA_TYPES = ("application/vnd.apache.parquet", "image/")
+
+
+class GzipCompressor:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        # Sync flush so that each chunk of a streamed response reaches the client
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+def _available_encodings() -> dict:
+    # Ordered by preference when the client accepts several encodings equally
+    encodings = {}
+    if zstandard is not None:
+        encodings["zstd"] = lambda: ZstdCompressor(COMPRESSION_ZSTD_LEVEL)
+    if brotli is not None:
+        encodings["br"] = lambda: BrotliCompressor(COMPRESSION_BROTLI_LEVEL)
+    encodings["gzip"] = lambda: GzipCompressor(COMPRESSION_GZIP_LEVEL)
+    return encodings
+
+
+def negotiate_encoding(accept_encoding: str, encodings) -> Optional[str]:
+    """
+    Return the encoding with the highest q-value in the Accept-Encoding header,
+    preferring the order of encodings on ties, or None if none is acceptable.
+    """
+    qvalues = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qvalues[name.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = qvalues.get(encoding, qvalues.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with zstd, brotli or gzip depending on the Accept-Encoding
+    header of the request. Streamed responses are compressed chunk by chunk, and
+    responses smaller than minimum_size are sent as is.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = _available_encodings()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self.app, encoding, self.encodings[encoding], self.minimum_size)
+        await responder(scope, receive, send)
+
+
+class _CompressionResponder:
+    def __init__(self, app: ASGIApp, encoding: str, compressor_factory, minimum_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.compressor_factory = compressor_factory
+        self.minimum_size = minimum_size
+        self.send = None
+        self.start_message = None
+        self.compressor = None
+        # Decided by the response headers, or else by the size of the first body chunks
+        self.compressing = None
+        self.buffer = b""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    async def send_compressed(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Hold the headers until the first body chunk tells if the response is large enough
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            if "content-encoding" in headers or content_type.startswith(UNCOMPRESSIBLE_MEDIA_TYPES):
+                self.compressing = False
+            return
+
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.start_message is not None:
+            if self.compressing is None:
+                # Small chunks are buffered until the response is known to be large enough
+                self.buffer += body
+                if more_body and len(self.buffer) < self.minimum_size:
+                    return
+                body, self.buffer = self.buffer, b""
+                self.compressing = len(body) >= self.minimum_size
+            if self.compressing:
+                self.compressor = self.compressor_factory()
+                headers = MutableHeaders(raw=self.start_message["headers"])
+                headers["Content-Encoding"] = self.encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                # The compressed body differs byte for byte from the identity one
+                etag = headers.get("etag")
+                if etag is not None and not etag.startswith("W/"):
+                    headers["ETag"] = f"W/{etag}"
+            await self.send(self.start_message)
+            self.start_message = None
+
+        if not self.compressing:
+            await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+            return
+
+        data = self.compressor.compress(body) if body else b""
+        if not more_body:
+            data += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
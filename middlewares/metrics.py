@@ -0,0 +1,37 @@
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config.metrics import REQUEST_DURATION, current_scope, route_label
+import time
+
+
+class MetricsMiddleware:
+    """
+    Record the duration of every request, labelled by route template, and make
+    the request scope available to the database metrics through current_scope.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = current_scope.set(scope)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope, hence the label is known by now
+            REQUEST_DURATION.labels(
+                route=route_label(), method=scope["method"], status=str(status)
+            ).observe(time.perf_counter() - start)
+            current_scope.reset(token)
@@ -0,0 +1,252 @@
+from collections import OrderedDict
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from dotenv import load_dotenv
+from typing import Optional, Tuple
+import anyio
+import math
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    load_dotenv()
+except:
+    pass
+
+# memory: buckets of each worker, sqlite: buckets shared by all workers of the host, none: disabled
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_PATH = os.getenv("RATE_LIMIT_PATH", "/tmp/ihr_rate_limit.sqlite")
+# Tokens refilled per second, and size of the bucket (largest burst of requests).
+# Rate limiting is disabled unless RATE_LIMIT_RATE is set.
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE") or 0)
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", 120))
+# Clients sending one of these keys in the X-API-Key header get RATE_LIMIT_API_KEY_FACTOR
+# times the rate and burst, and are limited by key instead of IP address
+RATE_LIMIT_API_KEYS = frozenset(k.strip() for k in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if k.strip())
+RATE_LIMIT_API_KEY_FACTOR = float(os.getenv("RATE_LIMIT_API_KEY_FACTOR", 10))
+# Requests of a client being processed at once by a worker
+RATE_LIMIT_CONCURRENCY = int(os.getenv("RATE_LIMIT_CONCURRENCY", 4))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", 100000))
+# Header set by the trusted proxy with the client address (e.g. CF-Connecting-IP or
+# X-Forwarded-For), the address of the connection being used when empty. Of an
+# X-Forwarded-For list, the address appended by the outermost of the
+# RATE_LIMIT_TRUSTED_PROXIES proxies in front of the API is used.
+RATE_LIMIT_CLIENT_IP_HEADER = os.getenv("RATE_LIMIT_CLIENT_IP_HEADER", "").lower()
+RATE_LIMIT_TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", 1))
+
+# Tokens taken by a request, by path prefix (the longest matching prefix applies).
+# Other paths cost 1 token.
+ROUTE_COSTS = {
+    "/hegemony/batch": 10,
+    "/hegemony/prefixes": 5,
+    "/hegemony/countries": 2,
+    "/hegemony/diff": 2,
+    "/hegemony/cones": 2,
+    "/network_delay/locations": 1,
+    "/network_delay": 3,
+}
+# Paths that are never limited
+EXEMPT_PATHS = ("/metrics", "/docs", "/openapi.json", "/favicon.ico")
+
+
+def route_cost(path: str) -> float:
+    cost = 1
+    matched = ""
+    for prefix, prefix_cost in ROUTE_COSTS.items():
+        if path.startswith(prefix) and len(prefix) > len(matched):
+            matched, cost = prefix, prefix_cost
+    return cost
+
+
+class MemoryBucketStore:
+    """
+    Token buckets of the clients seen by this worker, the least recently
+    seen clients being forgotten beyond maxsize.
+    """
+    # Whether take blocks on I/O and must be run outside of the event loop
+    blocking = False
+
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_CLIENTS):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> Tuple[bool, float]:
+        """
+        Take cost tokens from the bucket of key if it has enough of them, and
+        return whether they were taken and the tokens left.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class SqliteBucketStore:
+    """
+    Token buckets stored in a local SQLite file, so that all uvicorn workers
+    running on the same host share the quota of each client.
+    """
+    blocking = True
+    # Buckets full again (i.e. of clients idle long enough) are pruned every PRUNE_EVERY requests
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str):
+        self._requests = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit "
+            "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def take(self, key: str, cost: float, rate: float, burst: float) -> Tuple[bool, float]:
+        # Wall clock time, as monotonic clocks aren't shared by processes
+        now = time.time()
+        with self._lock:
+            # The write lock is taken upfront so that workers don't overdraw a bucket
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated FROM rate_limit WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (burst, now)
+                tokens = min(burst, tokens + max(now - updated, 0) * rate)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO rate_limit (key, tokens, updated) VALUES (?, ?, ?)",
+                    (key, tokens, now)
+                )
+                self._requests += 1
+                if self._requests % self.PRUNE_EVERY == 0:
+                    self._conn.execute(
+                        "DELETE FROM rate_limit WHERE tokens + (? - updated) * ? >= ?",
+                        (now, rate, burst)
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return allowed, tokens
+
+
+def _create_store():
+    if not RATE_LIMIT_RATE:
+        return None
+    if RATE_LIMIT_BACKEND == "sqlite":
+        return SqliteBucketStore(RATE_LIMIT_PATH)
+    if RATE_LIMIT_BACKEND == "memory":
+        return MemoryBucketStore()
+    return None
+
+
+def _client_ip(scope: Scope) -> Optional[str]:
+    if RATE_LIMIT_CLIENT_IP_HEADER:
+        value = Headers(scope=scope).get(RATE_LIMIT_CLIENT_IP_HEADER)
+        hops = [hop.strip() for hop in value.split(",") if hop.strip()] if value else []
+        if hops:
+            # Entries left of the trusted proxies may be forged by the client
+            return hops[-min(RATE_LIMIT_TRUSTED_PROXIES, len(hops))]
+    client = scope.get("client")
+    return client[0] if client else None
+
+
+class RateLimitMiddleware:
+    """
+    Limit the requests of each client, identified by its API key or else its IP
+    address, before any database work is done:
+    - a token bucket refilled at rate tokens per second, each request taking the
+      cost of its route (see ROUTE_COSTS)
+    - at most concurrency requests of a client processed at once
+
+    Limited requests get a 429 with a Retry-After header. Every response carries
+    the RateLimit-Limit, RateLimit-Remaining and RateLimit-Reset headers.
+    Behind a proxy, RATE_LIMIT_CLIENT_IP_HEADER should name the header carrying
+    the client address, otherwise all clients share the bucket of the proxy.
+    """
+
+    def __init__(self, app: ASGIApp, store=None, rate: float = RATE_LIMIT_RATE,
+                 burst: float = RATE_LIMIT_BURST, concurrency: int = RATE_LIMIT_CONCURRENCY):
+        self.app = app
+        self.store = _create_store() if store is None else store
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        # Requests being processed by client key
+        self._in_flight = {}
+
+    def _client(self, scope: Scope) -> Tuple[str, float]:
+        api_key = Headers(scope=scope).get("x-api-key")
+        if api_key in RATE_LIMIT_API_KEYS:
+            return f"key:{api_key}", RATE_LIMIT_API_KEY_FACTOR
+        return f"ip:{_client_ip(scope) or 'unknown'}", 1
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or self.store is None:
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"].removeprefix(scope.get("root_path", ""))
+        if path.startswith(EXEMPT_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        key, factor = self._client(scope)
+        rate, burst = self.rate * factor, self.burst * factor
+        concurrency = int(self.concurrency * factor)
+        cost = min(route_cost(path), burst)
+
+        headers = {"RateLimit-Limit": str(int(burst))}
+        if self._in_flight.get(key, 0) >= concurrency:
+            headers["RateLimit-Remaining"] = "0"
+            headers["RateLimit-Reset"] = "1"
+            await self._reject(scope, receive, send, headers, retry_after=1,
+                               message=f"Too many concurrent requests, at most {concurrency} are allowed")
+            return
+
+        if self.store.blocking:
+            allowed, tokens = await anyio.to_thread.run_sync(self.store.take, key, cost, rate, burst)
+        else:
+            allowed, tokens = self.store.take(key, cost, rate, burst)
+        headers["RateLimit-Remaining"] = str(int(tokens))
+        headers["RateLimit-Reset"] = str(math.ceil((burst - tokens) / rate))
+        if not allowed:
+            await self._reject(scope, receive, send, headers,
+                               retry_after=math.ceil((cost - tokens) / rate),
+                               message="Too many requests, please slow down")
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(headers)
+            await send(message)
+
+        self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            self._in_flight[key] -= 1
+            if not self._in_flight[key]:
+                del self._in_flight[key]
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, headers: dict,
+                      retry_after: int, message: str) -> None:
+        response = JSONResponse(
+            {"error": "rate_limited", "message": message},
+            status_code=429,
+            headers={**headers, "Retry-After": str(max(1, retry_after))},
+        )
+        await response(scope, receive, send)
@@ -36,6 +36,53 @@ class Hegemony(Base):
         },
     ]
 
+    # Downsampled series served with the resolution parameter of /hegemony,
+    # created as TimescaleDB continuous aggregates by the alembic migrations
+    __continuous_aggregates__ = [
+        {
+            'name': 'ihr_hegemony_1h',
+            'resolution': '1h',
+            'bucket_width': '1 hour',
+            'group_by': ['af', 'originasn_id', 'asn_id'],
+            'aggregates': {'hege_avg': 'avg(hege)', 'hege_min': 'min(hege)', 'hege_max': 'max(hege)'},
+            'start_offset': '1 day',
+            'end_offset': '1 hour',
+            'schedule_interval': '30 minutes',
+            'indexes': [
+                {'name': 'ihr_hegemony_1h_originasn_id_timebin_idx', 'columns': ['originasn_id', 'timebin DESC']},
+                {'name': 'ihr_hegemony_1h_asn_id_timebin_idx', 'columns': ['asn_id', 'timebin DESC']},
+            ],
+        },
+        {
+            'name': 'ihr_hegemony_1d',
+            'resolution': '1d',
+            'bucket_width': '1 day',
+            'group_by': ['af', 'originasn_id', 'asn_id'],
+            'aggregates': {'hege_avg': 'avg(hege)', 'hege_min': 'min(hege)', 'hege_max': 'max(hege)'},
+            'start_offset': '3 days',
+            'end_offset': '1 day',
+            'schedule_interval': '1 hour',
+            'indexes': [
+                {'name': 'ihr_hegemony_1d_originasn_id_timebin_idx', 'columns': ['originasn_id', 'timebin DESC']},
+                {'name': 'ihr_hegemony_1d_asn_id_timebin_idx', 'columns': ['asn_id', 'timebin DESC']},
+            ],
+        },
+        {
+            'name': 'ihr_hegemony_1w',
+            'resolution': '1w',
+            'bucket_width': '1 week',
+            'group_by': ['af', 'originasn_id', 'asn_id'],
+            'aggregates': {'hege_avg': 'avg(hege)', 'hege_min': 'min(hege)', 'hege_max': 'max(hege)'},
+            'start_offset': '3 weeks',
+            'end_offset': '1 week',
+            'schedule_interval': '1 day',
+            'indexes': [
+                {'name': 'ihr_hegemony_1w_originasn_id_timebin_idx', 'columns': ['originasn_id', 'timebin DESC']},
+                {'name': 'ihr_hegemony_1w_asn_id_timebin_idx', 'columns': ['asn_id', 'timebin DESC']},
+            ],
+        },
+    ]
+
     id = Column(BigInteger, autoincrement=True)
 
     timebin = Column(TIMESTAMP(timezone=True), nullable=False,
@@ -0,0 +1,87 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import select
+from models.asn import ASN
+from typing import Optional, List, Dict, Iterator
+from dotenv import load_dotenv
+from repositories.reference_table import ReferenceTable, refresh_reference_table, row_type
+from utils import RowBatch
+import os
+
+try:
+    load_dotenv()
+except:
+    pass
+
+# Lifetime (seconds) of the loaded ASN names, and shortest interval between reloads
+# triggered by unknown ASNs (e.g. added since the last load)
+ASN_DIRECTORY_TTL = float(os.getenv("ASN_DIRECTORY_TTL", 3600))
+ASN_DIRECTORY_MISS_RELOAD_INTERVAL = float(os.getenv("ASN_DIRECTORY_MISS_RELOAD_INTERVAL", 60))
+# Interval of the background reloads, which also load the names at startup so that
+# requests don't wait for the whole table (0 to load them on the first request)
+ASN_DIRECTORY_REFRESH_INTERVAL = float(os.getenv("ASN_DIRECTORY_REFRESH_INTERVAL", 1800))
+
+
+class AsnDirectory(ReferenceTable):
+    """
+    Process-wide map of AS numbers to names, loaded from ihr_asn.
+
+    The ASN table is small and rarely changes, so time-series repositories
+    select a NULL placeholder for name columns instead of joining it, and
+    fill them from this map once the rows are fetched.
+    """
+
+    def __init__(self, ttl: float = ASN_DIRECTORY_TTL,
+                 miss_reload_interval: float = ASN_DIRECTORY_MISS_RELOAD_INTERVAL):
+        super().__init__(ttl, miss_reload_interval)
+
+    def load(self, db: Session) -> Dict[int, str]:
+        rows = db.execute(
+            select(ASN.number, ASN.name).execution_options(query_label="asn_directory")).all()
+        return {number: name for number, name in rows}
+
+    def names(self, db: Session) -> Dict[int, str]:
+        return self.data(db)
+
+    def name(self, db: Session, number: Optional[int]) -> Optional[str]:
+        names = self.names(db)
+        if number is not None and number not in names:
+            names = self.reload_on_miss(db)
+        return names.get(number)
+
+    def resolve(self, db: Session, rows: List, **columns: str) -> List:
+        """
+        Return rows with the name columns given as keyword arguments filled with
+        the name of the ASN of another column, e.g. resolve(db, rows, asn_name="asn").
+        """
+        if not rows:
+            return rows
+        fields = rows[0]._fields
+        positions = [(fields.index(name), fields.index(number)) for name, number in columns.items()]
+        names = self.names(db)
+        if any(row[number] not in names for row in rows for _, number in positions if row[number] is not None):
+            names = self.reload_on_miss(db)
+
+        resolved_row = row_type(fields)
+        resolved = []
+        for row in rows:
+            values = list(row)
+            for name, number in positions:
+                values[name] = names.get(values[number])
+            resolved.append(resolved_row._make(values))
+        return resolved
+
+    def resolve_batches(self, db: Session, batches: Iterator[List], **columns: str) -> Iterator[List]:
+        """
+        resolve() each batch of rows yielded by batches, e.g. by stream_rows().
+        """
+        for rows in batches:
+            # Name columns are NULL placeholders in the statement
+            types = dict(getattr(rows, "types", {}), **{name: ASN.name.type for name in columns})
+            yield RowBatch(self.resolve(db, rows, **columns), types)
+
+
+asn_directory = AsnDirectory()
+
+
+async def refresh_asn_directory(interval: float = ASN_DIRECTORY_REFRESH_INTERVAL) -> None:
+    await refresh_reference_table(asn_directory, interval)
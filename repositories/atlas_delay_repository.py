@@ -1,12 +1,60 @@
-from sqlalchemy.orm import Session, aliased, contains_eager
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import select, func, cast, Row, Select, Float
 from models.atlas_delay import AtlasDelay
+from models.atlas_location import AtlasLocation
 from datetime import datetime
-from typing import List, Optional, Tuple
-from utils import page_size
+from typing import List, Optional, Tuple, Iterator
+from utils import (
+    apply_pagination, apply_ordering, apply_label_ordering, count_rows, stream_rows, fetch_page, Page,
+    page_size, RESOLUTION_BUCKETS,
+)
+from repositories.filters import Filter, FilterSpec
+from repositories.location_index import location_index
+
+# Default ordering of aggregated rows
+AGGREGATE_ORDERING = [
+    "timebin", "startpoint_type", "startpoint_name", "startpoint_af",
+    "endpoint_type", "endpoint_name", "endpoint_af",
+]
+
+# Location id columns, filtered and expanded to locations by the location index
+LOCATIONS = {"startpoint": AtlasDelay.startpoint_id, "endpoint": AtlasDelay.endpoint_id}
+LOCATION_IDS = {side: column.key for side, column in LOCATIONS.items()}
+
+# Location filters (startpoint_names, startpoint_type, ...) are resolved to ids by the
+# location index, and come first, in the order of the (startpoint_id, endpoint_id, timebin) index
+FILTERS = FilterSpec(
+    Filter("timebin", AtlasDelay.timebin),
+    Filter("timebin_gte", AtlasDelay.timebin, "gte"),
+    Filter("timebin_lte", AtlasDelay.timebin, "lte"),
+    Filter("median", AtlasDelay.median),
+    Filter("median_gte", AtlasDelay.median, "gte"),
+    Filter("median_lte", AtlasDelay.median, "lte"),
+    latest=AtlasDelay,
+)
+
+
+# Plain columns, named after NetworkDelayDTO fields once location ids are expanded,
+# are much cheaper to load than ORM entities. The id is last and only used for the cursor.
+SELECT = select(
+    AtlasDelay.timebin,
+    AtlasDelay.startpoint_id,
+    AtlasDelay.endpoint_id,
+    AtlasDelay.median,
+    AtlasDelay.nbtracks,
+    AtlasDelay.nbprobes,
+    AtlasDelay.entropy,
+    AtlasDelay.hop,
+    AtlasDelay.nbrealrtts,
+    AtlasDelay.id
+)
 
 
 class AtlasDelayRepository:
+    def _select(self, db: Session, **filters) -> Select:
+        stmt = location_index.apply(db, SELECT, filters, **LOCATIONS)
+        return FILTERS.apply(db, stmt, filters)
+
     def get_delays(
         self,
         db: Session,
@@ -25,113 +73,130 @@ class AtlasDelayRepository:
         startpoint_key: Optional[str] = None,
         endpoint_key: Optional[str] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[AtlasDelay], int]:
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[Row], Optional[int]]:
         """
         Get network delays with all possible filters.
         """
-        # Create SQLAlchemy aliases for the AtlasLocation table, used in both startpoint and endpoint relationships.
-        # This is necessary because we are joining the same table (AtlasLocation) twice in the query,
-        # and SQL requires different aliases for each instance to avoid ambiguity.
-        Startpoint = aliased(AtlasDelay.startpoint_relation.property.mapper.class_)
-        Endpoint = aliased(AtlasDelay.endpoint_relation.property.mapper.class_)
+        stmt = self._select(
+            db,
+            timebin=timebin,
+            timebin_gte=timebin_gte,
+            timebin_lte=timebin_lte,
+            startpoint_names=startpoint_names,
+            endpoint_names=endpoint_names,
+            startpoint_type=startpoint_type,
+            endpoint_type=endpoint_type,
+            startpoint_af=startpoint_af,
+            endpoint_af=endpoint_af,
+            median=median,
+            median_gte=median_gte,
+            median_lte=median_lte,
+            startpoint_key=startpoint_key,
+            endpoint_key=endpoint_key
+        )
 
-        stmt = (
-            select(AtlasDelay)
-            .join(AtlasDelay.startpoint_relation.of_type(Startpoint))
-            .join(AtlasDelay.endpoint_relation.of_type(Endpoint))
-            .options(
-                contains_eager(AtlasDelay.startpoint_relation.of_type(Startpoint)),
-                contains_eager(AtlasDelay.endpoint_relation.of_type(Endpoint))
+        total_count = count_rows(db, stmt, count_mode)
+
+        # Apply ordering and pagination
+        stmt = apply_pagination(stmt, AtlasDelay, page, order_by, cursor)
+        rows = fetch_page(db.execute(stmt))
+        results = Page(location_index.expand(db, rows, **LOCATION_IDS), rows.has_more)
+
+        return results, total_count
+
+    def stream_all(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Yield all rows matching filters (the filters of get_delays) in batches read from a server-side cursor.
+        """
+        stmt = apply_ordering(self._select(db, **filters), AtlasDelay, order_by)
+        return location_index.expand_batches(db, stream_rows(db, stmt), **LOCATION_IDS)
+
+    def _select_aggregates(self, db: Session, resolution: str, **filters) -> Select:
+        """
+        Bucket the delays matching filters (the filters of get_delays) with time_bucket,
+        aggregating median, nbprobes and entropy per pair of locations and bucket.
+        """
+        delays = self._select(db, **filters).subquery()
+        # The same expression is selected and grouped by
+        bucket = func.time_bucket(
+            RESOLUTION_BUCKETS[resolution], delays.c.timebin, type_=AtlasDelay.timebin.type
+        ).label("timebin")
+        aggregates = (
+            select(
+                bucket,
+                delays.c.startpoint_id,
+                delays.c.endpoint_id,
+                func.avg(delays.c.median).label("median_avg"),
+                func.min(delays.c.median).label("median_min"),
+                func.max(delays.c.median).label("median_max"),
+                # avg() of integers is numeric, which would be loaded as Decimal
+                cast(func.avg(delays.c.nbprobes), Float).label("nbprobes_avg"),
+                func.avg(delays.c.entropy).label("entropy_avg"),
+                func.count().label("nbsamples")
             )
+            .group_by(bucket, delays.c.startpoint_id, delays.c.endpoint_id)
+            .subquery()
         )
 
-        # If no time filters specified, get rows with max timebin
-        if not timebin and not timebin_gte and not timebin_lte:
-            max_timebin = db.scalar(select(func.max(AtlasDelay.timebin)))
-            stmt = stmt.where(AtlasDelay.timebin == max_timebin)
-
-        # Apply timebin filters
-        if timebin:
-            stmt = stmt.where(AtlasDelay.timebin == timebin)
-        if timebin_gte:
-            stmt = stmt.where(AtlasDelay.timebin >= timebin_gte)
-        if timebin_lte:
-            stmt = stmt.where(AtlasDelay.timebin <= timebin_lte)
-
-        if startpoint_names:
-            names = startpoint_names.split('|')
-            stmt = stmt.where(Startpoint.name.in_(names))
-        if startpoint_type:
-            stmt = stmt.where(Startpoint.type == startpoint_type)
-        if startpoint_af:
-            stmt = stmt.where(Startpoint.af == startpoint_af)
-        if startpoint_key:
-            startpoint_conditions = []
-            for key in startpoint_key.split('|'):
-                if len(key) >= 2:
-                    key_type = key[:2]
-                    key_af = int(key[2]) if key[2].isdigit() else None
-                    key_name = key[3:] if len(key) > 3 else None
-
-                    conditions = []
-                    if key_type:
-                        conditions.append(Startpoint.type == key_type)
-                    if key_af:
-                        conditions.append(Startpoint.af == key_af)
-                    if key_name:
-                        conditions.append(Startpoint.name == key_name)
-
-                    if conditions:
-                        startpoint_conditions.append(and_(*conditions))
-
-            if startpoint_conditions:
-                stmt = stmt.where(or_(*startpoint_conditions))
-
-        if endpoint_names:
-            names = endpoint_names.split('|')
-            stmt = stmt.where(Endpoint.name.in_(names))
-        if endpoint_type:
-            stmt = stmt.where(Endpoint.type == endpoint_type)
-        if endpoint_af:
-            stmt = stmt.where(Endpoint.af == endpoint_af)
-        if endpoint_key:
-            endpoint_conditions = []
-            for key in endpoint_key.split('|'):
-                if len(key) >= 2:
-                    key_type = key[:2]
-                    key_af = int(key[2]) if key[2].isdigit() else None
-                    key_name = key[3:] if len(key) > 3 else None
-
-                    conditions = []
-                    if key_type:
-                        conditions.append(Endpoint.type == key_type)
-                    if key_af:
-                        conditions.append(Endpoint.af == key_af)
-                    if key_name:
-                        conditions.append(Endpoint.name == key_name)
-
-                    if conditions:
-                        endpoint_conditions.append(and_(*conditions))
-
-            if endpoint_conditions:
-                stmt = stmt.where(or_(*endpoint_conditions))
-
-        if median:
-            stmt = stmt.where(AtlasDelay.median == median)
-        if median_gte:
-            stmt = stmt.where(AtlasDelay.median >= median_gte)
-        if median_lte:
-            stmt = stmt.where(AtlasDelay.median <= median_lte)
-
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
-
-        # Apply ordering
-        if order_by and hasattr(AtlasDelay, order_by):
-            stmt = stmt.order_by(getattr(AtlasDelay, order_by))
-
-        # Apply pagination
-        offset = (page - 1) * page_size
-        results = db.scalars(stmt.offset(offset).limit(page_size)).unique().all()
+        # Columns named after NetworkDelayAggregateDTO fields. Locations are joined
+        # once aggregated, so that results can be ordered by them. Aliases are created
+        # here as aliased() configures the mappers of every model, which must be imported.
+        Startpoint = aliased(AtlasLocation)
+        Endpoint = aliased(AtlasLocation)
+        return (
+            select(
+                aggregates.c.timebin,
+                Startpoint.type.label("startpoint_type"),
+                Startpoint.name.label("startpoint_name"),
+                Startpoint.af.label("startpoint_af"),
+                Endpoint.type.label("endpoint_type"),
+                Endpoint.name.label("endpoint_name"),
+                Endpoint.af.label("endpoint_af"),
+                aggregates.c.median_avg,
+                aggregates.c.median_min,
+                aggregates.c.median_max,
+                aggregates.c.nbprobes_avg,
+                aggregates.c.entropy_avg,
+                aggregates.c.nbsamples
+            )
+            .join(Startpoint, Startpoint.id == aggregates.c.startpoint_id)
+            .join(Endpoint, Endpoint.id == aggregates.c.endpoint_id)
+        )
+
+    def get_aggregates(
+        self,
+        db: Session,
+        resolution: str,
+        page: int = 1,
+        order_by: Optional[str] = None,
+        count_mode: str = "exact",
+        **filters
+    ) -> Tuple[List[Row], Optional[int]]:
+        """
+        Get a page of network delays aggregated in buckets of the given resolution.
+        """
+        stmt = self._select_aggregates(db, resolution, **filters)
+
+        total_count = count_rows(db, stmt, count_mode)
+
+        stmt = (
+            apply_label_ordering(stmt, order_by, AGGREGATE_ORDERING)
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+            .execution_options(query_label="page")
+        )
+        results = db.execute(stmt).all()
 
         return results, total_count
+
+    def stream_aggregates(self, db: Session, resolution: str, order_by: Optional[str] = None,
+                          **filters) -> Iterator[List[Row]]:
+        """
+        Yield all network delays aggregated in buckets of the given resolution in batches.
+        """
+        stmt = apply_label_ordering(
+            self._select_aggregates(db, resolution, **filters), order_by, AGGREGATE_ORDERING)
+        return stream_rows(db, stmt)
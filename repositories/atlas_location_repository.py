@@ -2,7 +2,15 @@ from sqlalchemy.orm import Session
 from sqlalchemy import select, func
 from models.atlas_location import AtlasLocation
 from typing import Optional, List, Tuple
-from utils import page_size
+from utils import page_size, apply_ordering, count_rows
+from repositories.filters import Filter, FilterSpec
+
+
+FILTERS = FilterSpec(
+    Filter("name", AtlasLocation.name, "icontains"),
+    Filter("type", AtlasLocation.type),
+    Filter("af", AtlasLocation.af),
+)
 
 
 class AtlasLocationRepository:
@@ -13,23 +21,18 @@ class AtlasLocationRepository:
         type: Optional[str] = None,
         af: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[AtlasLocation], int]:
+        order_by: Optional[str] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[AtlasLocation], Optional[int]]:
         stmt = select(AtlasLocation)
 
         # Apply filters
-        if name:
-            stmt = stmt.where(AtlasLocation.name.ilike(f"%{name}%"))
-        if type:
-            stmt = stmt.where(AtlasLocation.type == type)
-        if af:
-            stmt = stmt.where(AtlasLocation.af == af)
+        stmt = FILTERS.apply(db, stmt, dict(name=name, type=type, af=af))
 
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
+        total_count = count_rows(db, stmt, count_mode)
 
         # Apply ordering
-        if order_by and hasattr(AtlasLocation, order_by):
-            stmt = stmt.order_by(getattr(AtlasLocation, order_by))
+        stmt = apply_ordering(stmt, AtlasLocation, order_by)
 
         # Apply pagination
         offset = (page - 1) * page_size
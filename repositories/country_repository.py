@@ -1,8 +1,15 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func, asc
+from sqlalchemy import select, func
 from models.country import Country
 from typing import Optional, List, Tuple
-from utils import page_size
+from utils import page_size, apply_ordering, count_rows
+from repositories.filters import Filter, FilterSpec
+
+
+FILTERS = FilterSpec(
+    Filter("code", Country.code),
+    Filter("name", Country.name, "icontains"),
+)
 
 
 class CountryRepository:
@@ -13,7 +20,8 @@ class CountryRepository:
         name: Optional[str] = None,
         page: int = 1,
         order_by: Optional[str] = None,
-    ) -> Tuple[List[Country], int]:
+        count_mode: str = "exact"
+    ) -> Tuple[List[Country], Optional[int]]:
         """
         Retrieves countries with pagination and ordering at database level.
         Returns: Tuple[List[Country], total_count]
@@ -22,17 +30,13 @@ class CountryRepository:
         stmt = select(Country)
 
         # Apply filters if provided
-        if code:
-            stmt = stmt.where(Country.code == code)
-        if name:
-            stmt = stmt.where(Country.name.ilike(f"%{name}%"))
+        stmt = FILTERS.apply(db, stmt, dict(code=code, name=name))
 
         # Executes getting total count of countries
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
+        total_count = count_rows(db, stmt, count_mode)
 
-        # Apply ordering if specified
-        if order_by and hasattr(Country, order_by):
-            stmt = stmt.order_by(asc(getattr(Country, order_by)))
+        # Apply ordering
+        stmt = apply_ordering(stmt, Country, order_by)
 
         # Calculate offset based on page number and size
         offset = (page - 1) * page_size
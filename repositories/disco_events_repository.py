@@ -3,7 +3,30 @@ from sqlalchemy import select, func
 from models.disco_events import DiscoEvents
 from datetime import datetime
 from typing import List, Optional, Tuple
-from utils import page_size
+from utils import page_size, apply_ordering, count_rows
+from repositories.filters import Filter, FilterSpec
+
+
+FILTERS = FilterSpec(
+    Filter("streamname", DiscoEvents.streamname),
+    Filter("streamtype", DiscoEvents.streamtype),
+    Filter("starttime", DiscoEvents.starttime),
+    Filter("starttime_gte", DiscoEvents.starttime, "gte"),
+    Filter("starttime_lte", DiscoEvents.starttime, "lte"),
+    Filter("endtime", DiscoEvents.endtime),
+    Filter("endtime_gte", DiscoEvents.endtime, "gte"),
+    Filter("endtime_lte", DiscoEvents.endtime, "lte"),
+    Filter("avglevel", DiscoEvents.avglevel),
+    Filter("avglevel_gte", DiscoEvents.avglevel, "gte"),
+    Filter("avglevel_lte", DiscoEvents.avglevel, "lte"),
+    Filter("nbdiscoprobes", DiscoEvents.nbdiscoprobes),
+    Filter("nbdiscoprobes_gte", DiscoEvents.nbdiscoprobes, "gte"),
+    Filter("nbdiscoprobes_lte", DiscoEvents.nbdiscoprobes, "lte"),
+    Filter("totalprobes", DiscoEvents.totalprobes),
+    Filter("totalprobes_gte", DiscoEvents.totalprobes, "gte"),
+    Filter("totalprobes_lte", DiscoEvents.totalprobes, "lte"),
+    Filter("ongoing", DiscoEvents.ongoing),
+)
 
 
 class DiscoEventsRepository:
@@ -30,63 +53,39 @@ class DiscoEventsRepository:
         ongoing: Optional[str] = None,
         include_probe_details: bool = False,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[DiscoEvents], int]:
+        order_by: Optional[str] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[DiscoEvents], Optional[int]]:
 
         # Build conditions as a list so the count query can reuse them without
         # the joinedload option (which would expand rows and give a wrong count).
-        conditions = []
-
-        if streamname:
-            conditions.append(DiscoEvents.streamname == streamname)
-        if streamtype:
-            conditions.append(DiscoEvents.streamtype == streamtype)
-
-        if starttime:
-            conditions.append(DiscoEvents.starttime == starttime)
-        if starttime_gte:
-            conditions.append(DiscoEvents.starttime >= starttime_gte)
-        if starttime_lte:
-            conditions.append(DiscoEvents.starttime <= starttime_lte)
-
-        if endtime:
-            conditions.append(DiscoEvents.endtime == endtime)
-        if endtime_gte:
-            conditions.append(DiscoEvents.endtime >= endtime_gte)
-        if endtime_lte:
-            conditions.append(DiscoEvents.endtime <= endtime_lte)
-
-        if avglevel:
-            conditions.append(DiscoEvents.avglevel == avglevel)
-        if avglevel_gte:
-            conditions.append(DiscoEvents.avglevel >= avglevel_gte)
-        if avglevel_lte:
-            conditions.append(DiscoEvents.avglevel <= avglevel_lte)
-
-        if nbdiscoprobes:
-            conditions.append(DiscoEvents.nbdiscoprobes == nbdiscoprobes)
-        if nbdiscoprobes_gte:
-            conditions.append(DiscoEvents.nbdiscoprobes >= nbdiscoprobes_gte)
-        if nbdiscoprobes_lte:
-            conditions.append(DiscoEvents.nbdiscoprobes <= nbdiscoprobes_lte)
-
-        if totalprobes:
-            conditions.append(DiscoEvents.totalprobes == totalprobes)
-        if totalprobes_gte:
-            conditions.append(DiscoEvents.totalprobes >= totalprobes_gte)
-        if totalprobes_lte:
-            conditions.append(DiscoEvents.totalprobes <= totalprobes_lte)
-
-        if ongoing:
-            conditions.append(DiscoEvents.ongoing == ongoing)
+        conditions = FILTERS.predicates(dict(
+            streamname=streamname,
+            streamtype=streamtype,
+            starttime=starttime,
+            starttime_gte=starttime_gte,
+            starttime_lte=starttime_lte,
+            endtime=endtime,
+            endtime_gte=endtime_gte,
+            endtime_lte=endtime_lte,
+            avglevel=avglevel,
+            avglevel_gte=avglevel_gte,
+            avglevel_lte=avglevel_lte,
+            nbdiscoprobes=nbdiscoprobes,
+            nbdiscoprobes_gte=nbdiscoprobes_gte,
+            nbdiscoprobes_lte=nbdiscoprobes_lte,
+            totalprobes=totalprobes,
+            totalprobes_gte=totalprobes_gte,
+            totalprobes_lte=totalprobes_lte,
+            ongoing=ongoing
+        ))
 
-        total_count = db.scalar(select(func.count(DiscoEvents.id)).where(*conditions))
+        total_count = count_rows(db, select(DiscoEvents.id).where(*conditions), count_mode)
 
         load_opt = joinedload(DiscoEvents.probes) if include_probe_details else noload(DiscoEvents.probes)
         stmt = select(DiscoEvents).where(*conditions).options(load_opt)
 
-        if order_by and hasattr(DiscoEvents, order_by):
-            stmt = stmt.order_by(getattr(DiscoEvents, order_by))
+        stmt = apply_ordering(stmt, DiscoEvents, order_by)
 
         offset = (page - 1) * page_size
         results = db.scalars(stmt.offset(offset).limit(page_size)).unique().all()
@@ -0,0 +1,150 @@
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, List, Optional
+from sqlalchemy import Select, any_, literal
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import Session
+from repositories.latest_timebin_registry import latest_timebin_registry
+import json
+
+
+def is_absent(value: Any) -> bool:
+    """
+    Missing parameters, empty strings and empty lists don't filter anything,
+    while 0 and False are values like any other.
+    """
+    return value is None or (isinstance(value, (str, list, tuple, set)) and len(value) == 0)
+
+
+def normalize_value(value: Any, ordered: bool = False) -> Any:
+    """
+    Canonical form of a parameter value: datetimes in UTC, lists sorted and
+    without duplicates unless ordered (e.g. a cursor, made of ordered values).
+    """
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+    if isinstance(value, (list, tuple, set)):
+        values = [normalize_value(v) for v in value]
+        return values if ordered else sorted(dict.fromkeys(values))
+    return value
+
+
+def canonical_key(name: str, params: dict, ordered: Iterable[str] = ("cursor",)) -> str:
+    """
+    Key identifying a call of name with params, identical for equivalent parameters
+    (absent values dropped, values normalized, keys sorted).
+    """
+    normalized = {
+        key: normalize_value(value, ordered=key in ordered)
+        for key, value in params.items() if not is_absent(value)
+    }
+    return name + json.dumps(normalized, sort_keys=True, default=str, separators=(",", ":"))
+
+
+# Longer IN lists are sent as a single array parameter
+ARRAY_THRESHOLD = 64
+
+
+def in_values(column, values: List):
+    """
+    Predicate of column being one of values.
+    """
+    # A single value is compared for equality, which the planner estimates better
+    if len(values) == 1:
+        return column == values[0]
+    # PostgreSQL plans IN lists as = ANY(array), sending the array as one
+    # parameter keeps the statement the same whatever the number of values
+    if len(values) > ARRAY_THRESHOLD:
+        return column == any_(literal(values, ARRAY(column.type)))
+    # IN lists are rendered with one parameter per value. Padding them to a power of
+    # two (repeating the last value) makes lists of similar lengths share the same SQL,
+    # hence the same prepared statement and plan.
+    size = 1 << (len(values) - 1).bit_length()
+    return column.in_(values + values[-1:] * (size - len(values)))
+
+
+class Filter:
+    """
+    How a query parameter is compiled to a SQL predicate: either an operator
+    applied to column, or a custom predicate function of the value (returning
+    None when the value doesn't filter anything).
+
+    Values of the "in" operator are lists, or strings split on split.
+    """
+    OPERATORS = {
+        "eq": lambda column, value: column == value,
+        "gte": lambda column, value: column >= value,
+        "lte": lambda column, value: column <= value,
+        "in": in_values,
+        "contains": lambda column, value: column.contains(value),
+        "icontains": lambda column, value: column.ilike(f"%{value}%"),
+    }
+
+    def __init__(self, param: str, column=None, op: str = "eq",
+                 predicate: Optional[Callable] = None, split: Optional[str] = None):
+        if predicate is None and op not in self.OPERATORS:
+            raise ValueError(f"Unknown filter operator: {op}")
+        self.param = param
+        self.column = column
+        self.op = op
+        self.predicate = predicate
+        self.split = split
+
+    def compile(self, value: Any):
+        if self.split is not None and isinstance(value, str):
+            value = value.split(self.split)
+        if self.predicate is not None:
+            return self.predicate(value)
+        if self.op == "in":
+            value = normalize_value(value)
+        return self.OPERATORS[self.op](self.column, value)
+
+
+class FilterSpec:
+    """
+    The filters accepted by a repository, compiled to SQL predicates.
+
+    Predicates are always emitted in the order the filters are declared in,
+    whatever the order of the parameters, and list values are sorted: equivalent
+    requests produce the same SQL, so they share cached counts and statements.
+    Filters should therefore be declared in the order of the columns of the
+    main index, equality filters first.
+
+    If latest is a time-series model, rows of its latest timebin are selected
+    when none of the time_params is given.
+    """
+
+    def __init__(self, *filters: Filter, latest=None,
+                 time_params: Iterable[str] = ("timebin", "timebin_gte", "timebin_lte")):
+        self.filters = filters
+        self.latest = latest
+        self.time_params = tuple(time_params)
+        self.params = frozenset(f.param for f in filters)
+
+    def predicates(self, params: dict) -> List:
+        unknown = params.keys() - self.params
+        if unknown:
+            raise TypeError(f"Unknown filters: {', '.join(sorted(unknown))}")
+
+        predicates = []
+        for f in self.filters:
+            value = params.get(f.param)
+            if is_absent(value):
+                continue
+            predicate = f.compile(value)
+            if predicate is not None:
+                predicates.append(predicate)
+        return predicates
+
+    def apply(self, db: Session, stmt: Select, params: dict) -> Select:
+        """
+        Add the predicates of params to stmt. Statements are immutable, so stmt
+        can be built once at import time and shared by all requests.
+        """
+        if self.latest is not None and all(is_absent(params.get(p)) for p in self.time_params):
+            max_timebin = latest_timebin_registry.get(db, self.latest)
+            stmt = stmt.where(self.latest.timebin == max_timebin)
+        predicates = self.predicates(params)
+        return stmt.where(*predicates) if predicates else stmt
+
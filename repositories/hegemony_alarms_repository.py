@@ -1,9 +1,26 @@
 from datetime import datetime
-from sqlalchemy.orm import Session, aliased, contains_eager
-from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from sqlalchemy import select
 from models.hegemony_alarms import HegemonyAlarms
 from typing import Optional, List, Tuple
-from utils import page_size
+from utils import apply_pagination, fetch_page, count_rows
+from repositories.filters import Filter, FilterSpec
+
+
+FILTERS = FilterSpec(
+    Filter("asn_ids", HegemonyAlarms.asn, "in"),
+    Filter("originasn_ids", HegemonyAlarms.originasn, "in"),
+    Filter("timebin_gte", HegemonyAlarms.timebin, "gte"),
+    Filter("timebin_lte", HegemonyAlarms.timebin, "lte"),
+    Filter("af", HegemonyAlarms.af),
+    Filter("deviation_gte", HegemonyAlarms.deviation, "gte"),
+    Filter("deviation_lte", HegemonyAlarms.deviation, "lte"),
+    latest=HegemonyAlarms,
+)
+
+
+# ASN names are filled by the service from the ASN directory
+SELECT = select(HegemonyAlarms)
 
 
 class HegemonyAlarmsRepository:
@@ -18,50 +35,24 @@ class HegemonyAlarmsRepository:
         deviation_gte: Optional[float] = None,
         deviation_lte: Optional[float] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[HegemonyAlarms], int]:
-        ASN = aliased(HegemonyAlarms.asn_relation.property.mapper.class_)
-        OriginASN = aliased(HegemonyAlarms.originasn_relation.property.mapper.class_)
-
-        stmt = (
-            select(HegemonyAlarms)
-            .join(HegemonyAlarms.asn_relation.of_type(ASN))
-            .join(HegemonyAlarms.originasn_relation.of_type(OriginASN))
-            .options(
-                contains_eager(HegemonyAlarms.asn_relation.of_type(ASN)),
-                contains_eager(HegemonyAlarms.originasn_relation.of_type(OriginASN))
-            )
-        )
-
-        # If no time filters specified, get rows with max timebin
-        if not timebin_gte and not timebin_lte:
-            max_timebin = db.scalar(select(func.max(HegemonyAlarms.timebin)))
-            stmt = stmt.where(HegemonyAlarms.timebin == max_timebin)
-
-        # Apply filters
-        if timebin_gte:
-            stmt = stmt.where(HegemonyAlarms.timebin >= timebin_gte)
-        if timebin_lte:
-            stmt = stmt.where(HegemonyAlarms.timebin <= timebin_lte)
-        if asn_ids:
-            stmt = stmt.where(HegemonyAlarms.asn.in_(asn_ids))
-        if originasn_ids:
-            stmt = stmt.where(HegemonyAlarms.originasn.in_(originasn_ids))
-        if af is not None:
-            stmt = stmt.where(HegemonyAlarms.af == af)
-        if deviation_gte:
-            stmt = stmt.where(HegemonyAlarms.deviation >= deviation_gte)
-        if deviation_lte:
-            stmt = stmt.where(HegemonyAlarms.deviation <= deviation_lte)
-
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
-
-        # Apply ordering
-        if order_by and hasattr(HegemonyAlarms, order_by):
-            stmt = stmt.order_by(getattr(HegemonyAlarms, order_by))
-
-        # Apply pagination
-        offset = (page - 1) * page_size
-        results = db.scalars(stmt.offset(offset).limit(page_size)).unique().all()
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[HegemonyAlarms], Optional[int]]:
+        stmt = FILTERS.apply(db, SELECT, dict(
+            timebin_gte=timebin_gte,
+            timebin_lte=timebin_lte,
+            asn_ids=asn_ids,
+            originasn_ids=originasn_ids,
+            af=af,
+            deviation_gte=deviation_gte,
+            deviation_lte=deviation_lte
+        ))
+
+        total_count = count_rows(db, stmt, count_mode)
+
+        # Apply ordering and pagination
+        stmt = apply_pagination(stmt, HegemonyAlarms, page, order_by, cursor)
+        results = fetch_page(db.scalars(stmt).unique())
 
         return results, total_count
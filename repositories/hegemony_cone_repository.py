@@ -1,12 +1,36 @@
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import select, func
+from sqlalchemy import select, Row, Select
 from models.hegemony_cone import HegemonyCone
-from typing import Optional, List, Tuple
-from utils import page_size
+from typing import Optional, List, Tuple, Iterator
+from utils import apply_pagination, fetch_page, apply_ordering, count_rows, stream_rows
+from repositories.filters import Filter, FilterSpec
+
+
+FILTERS = FilterSpec(
+    Filter("asn_ids", HegemonyCone.asn, "in"),
+    Filter("timebin_gte", HegemonyCone.timebin, "gte"),
+    Filter("timebin_lte", HegemonyCone.timebin, "lte"),
+    Filter("af", HegemonyCone.af),
+    latest=HegemonyCone,
+)
+
+
+# Plain columns, named after HegemonyConeDTO fields, are much cheaper to
+# load than ORM entities. The id is last and only used for the cursor.
+SELECT = select(
+    HegemonyCone.timebin,
+    HegemonyCone.asn,
+    HegemonyCone.conesize,
+    HegemonyCone.af,
+    HegemonyCone.id
+)
 
 
 class HegemonyConeRepository:
+    def _select(self, db: Session, **filters) -> Select:
+        return FILTERS.apply(db, SELECT, filters)
+
     def get_all(
         self,
         db: Session,
@@ -15,35 +39,29 @@ class HegemonyConeRepository:
         asn_ids: Optional[List[int]] = None,
         af: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[HegemonyCone], int]:
-        stmt = select(HegemonyCone)
-
-        # If no time filters specified, get rows with max timebin
-        if not timebin_gte and not timebin_lte:
-            max_timebin = db.scalar(select(func.max(HegemonyCone.timebin)))
-            stmt = stmt.where(HegemonyCone.timebin == max_timebin)
-
-        # Apply filters
-        if timebin_gte:
-            stmt = stmt.where(HegemonyCone.timebin >= timebin_gte)
-        if timebin_lte:
-            stmt = stmt.where(HegemonyCone.timebin <= timebin_lte)
-        if asn_ids:
-            stmt = stmt.where(HegemonyCone.asn.in_(asn_ids))
-        if af:
-            stmt = stmt.where(HegemonyCone.af == af)
-
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
-
-        # Apply ordering
-        if order_by and hasattr(HegemonyCone, order_by):
-            stmt = stmt.order_by(getattr(HegemonyCone, order_by))
-        else:
-            stmt = stmt.order_by(HegemonyCone.timebin)
-
-        # Apply pagination
-        offset = (page - 1) * page_size
-        results = db.scalars(stmt.offset(offset).limit(page_size)).all()
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[Row], Optional[int]]:
+        stmt = self._select(
+            db,
+            timebin_gte=timebin_gte,
+            timebin_lte=timebin_lte,
+            asn_ids=asn_ids,
+            af=af
+        )
+
+        total_count = count_rows(db, stmt, count_mode)
+
+        # Apply ordering and pagination
+        stmt = apply_pagination(stmt, HegemonyCone, page, order_by, cursor)
+        results = fetch_page(db.execute(stmt))
 
         return results, total_count
+
+    def stream_all(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Yield all rows matching filters (the filters of get_all) in batches read from a server-side cursor.
+        """
+        stmt = apply_ordering(self._select(db, **filters), HegemonyCone, order_by)
+        return stream_rows(db, stmt)
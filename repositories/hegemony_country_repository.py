@@ -1,12 +1,50 @@
 from datetime import datetime
-from sqlalchemy.orm import Session, contains_eager, aliased
-from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from sqlalchemy import select, null, Row, Select
 from models.hegemony_country import HegemonyCountry
-from typing import Optional, List, Tuple
-from utils import page_size
+from typing import Optional, List, Tuple, Iterator
+from utils import apply_pagination, fetch_page, Page, apply_ordering, count_rows, stream_rows
+from repositories.asn_directory import asn_directory
+from repositories.filters import Filter, FilterSpec
+
+
+FILTERS = FilterSpec(
+    Filter("countries", HegemonyCountry.country, "in"),
+    Filter("asn_ids", HegemonyCountry.asn, "in"),
+    Filter("timebin_gte", HegemonyCountry.timebin, "gte"),
+    Filter("timebin_lte", HegemonyCountry.timebin, "lte"),
+    Filter("af", HegemonyCountry.af),
+    Filter("weightscheme", HegemonyCountry.weightscheme),
+    Filter("transitonly", HegemonyCountry.transitonly),
+    Filter("hege", HegemonyCountry.hege),
+    Filter("hege_gte", HegemonyCountry.hege, "gte"),
+    Filter("hege_lte", HegemonyCountry.hege, "lte"),
+    latest=HegemonyCountry,
+)
+
+# asn_name is selected as NULL and filled from the ASN directory
+NAMES = {"asn_name": "asn"}
+
+# Plain columns, named after HegemonyCountryDTO fields, are much cheaper to
+# load than ORM entities. The id is last and only used for the cursor.
+SELECT = select(
+    HegemonyCountry.timebin,
+    HegemonyCountry.country,
+    HegemonyCountry.asn,
+    HegemonyCountry.hege,
+    HegemonyCountry.af,
+    null().label("asn_name"),
+    HegemonyCountry.weight,
+    HegemonyCountry.weightscheme,
+    HegemonyCountry.transitonly,
+    HegemonyCountry.id
+)
 
 
 class HegemonyCountryRepository:
+    def _select(self, db: Session, **filters) -> Select:
+        return FILTERS.apply(db, SELECT, filters)
+
     def get_all(
         self,
         db: Session,
@@ -21,51 +59,36 @@ class HegemonyCountryRepository:
         hege_gte: Optional[float] = None,
         hege_lte: Optional[float] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[HegemonyCountry], int]:
-        ASN = aliased(HegemonyCountry.asn_relation.property.mapper.class_)
-
-        stmt = (
-            select(HegemonyCountry)
-            .join(HegemonyCountry.asn_relation.of_type(ASN))
-            .options(contains_eager(HegemonyCountry.asn_relation.of_type(ASN)))
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[Row], Optional[int]]:
+        stmt = self._select(
+            db,
+            timebin_gte=timebin_gte,
+            timebin_lte=timebin_lte,
+            asn_ids=asn_ids,
+            countries=countries,
+            af=af,
+            weightscheme=weightscheme,
+            transitonly=transitonly,
+            hege=hege,
+            hege_gte=hege_gte,
+            hege_lte=hege_lte
         )
 
-        # If no time filters specified, get rows with max timebin
-        if not timebin_gte and not timebin_lte:
-            max_timebin = db.scalar(select(func.max(HegemonyCountry.timebin)))
-            stmt = stmt.where(HegemonyCountry.timebin == max_timebin)
-
-        # Apply filters
-        if timebin_gte:
-            stmt = stmt.where(HegemonyCountry.timebin >= timebin_gte)
-        if timebin_lte:
-            stmt = stmt.where(HegemonyCountry.timebin <= timebin_lte)
-        if asn_ids:
-            stmt = stmt.where(HegemonyCountry.asn.in_(asn_ids))
-        if countries:
-            stmt = stmt.where(HegemonyCountry.country.in_(countries))
-        if af is not None:
-            stmt = stmt.where(HegemonyCountry.af == af)
-        if weightscheme is not None:
-            stmt = stmt.where(HegemonyCountry.weightscheme == weightscheme)
-        if transitonly is not None:
-            stmt = stmt.where(HegemonyCountry.transitonly == transitonly)
-        if hege is not None:
-            stmt = stmt.where(HegemonyCountry.hege == hege)
-        if hege_gte is not None:
-            stmt = stmt.where(HegemonyCountry.hege >= hege_gte)
-        if hege_lte is not None:
-            stmt = stmt.where(HegemonyCountry.hege <= hege_lte)
-
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
+        total_count = count_rows(db, stmt, count_mode)
 
-        # Apply ordering
-        if order_by and hasattr(HegemonyCountry, order_by):
-            stmt = stmt.order_by(getattr(HegemonyCountry, order_by))
-
-        # Apply pagination
-        offset = (page - 1) * page_size
-        results = db.scalars(stmt.offset(offset).limit(page_size)).unique().all()
+        # Apply ordering and pagination
+        stmt = apply_pagination(stmt, HegemonyCountry, page, order_by, cursor)
+        rows = fetch_page(db.execute(stmt))
+        results = Page(asn_directory.resolve(db, rows, **NAMES), rows.has_more)
 
         return results, total_count
+
+    def stream_all(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Yield all rows matching filters (the filters of get_all) in batches read from a server-side cursor.
+        """
+        stmt = apply_ordering(self._select(db, **filters), HegemonyCountry, order_by)
+        return asn_directory.resolve_batches(db, stream_rows(db, stmt), **NAMES)
@@ -1,12 +1,62 @@
 from datetime import datetime
-from sqlalchemy.orm import Session, contains_eager, aliased
-from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from sqlalchemy import select, null, Row, Select
 from models.hegemony_prefix import HegemonyPrefix
-from typing import Optional, List, Tuple
-from utils import page_size
+from typing import Optional, List, Tuple, Iterator
+from utils import apply_pagination, fetch_page, Page, apply_ordering, count_rows, stream_rows
+from repositories.asn_directory import asn_directory
+from repositories.filters import Filter, FilterSpec
+
+
+FILTERS = FilterSpec(
+    Filter("prefixes", HegemonyPrefix.prefix, "in"),
+    Filter("originasn_ids", HegemonyPrefix.originasn, "in"),
+    Filter("asn_ids", HegemonyPrefix.asn, "in"),
+    Filter("countries", HegemonyPrefix.country, "in"),
+    Filter("timebin_gte", HegemonyPrefix.timebin, "gte"),
+    Filter("timebin_lte", HegemonyPrefix.timebin, "lte"),
+    Filter("rpki_status", HegemonyPrefix.rpki_status, "contains"),
+    Filter("irr_status", HegemonyPrefix.irr_status, "contains"),
+    Filter("delegated_prefix_status", HegemonyPrefix.delegated_prefix_status, "contains"),
+    Filter("delegated_asn_status", HegemonyPrefix.delegated_asn_status, "contains"),
+    Filter("af", HegemonyPrefix.af),
+    Filter("hege", HegemonyPrefix.hege),
+    Filter("hege_gte", HegemonyPrefix.hege, "gte"),
+    Filter("hege_lte", HegemonyPrefix.hege, "lte"),
+    Filter("origin_only", predicate=lambda value: HegemonyPrefix.originasn == HegemonyPrefix.asn if value else None),
+    latest=HegemonyPrefix,
+)
+
+# NULL placeholders filled from the ASN directory once rows are fetched (see AsnDirectory.resolve)
+NAMES = {"originasn_name": "originasn", "asn_name": "asn"}
+
+# Plain columns, named after HegemonyPrefixDTO fields, are much cheaper to
+# load than ORM entities. The id is last and only used for the cursor.
+SELECT = select(
+    HegemonyPrefix.timebin,
+    HegemonyPrefix.prefix,
+    HegemonyPrefix.originasn,
+    HegemonyPrefix.country,
+    HegemonyPrefix.asn,
+    HegemonyPrefix.hege,
+    HegemonyPrefix.af,
+    HegemonyPrefix.visibility,
+    HegemonyPrefix.rpki_status,
+    HegemonyPrefix.irr_status,
+    HegemonyPrefix.delegated_prefix_status,
+    HegemonyPrefix.delegated_asn_status,
+    HegemonyPrefix.descr,
+    HegemonyPrefix.moas,
+    null().label("originasn_name"),
+    null().label("asn_name"),
+    HegemonyPrefix.id
+)
 
 
 class HegemonyPrefixRepository:
+    def _select(self, db: Session, **filters) -> Select:
+        return FILTERS.apply(db, SELECT, filters)
+
     def get_all(
         self,
         db: Session,
@@ -26,66 +76,41 @@ class HegemonyPrefixRepository:
         hege_lte: Optional[float] = None,
         origin_only: Optional[bool] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[HegemonyPrefix], int]:
-        ASN = aliased(HegemonyPrefix.asn_relation.property.mapper.class_)
-        OriginASN = aliased(HegemonyPrefix.originasn_relation.property.mapper.class_)
-
-        stmt = (
-            select(HegemonyPrefix)
-            .join(HegemonyPrefix.asn_relation.of_type(ASN))
-            .join(HegemonyPrefix.originasn_relation.of_type(OriginASN))
-            .options(
-                contains_eager(HegemonyPrefix.asn_relation.of_type(ASN)),
-                contains_eager(HegemonyPrefix.originasn_relation.of_type(OriginASN))
-            )
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[Row], Optional[int]]:
+        stmt = self._select(
+            db,
+            timebin_gte=timebin_gte,
+            timebin_lte=timebin_lte,
+            prefixes=prefixes,
+            asn_ids=asn_ids,
+            originasn_ids=originasn_ids,
+            countries=countries,
+            rpki_status=rpki_status,
+            irr_status=irr_status,
+            delegated_prefix_status=delegated_prefix_status,
+            delegated_asn_status=delegated_asn_status,
+            af=af,
+            hege=hege,
+            hege_gte=hege_gte,
+            hege_lte=hege_lte,
+            origin_only=origin_only
         )
 
-        # If no time filters specified, get rows with max timebin
-        if not timebin_gte and not timebin_lte:
-            max_timebin = db.scalar(select(func.max(HegemonyPrefix.timebin)))
-            stmt = stmt.where(HegemonyPrefix.timebin == max_timebin)
-
-        # Apply filters
-        if timebin_gte:
-            stmt = stmt.where(HegemonyPrefix.timebin >= timebin_gte)
-        if timebin_lte:
-            stmt = stmt.where(HegemonyPrefix.timebin <= timebin_lte)
-        if prefixes:
-            stmt = stmt.where(HegemonyPrefix.prefix.in_(prefixes))
-        if asn_ids:
-            stmt = stmt.where(HegemonyPrefix.asn.in_(asn_ids))
-        if originasn_ids:
-            stmt = stmt.where(HegemonyPrefix.originasn.in_(originasn_ids))
-        if countries:
-            stmt = stmt.where(HegemonyPrefix.country.in_(countries))
-        if rpki_status:
-            stmt = stmt.where(HegemonyPrefix.rpki_status.contains(rpki_status))
-        if irr_status:
-            stmt = stmt.where(HegemonyPrefix.irr_status.contains(irr_status))
-        if delegated_prefix_status:
-            stmt = stmt.where(HegemonyPrefix.delegated_prefix_status.contains(delegated_prefix_status))
-        if delegated_asn_status:
-            stmt = stmt.where(HegemonyPrefix.delegated_asn_status.contains(delegated_asn_status))
-        if af is not None:
-            stmt = stmt.where(HegemonyPrefix.af == af)
-        if hege is not None:
-            stmt = stmt.where(HegemonyPrefix.hege == hege)
-        if hege_gte is not None:
-            stmt = stmt.where(HegemonyPrefix.hege >= hege_gte)
-        if hege_lte is not None:
-            stmt = stmt.where(HegemonyPrefix.hege <= hege_lte)
-        if origin_only:
-            stmt = stmt.where(HegemonyPrefix.originasn == HegemonyPrefix.asn)
-
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
+        total_count = count_rows(db, stmt, count_mode)
 
-        # Apply ordering
-        if order_by and hasattr(HegemonyPrefix, order_by):
-            stmt = stmt.order_by(getattr(HegemonyPrefix, order_by))
-
-        # Apply pagination
-        offset = (page - 1) * page_size
-        results = db.scalars(stmt.offset(offset).limit(page_size)).unique().all()
+        # Apply ordering and pagination
+        stmt = apply_pagination(stmt, HegemonyPrefix, page, order_by, cursor)
+        rows = fetch_page(db.execute(stmt))
+        results = Page(asn_directory.resolve(db, rows, **NAMES), rows.has_more)
 
         return results, total_count
+
+    def stream_all(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Yield all rows matching filters (the filters of get_all) in batches read from a server-side cursor.
+        """
+        stmt = apply_ordering(self._select(db, **filters), HegemonyPrefix, order_by)
+        return asn_directory.resolve_batches(db, stream_rows(db, stmt), **NAMES)
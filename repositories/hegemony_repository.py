@@ -1,12 +1,218 @@
-from datetime import datetime
-from sqlalchemy.orm import Session, contains_eager, aliased
-from sqlalchemy import select, func
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import Session
+from sqlalchemy import (
+    select, null, func, literal, case, and_, or_, Row, Select, table, column, BigInteger, Float, Integer
+)
+from sqlalchemy.orm import aliased
 from models.hegemony import Hegemony
-from typing import Optional, List, Tuple
-from utils import page_size
+from typing import Any, Optional, List, Tuple, Iterator
+from utils import apply_pagination, fetch_page, Page, apply_ordering, apply_label_ordering, parse_ordering, count_rows, stream_rows, page_size
+from repositories.asn_directory import asn_directory
+from repositories.filters import Filter, FilterSpec
+from repositories.latest_timebin_registry import latest_timebin_registry
+
+
+def _interval(value: str) -> timedelta:
+    # Parse intervals of the continuous aggregates metadata, e.g. '1 hour' or '1 week'
+    number, unit = value.split()
+    return timedelta(**{unit.rstrip("s") + "s": int(number)})
+
+
+# Continuous aggregates of Hegemony keyed by resolution, see Hegemony.__continuous_aggregates__
+AGGREGATES = {
+    cagg['resolution']: (
+        table(
+            cagg['name'],
+            column('timebin', Hegemony.timebin.type),
+            column('af', Integer),
+            column('originasn_id', BigInteger),
+            column('asn_id', BigInteger),
+            *(column(name, Float) for name in cagg['aggregates']),
+        ),
+        _interval(cagg['bucket_width'])
+    )
+    for cagg in Hegemony.__continuous_aggregates__
+}
+
+# Default ordering of aggregated rows
+AGGREGATE_ORDERING = ["timebin", "originasn", "asn", "af"]
+
+# Default origin of TimescaleDB's time_bucket, weekly buckets start on Mondays
+_BUCKET_ORIGIN = datetime(2000, 1, 3, tzinfo=timezone.utc)
+
+
+def bucket_start(timebin: datetime, width: timedelta) -> datetime:
+    """
+    Start of the time_bucket of the given width containing timebin.
+    """
+    if timebin.tzinfo is None:
+        timebin = timebin.replace(tzinfo=timezone.utc)
+    return timebin - (timebin - _BUCKET_ORIGIN) % width
+
+
+# Name columns, filled from the ASN directory with the name of the ASN column
+NAMES = {"asn_name": "asn", "originasn_name": "originasn"}
+
+# In the order of the (originasn_id, timebin) and (asn_id, originasn_id, timebin) indexes
+FILTERS = FilterSpec(
+    Filter("originasn_ids", Hegemony.originasn, "in"),
+    Filter("asn_ids", Hegemony.asn, "in"),
+    Filter("timebin_gte", Hegemony.timebin, "gte"),
+    Filter("timebin_lte", Hegemony.timebin, "lte"),
+    Filter("af", Hegemony.af),
+    Filter("hege", Hegemony.hege),
+    Filter("hege_gte", Hegemony.hege, "gte"),
+    Filter("hege_lte", Hegemony.hege, "lte"),
+    latest=Hegemony,
+)
+
+
+def _aggregate_filters(view, width: timedelta) -> FilterSpec:
+    # Buckets overlapping the time range are included, and hegemony filters
+    # apply to the average of each bucket
+    return FilterSpec(
+        Filter("originasn_ids", view.c.originasn_id, "in"),
+        Filter("asn_ids", view.c.asn_id, "in"),
+        Filter("timebin_gte", predicate=lambda value: view.c.timebin >= bucket_start(value, width)),
+        Filter("timebin_lte", view.c.timebin, "lte"),
+        Filter("af", view.c.af),
+        Filter("hege", view.c.hege_avg),
+        Filter("hege_gte", view.c.hege_avg, "gte"),
+        Filter("hege_lte", view.c.hege_avg, "lte"),
+    )
+
+
+def _aggregate_select(view) -> Select:
+    # Columns named after HegemonyAggregateDTO fields
+    return select(
+        view.c.timebin,
+        view.c.originasn_id.label("originasn"),
+        view.c.asn_id.label("asn"),
+        view.c.hege_avg,
+        view.c.hege_min,
+        view.c.hege_max,
+        view.c.af,
+        null().label("asn_name"),
+        null().label("originasn_name")
+    )
+
+
+AGGREGATE_FILTERS = {
+    resolution: _aggregate_filters(view, width) for resolution, (view, width) in AGGREGATES.items()
+}
+AGGREGATE_SELECTS = {resolution: _aggregate_select(view) for resolution, (view, _) in AGGREGATES.items()}
+
+
+# Plain columns, named after HegemonyDTO fields, are much cheaper to load
+# than ORM entities. The id is last and only used for the cursor.
+SELECT = select(
+    Hegemony.timebin,
+    Hegemony.originasn,
+    Hegemony.asn,
+    Hegemony.hege,
+    Hegemony.af,
+    null().label("asn_name"),
+    null().label("originasn_name"),
+    Hegemony.id
+)
+
+
+# Default ordering of the changes between two timebins
+DIFF_ORDERING = ["originasn", "asn", "af"]
+# Columns selected by _diff_select, to validate the ordering of empty results
+DIFF_FIELDS = ("timebin", "previous_timebin", "originasn", "asn", "af", "previous_hege", "hege",
+               "delta", "change", "asn_name", "originasn_name")
+
+# Filters applied to each of the two timebins compared
+DIFF_FILTERS = FilterSpec(
+    Filter("originasn_ids", Hegemony.originasn, "in"),
+    Filter("asn_ids", Hegemony.asn, "in"),
+    Filter("timebin", Hegemony.timebin),
+    Filter("af", Hegemony.af),
+)
+
+DIFF_SIDE_SELECT = select(Hegemony.originasn, Hegemony.asn, Hegemony.af, Hegemony.hege)
+
+
+def _diff_select(db: Session, timebin: Optional[datetime], previous_timebin: Optional[datetime],
+                 threshold: float, filters: dict) -> Select:
+    """
+    Select the dependencies of timebin whose hege changed by more than threshold
+    since previous_timebin, appeared or disappeared, with a full outer join of the
+    rows of both timebins. Columns are named after HegemonyDiffDTO fields.
+    """
+    current = DIFF_FILTERS.apply(db, DIFF_SIDE_SELECT, dict(filters, timebin=timebin)).subquery("current_hegemony")
+    previous = DIFF_FILTERS.apply(db, DIFF_SIDE_SELECT, dict(filters, timebin=previous_timebin)).subquery("previous_hegemony")
+
+    return select(
+        literal(timebin, Hegemony.timebin.type).label("timebin"),
+        literal(previous_timebin, Hegemony.timebin.type).label("previous_timebin"),
+        func.coalesce(current.c.originasn, previous.c.originasn).label("originasn"),
+        func.coalesce(current.c.asn, previous.c.asn).label("asn"),
+        func.coalesce(current.c.af, previous.c.af).label("af"),
+        previous.c.hege.label("previous_hege"),
+        current.c.hege.label("hege"),
+        (func.coalesce(current.c.hege, 0) - func.coalesce(previous.c.hege, 0)).label("delta"),
+        case(
+            (previous.c.hege.is_(None), "appeared"),
+            (current.c.hege.is_(None), "disappeared"),
+            else_="changed"
+        ).label("change"),
+        null().label("asn_name"),
+        null().label("originasn_name")
+    ).select_from(
+        current.join(
+            previous,
+            and_(
+                current.c.originasn == previous.c.originasn,
+                current.c.asn == previous.c.asn,
+                current.c.af == previous.c.af,
+            ),
+            full=True
+        )
+    ).where(or_(
+        current.c.hege.is_(None),
+        previous.c.hege.is_(None),
+        func.abs(current.c.hege - previous.c.hege) > threshold
+    ))
+
+
+def _top_select(stmt: Select, top: int):
+    """
+    Keep the top rows of each (originasn, af, timebin) of stmt, a select() of
+    Hegemony, by decreasing hege. Return the select() of the kept rows, with the
+    columns of SELECT, and the Hegemony alias they are selected from.
+    """
+    rank = func.row_number().over(
+        partition_by=(Hegemony.originasn, Hegemony.af, Hegemony.timebin),
+        order_by=(Hegemony.hege.desc(), Hegemony.asn)
+    ).label("rank")
+    ranked = stmt.with_only_columns(Hegemony, rank).subquery("ranked")
+    entity = aliased(Hegemony, ranked)
+    top_stmt = select(
+        entity.timebin,
+        entity.originasn,
+        entity.asn,
+        entity.hege,
+        entity.af,
+        null().label("asn_name"),
+        null().label("originasn_name"),
+        entity.id
+    ).where(ranked.c.rank <= top)
+    return top_stmt, entity
 
 
 class HegemonyRepository:
+    def _select(self, db: Session, top: Optional[int] = None, **filters) -> Tuple[Select, Any]:
+        """
+        Select the rows matching filters, or only the top ones of each origin, af
+        and timebin. Return the select() and the entity to order it by.
+        """
+        stmt = FILTERS.apply(db, SELECT, filters)
+        if top is None:
+            return stmt, Hegemony
+        return _top_select(stmt, top)
+
     def get_all(
         self,
         db: Session,
@@ -18,53 +224,153 @@ class HegemonyRepository:
         hege: Optional[float] = None,
         hege_gte: Optional[float] = None,
         hege_lte: Optional[float] = None,
+        top: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[Hegemony], int]:
-        ASN = aliased(Hegemony.asn_relation.property.mapper.class_)
-        OriginASN = aliased(Hegemony.originasn_relation.property.mapper.class_)
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[Row], Optional[int]]:
+        stmt, entity = self._select(
+            db,
+            timebin_gte=timebin_gte,
+            timebin_lte=timebin_lte,
+            asn_ids=asn_ids,
+            originasn_ids=originasn_ids,
+            af=af,
+            hege=hege,
+            hege_gte=hege_gte,
+            hege_lte=hege_lte,
+            top=top
+        )
 
-        stmt = (
-            select(Hegemony)
-            .join(Hegemony.asn_relation.of_type(ASN))
-            .join(Hegemony.originasn_relation.of_type(OriginASN))
-            .options(
-                contains_eager(Hegemony.asn_relation.of_type(ASN)),
-                contains_eager(Hegemony.originasn_relation.of_type(OriginASN))
+        total_count = count_rows(db, stmt, count_mode)
+
+        # Apply ordering and pagination
+        stmt = apply_pagination(stmt, entity, page, order_by, cursor)
+        rows = fetch_page(db.execute(stmt))
+        results = Page(asn_directory.resolve(db, rows, **NAMES), rows.has_more)
+
+        return results, total_count
+
+    def stream_all(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Yield all rows matching filters (the filters of get_all) in batches read from a server-side cursor.
+        """
+        stmt, entity = self._select(db, **filters)
+        stmt = apply_ordering(stmt, entity, order_by)
+        return asn_directory.resolve_batches(db, stream_rows(db, stmt), **NAMES)
+
+    def stream_by_origin(self, db: Session, **filters) -> Iterator[List[Row]]:
+        """
+        Yield all rows matching filters in batches, sorted by originasn (then timebin
+        and asn) so that the dependencies of each origin are contiguous.
+        """
+        stmt, entity = self._select(db, **filters)
+        stmt = stmt.order_by(entity.originasn, entity.timebin, entity.asn)
+        return asn_directory.resolve_batches(db, stream_rows(db, stmt), **NAMES)
+
+    def _select_diff(self, db: Session, timebin: Optional[datetime] = None,
+                     previous_timebin: Optional[datetime] = None, threshold: float = 0,
+                     **filters) -> Optional[Select]:
+        # Compare the latest timebin by default, with the timebin preceding it.
+        # None when there is no such timebin, as the unfiltered side would scan all the history
+        if timebin is None:
+            timebin = latest_timebin_registry.get(db, Hegemony)
+        if previous_timebin is None and timebin is not None:
+            previous_timebin = db.scalar(
+                select(func.max(Hegemony.timebin))
+                .where(Hegemony.timebin < timebin)
+                .execution_options(query_label="previous_timebin")
             )
+        if timebin is None or previous_timebin is None:
+            return None
+        return _diff_select(db, timebin, previous_timebin, threshold, filters)
+
+    def get_diff(
+        self,
+        db: Session,
+        page: int = 1,
+        order_by: Optional[str] = None,
+        count_mode: str = "exact",
+        **filters
+    ) -> Tuple[List[Row], Optional[int]]:
+        """
+        Get a page of the dependencies that changed between two timebins (see
+        _select_diff for filters). Changes have no id, hence no keyset cursor.
+        """
+        stmt = self._select_diff(db, **filters)
+        if stmt is None:
+            parse_ordering(order_by, DIFF_FIELDS)
+            return [], None if count_mode == "none" else 0
+
+        total_count = count_rows(db, stmt, count_mode)
+
+        stmt = (
+            apply_label_ordering(stmt, order_by, DIFF_ORDERING)
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+            .execution_options(query_label="page")
         )
+        results = asn_directory.resolve(db, db.execute(stmt).all(), **NAMES)
 
-        # If no time filters specified, get rows with max timebin
-        if not timebin_gte and not timebin_lte:
-            max_timebin = db.scalar(select(func.max(Hegemony.timebin)))
-            stmt = stmt.where(Hegemony.timebin == max_timebin)
-
-        # Apply filters
-        if timebin_gte:
-            stmt = stmt.where(Hegemony.timebin >= timebin_gte)
-        if timebin_lte:
-            stmt = stmt.where(Hegemony.timebin <= timebin_lte)
-        if asn_ids:
-            stmt = stmt.where(Hegemony.asn.in_(asn_ids))
-        if originasn_ids:
-            stmt = stmt.where(Hegemony.originasn.in_(originasn_ids))
-        if af is not None:
-            stmt = stmt.where(Hegemony.af == af)
-        if hege is not None:
-            stmt = stmt.where(Hegemony.hege == hege)
-        if hege_gte:
-            stmt = stmt.where(Hegemony.hege >= hege_gte)
-        if hege_lte:
-            stmt = stmt.where(Hegemony.hege <= hege_lte)
-
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
-
-        # Apply ordering
-        if order_by and hasattr(Hegemony, order_by):
-            stmt = stmt.order_by(getattr(Hegemony, order_by))
-
-        # Apply pagination
-        offset = (page - 1) * page_size
-        results = db.scalars(stmt.offset(offset).limit(page_size)).unique().all()
+        return results, total_count
+
+    def stream_diff(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Yield all the dependencies that changed between two timebins in batches.
+        """
+        stmt = self._select_diff(db, **filters)
+        if stmt is None:
+            parse_ordering(order_by, DIFF_FIELDS)
+            return iter(())
+        stmt = apply_label_ordering(stmt, order_by, DIFF_ORDERING)
+        return asn_directory.resolve_batches(db, stream_rows(db, stmt), **NAMES)
+
+    def _select_aggregates(self, db: Session, resolution: str, **filters) -> Select:
+        view, width = AGGREGATES[resolution]
+
+        stmt = AGGREGATE_SELECTS[resolution]
+
+        # If no time filters specified, get the bucket of the latest timebin
+        if not filters.get("timebin_gte") and not filters.get("timebin_lte"):
+            max_timebin = latest_timebin_registry.get(db, Hegemony)
+            if max_timebin is not None:
+                stmt = stmt.where(view.c.timebin == bucket_start(max_timebin, width))
+
+        return AGGREGATE_FILTERS[resolution].apply(db, stmt, filters)
+
+    def get_aggregates(
+        self,
+        db: Session,
+        resolution: str,
+        page: int = 1,
+        order_by: Optional[str] = None,
+        count_mode: str = "exact",
+        **filters
+    ) -> Tuple[List[Row], Optional[int]]:
+        """
+        Get a page of the continuous aggregate of the given resolution, filtered
+        like get_all. Aggregates have no id, hence no keyset cursor.
+        """
+        stmt = self._select_aggregates(db, resolution, **filters)
+
+        total_count = count_rows(db, stmt, count_mode)
+
+        stmt = (
+            apply_label_ordering(stmt, order_by, AGGREGATE_ORDERING)
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+            .execution_options(query_label="page")
+        )
+        results = asn_directory.resolve(db, db.execute(stmt).all(), **NAMES)
 
         return results, total_count
+
+    def stream_aggregates(self, db: Session, resolution: str, order_by: Optional[str] = None,
+                          **filters) -> Iterator[List[Row]]:
+        """
+        Yield all rows of the continuous aggregate of the given resolution matching filters in batches.
+        """
+        stmt = apply_label_ordering(
+            self._select_aggregates(db, resolution, **filters), order_by, AGGREGATE_ORDERING)
+        return asn_directory.resolve_batches(db, stream_rows(db, stmt), **NAMES)
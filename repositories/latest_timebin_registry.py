@@ -0,0 +1,82 @@
+from datetime import datetime
+from sqlalchemy.orm import Session
+from sqlalchemy import select, func
+from typing import Optional
+from dotenv import load_dotenv
+from utils import TTLCache
+import asyncio
+import logging
+import os
+
+try:
+    load_dotenv()
+except:
+    pass
+
+LATEST_TIMEBIN_TTL = float(os.getenv("LATEST_TIMEBIN_TTL", 60))
+LATEST_TIMEBIN_REFRESH_INTERVAL = float(os.getenv("LATEST_TIMEBIN_REFRESH_INTERVAL", 0))
+
+logger = logging.getLogger("ihr.latest_timebin")
+
+
+class LatestTimebinRegistry:
+    """
+    Process-wide cache of the most recent timebin of each time-series model.
+
+    Repositories use it when no time filter is given, instead of running
+    SELECT max(timebin) (which touches every chunk index of a hypertable)
+    on every request.
+    """
+
+    def __init__(self, ttl: float = LATEST_TIMEBIN_TTL):
+        self._cache = TTLCache(maxsize=64, ttl=ttl)
+        # Models looked up so far, kept up to date by the background refresh
+        self._models = set()
+
+    def get(self, db: Session, model) -> Optional[datetime]:
+        latest = self._cache.get(model)
+        if latest is None:
+            latest = self.refresh(db, model)
+        return latest
+
+    def peek(self, model) -> Optional[datetime]:
+        """
+        Return the cached latest timebin of model without querying the database.
+        """
+        return self._cache.get(model)
+
+    def refresh(self, db: Session, model) -> Optional[datetime]:
+        self._models.add(model)
+        latest = db.scalar(
+            select(func.max(model.timebin)).execution_options(query_label="latest_timebin"))
+        if latest is not None:
+            self._cache.set(model, latest)
+        return latest
+
+    def refresh_all(self, db: Session) -> None:
+        for model in list(self._models):
+            self.refresh(db, model)
+
+
+latest_timebin_registry = LatestTimebinRegistry()
+
+
+def _refresh_all() -> None:
+    from config.database import SessionLocal
+
+    with SessionLocal() as db:
+        latest_timebin_registry.refresh_all(db)
+
+
+async def refresh_latest_timebins(interval: float = LATEST_TIMEBIN_REFRESH_INTERVAL) -> None:
+    """
+    Background task refreshing the latest timebin of every model already looked up,
+    so that requests never wait for the query. Should be used with a LATEST_TIMEBIN_TTL
+    larger than the refresh interval.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(_refresh_all)
+        except Exception:
+            logger.exception("Failed to refresh latest timebins")
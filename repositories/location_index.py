@@ -0,0 +1,201 @@
+from collections import namedtuple
+from sqlalchemy.orm import Session
+from sqlalchemy import Select, select
+from models.atlas_location import AtlasLocation
+from typing import Optional, List, Dict, Iterator, Tuple
+from dotenv import load_dotenv
+from repositories.filters import is_absent, in_values
+from repositories.reference_table import ReferenceTable, refresh_reference_table, row_type
+from utils import RowBatch
+import os
+
+try:
+    load_dotenv()
+except:
+    pass
+
+# Lifetime (seconds) of the loaded Atlas locations, and shortest interval between
+# reloads triggered by unknown locations
+LOCATION_INDEX_TTL = float(os.getenv("LOCATION_INDEX_TTL", 3600))
+LOCATION_INDEX_MISS_RELOAD_INTERVAL = float(os.getenv("LOCATION_INDEX_MISS_RELOAD_INTERVAL", 60))
+# Interval of the background reloads, which also load the locations at startup
+LOCATION_INDEX_REFRESH_INTERVAL = float(os.getenv("LOCATION_INDEX_REFRESH_INTERVAL", 1800))
+
+Location = namedtuple("Location", ["type", "name", "af"])
+_UNKNOWN = Location(None, None, None)
+
+
+def parse_key(key: str) -> Optional[Tuple[str, Optional[int], Optional[str]]]:
+    """
+    Parse a location key, the concatenation of the type, af and name of a
+    location (e.g. CT4New York City, New York, US), into (type, af, name).
+    The af and name are optional, keys shorter than a type are ignored.
+    """
+    if len(key) < 2:
+        return None
+    key_af = int(key[2]) if len(key) > 2 and key[2].isdigit() else None
+    key_name = key[3:] if len(key) > 3 else None
+    return key[:2], key_af or None, key_name or None
+
+
+def _matches_key(location: Location, key: Tuple[str, Optional[int], Optional[str]]) -> bool:
+    key_type, key_af, key_name = key
+    return (location.type == key_type
+            and (key_af is None or location.af == key_af)
+            and (key_name is None or location.name == key_name))
+
+
+class LocationIndex(ReferenceTable):
+    """
+    Process-wide index of the Atlas locations (ihr_atlas_location).
+
+    Location filters of network delays are resolved to location ids with it,
+    so that the hypertables are queried by startpoint_id and endpoint_id (their
+    compression segments) without joining the location table, and the locations
+    of the fetched rows are filled from it.
+    """
+    # Query parameters filtering the locations of a side, e.g. startpoint_names
+    FILTERS = ("names", "type", "af", "key")
+
+    def __init__(self, ttl: float = LOCATION_INDEX_TTL,
+                 miss_reload_interval: float = LOCATION_INDEX_MISS_RELOAD_INTERVAL):
+        super().__init__(ttl, miss_reload_interval)
+
+    def load(self, db: Session) -> Tuple[Dict[int, Location], Dict[str, List[int]], Dict[str, List[int]]]:
+        rows = db.execute(
+            select(AtlasLocation.id, AtlasLocation.type, AtlasLocation.name, AtlasLocation.af)
+            .execution_options(query_label="location_index")
+        ).all()
+        locations = {}
+        by_name = {}
+        by_type = {}
+        for id, type, name, af in rows:
+            locations[id] = Location(type, name, af)
+            by_name.setdefault(name, []).append(id)
+            by_type.setdefault(type, []).append(id)
+        return locations, by_name, by_type
+
+    def location(self, db: Session, id: Optional[int]) -> Optional[Location]:
+        """
+        Location of id, or None if it isn't in ihr_atlas_location (once reloaded).
+        """
+        locations = self.data(db)[0]
+        if id is not None and id not in locations:
+            locations = self.reload_on_miss(db)[0]
+        return locations.get(id)
+
+    def match(self, db: Session, names: Optional[List[str]] = None, type: Optional[str] = None,
+              af: Optional[int] = None, keys: Optional[List[str]] = None) -> List[int]:
+        """
+        Ids of the locations with one of names, of the given type and af, and
+        matching one of keys (see parse_key), sorted.
+        """
+        ids = self._match(self.data(db), names, type, af, keys)
+        if not ids:
+            # The locations may have been added since the last load
+            ids = self._match(self.reload_on_miss(db), names, type, af, keys)
+        return ids
+
+    @staticmethod
+    def _match(data, names, type, af, keys) -> List[int]:
+        locations, by_name, by_type = data
+        if names:
+            candidates = [id for name in names for id in by_name.get(name, ())]
+        elif type:
+            candidates = by_type.get(type, ())
+        else:
+            candidates = locations.keys()
+        parsed_keys = [key for key in map(parse_key, keys or ()) if key is not None]
+
+        ids = set()
+        for id in candidates:
+            location = locations[id]
+            if type and location.type != type:
+                continue
+            if af and location.af != af:
+                continue
+            if parsed_keys and not any(_matches_key(location, key) for key in parsed_keys):
+                continue
+            ids.add(id)
+        return sorted(ids)
+
+    def apply(self, db: Session, stmt: Select, filters: dict, **columns) -> Select:
+        """
+        Pop the location filters of each side given as keyword arguments from filters
+        (e.g. startpoint_names, startpoint_type, startpoint_af and startpoint_key for
+        startpoint=AtlasDelay.startpoint_id), and filter the location id column of
+        that side by the ids of the matching locations.
+
+        Keys that don't parse are ignored, and sides whose filters match every
+        location aren't filtered at all.
+        """
+        for side, column in columns.items():
+            values = {name: filters.pop(f"{side}_{name}", None) for name in self.FILTERS}
+            if values["key"]:
+                values["key"] = [key for key in values["key"].split("|") if parse_key(key) is not None]
+            if all(is_absent(value) for value in values.values()):
+                continue
+            ids = self.match(
+                db,
+                names=values["names"].split("|") if values["names"] else None,
+                type=values["type"],
+                af=values["af"],
+                keys=values["key"],
+            )
+            if ids and len(ids) == len(self.data(db)[0]):
+                continue
+            stmt = stmt.where(in_values(column, ids))
+        return stmt
+
+    def expand(self, db: Session, rows: List, **columns: str) -> List:
+        """
+        Return rows with each location id column given as keyword argument replaced by
+        the type, name and af columns of the location, e.g. expand(db, rows,
+        startpoint="startpoint_id") replaces startpoint_id by startpoint_type,
+        startpoint_name and startpoint_af.
+        """
+        if not rows:
+            return rows
+        fields = rows[0]._fields
+        positions = sorted((fields.index(column), side) for side, column in columns.items())
+        expanded_fields = []
+        start = 0
+        for position, side in positions:
+            expanded_fields += fields[start:position]
+            expanded_fields += [f"{side}_type", f"{side}_name", f"{side}_af"]
+            start = position + 1
+        expanded_fields += fields[start:]
+
+        locations = self.data(db)[0]
+        if any(row[position] not in locations for row in rows for position, _ in positions):
+            locations = self.reload_on_miss(db)[0]
+
+        expanded_row = row_type(tuple(expanded_fields))
+        expanded = []
+        for row in rows:
+            values = ()
+            start = 0
+            for position, _ in positions:
+                values += row[start:position] + locations.get(row[position], _UNKNOWN)
+                start = position + 1
+            expanded.append(expanded_row._make(values + row[start:]))
+        return expanded
+
+    def expand_batches(self, db: Session, batches: Iterator[List], **columns: str) -> Iterator[List]:
+        """
+        expand() each batch of rows yielded by batches, e.g. by stream_rows().
+        """
+        location_types = {"type": AtlasLocation.type.type, "name": AtlasLocation.name.type, "af": AtlasLocation.af.type}
+        for rows in batches:
+            types = dict(getattr(rows, "types", {}))
+            for side, column in columns.items():
+                types.pop(column, None)
+                types.update({f"{side}_{field}": type for field, type in location_types.items()})
+            yield RowBatch(self.expand(db, rows, **columns), types)
+
+
+location_index = LocationIndex()
+
+
+async def refresh_location_index(interval: float = LOCATION_INDEX_REFRESH_INTERVAL) -> None:
+    await refresh_reference_table(location_index, interval)
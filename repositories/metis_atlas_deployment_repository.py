@@ -1,9 +1,27 @@
 from datetime import datetime
-from sqlalchemy.orm import Session, contains_eager
-from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from sqlalchemy import select
 from models.metis_atlas_deployment import MetisAtlasDeployment
 from typing import Optional, List, Tuple
-from utils import page_size
+from utils import apply_pagination, fetch_page, count_rows
+from repositories.filters import Filter, FilterSpec
+
+
+FILTERS = FilterSpec(
+    Filter("metric", MetisAtlasDeployment.metric),
+    Filter("af", MetisAtlasDeployment.af),
+    Filter("timebin", MetisAtlasDeployment.timebin),
+    Filter("timebin_gte", MetisAtlasDeployment.timebin, "gte"),
+    Filter("timebin_lte", MetisAtlasDeployment.timebin, "lte"),
+    Filter("rank", MetisAtlasDeployment.rank),
+    Filter("rank_gte", MetisAtlasDeployment.rank, "gte"),
+    Filter("rank_lte", MetisAtlasDeployment.rank, "lte"),
+    latest=MetisAtlasDeployment,
+)
+
+
+# ASN names are filled by the service from the ASN directory
+SELECT = select(MetisAtlasDeployment)
 
 
 class MetisAtlasDeploymentRepository:
@@ -19,45 +37,25 @@ class MetisAtlasDeploymentRepository:
         metric: Optional[str] = None,
         af: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[MetisAtlasDeployment], int]:
-        stmt = (
-            select(MetisAtlasDeployment)
-            .join(MetisAtlasDeployment.asn_relation)
-            .options(contains_eager(MetisAtlasDeployment.asn_relation))
-        )
-
-        # If no time filters specified, get rows with max timebin
-        if not timebin and not timebin_gte and not timebin_lte:
-            max_timebin = db.scalar(select(func.max(MetisAtlasDeployment.timebin)))
-            stmt = stmt.where(MetisAtlasDeployment.timebin == max_timebin)
-
-        # Apply filters
-        if timebin:
-            stmt = stmt.where(MetisAtlasDeployment.timebin == timebin)
-        if timebin_gte:
-            stmt = stmt.where(MetisAtlasDeployment.timebin >= timebin_gte)
-        if timebin_lte:
-            stmt = stmt.where(MetisAtlasDeployment.timebin <= timebin_lte)
-        if rank:
-            stmt = stmt.where(MetisAtlasDeployment.rank == rank)
-        if rank_lte:
-            stmt = stmt.where(MetisAtlasDeployment.rank <= rank_lte)
-        if rank_gte:
-            stmt = stmt.where(MetisAtlasDeployment.rank >= rank_gte)
-        if metric:
-            stmt = stmt.where(MetisAtlasDeployment.metric == metric)
-        if af:
-            stmt = stmt.where(MetisAtlasDeployment.af == af)
-
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
-
-        # Apply ordering
-        if order_by and hasattr(MetisAtlasDeployment, order_by):
-            stmt = stmt.order_by(getattr(MetisAtlasDeployment, order_by))
-
-        # Apply pagination
-        offset = (page - 1) * page_size
-        results = db.scalars(stmt.offset(offset).limit(page_size)).unique().all()
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[MetisAtlasDeployment], Optional[int]]:
+        stmt = FILTERS.apply(db, SELECT, dict(
+            timebin_gte=timebin_gte,
+            timebin_lte=timebin_lte,
+            timebin=timebin,
+            rank=rank,
+            rank_lte=rank_lte,
+            rank_gte=rank_gte,
+            metric=metric,
+            af=af
+        ))
+
+        total_count = count_rows(db, stmt, count_mode)
+
+        # Apply ordering and pagination
+        stmt = apply_pagination(stmt, MetisAtlasDeployment, page, order_by, cursor)
+        results = fetch_page(db.scalars(stmt).unique())
 
         return results, total_count
@@ -1,9 +1,27 @@
 from datetime import datetime
-from sqlalchemy.orm import Session, contains_eager
-from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from sqlalchemy import select
 from models.metis_atlas_selection import MetisAtlasSelection
 from typing import Optional, List, Tuple
-from utils import page_size
+from utils import apply_pagination, fetch_page, count_rows
+from repositories.filters import Filter, FilterSpec
+
+
+FILTERS = FilterSpec(
+    Filter("metric", MetisAtlasSelection.metric),
+    Filter("af", MetisAtlasSelection.af),
+    Filter("timebin", MetisAtlasSelection.timebin),
+    Filter("timebin_gte", MetisAtlasSelection.timebin, "gte"),
+    Filter("timebin_lte", MetisAtlasSelection.timebin, "lte"),
+    Filter("rank", MetisAtlasSelection.rank),
+    Filter("rank_gte", MetisAtlasSelection.rank, "gte"),
+    Filter("rank_lte", MetisAtlasSelection.rank, "lte"),
+    latest=MetisAtlasSelection,
+)
+
+
+# ASN names are filled by the service from the ASN directory
+SELECT = select(MetisAtlasSelection)
 
 
 class MetisAtlasSelectionRepository:
@@ -19,45 +37,25 @@ class MetisAtlasSelectionRepository:
         metric: Optional[str] = None,
         af: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[MetisAtlasSelection], int]:
-        stmt = (
-            select(MetisAtlasSelection)
-            .join(MetisAtlasSelection.asn_relation)
-            .options(contains_eager(MetisAtlasSelection.asn_relation))
-        )
-
-        # If no time filters specified, get rows with max timebin
-        if not timebin and not timebin_gte and not timebin_lte:
-            max_timebin = db.scalar(select(func.max(MetisAtlasSelection.timebin)))
-            stmt = stmt.where(MetisAtlasSelection.timebin == max_timebin)
-
-        # Apply filters
-        if timebin:
-            stmt = stmt.where(MetisAtlasSelection.timebin == timebin)
-        if timebin_gte:
-            stmt = stmt.where(MetisAtlasSelection.timebin >= timebin_gte)
-        if timebin_lte:
-            stmt = stmt.where(MetisAtlasSelection.timebin <= timebin_lte)
-        if rank:
-            stmt = stmt.where(MetisAtlasSelection.rank == rank)
-        if rank_lte:
-            stmt = stmt.where(MetisAtlasSelection.rank <= rank_lte)
-        if rank_gte:
-            stmt = stmt.where(MetisAtlasSelection.rank >= rank_gte)
-        if metric:
-            stmt = stmt.where(MetisAtlasSelection.metric == metric)
-        if af:
-            stmt = stmt.where(MetisAtlasSelection.af == af)
-
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
-
-        # Apply ordering
-        if order_by and hasattr(MetisAtlasSelection, order_by):
-            stmt = stmt.order_by(getattr(MetisAtlasSelection, order_by))
-
-        # Apply pagination
-        offset = (page - 1) * page_size
-        results = db.scalars(stmt.offset(offset).limit(page_size)).unique().all()
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[MetisAtlasSelection], Optional[int]]:
+        stmt = FILTERS.apply(db, SELECT, dict(
+            timebin_gte=timebin_gte,
+            timebin_lte=timebin_lte,
+            timebin=timebin,
+            rank=rank,
+            rank_lte=rank_lte,
+            rank_gte=rank_gte,
+            metric=metric,
+            af=af
+        ))
+
+        total_count = count_rows(db, stmt, count_mode)
+
+        # Apply ordering and pagination
+        stmt = apply_pagination(stmt, MetisAtlasSelection, page, order_by, cursor)
+        results = fetch_page(db.scalars(stmt).unique())
 
         return results, total_count
@@ -2,7 +2,31 @@ from sqlalchemy.orm import Session
 from sqlalchemy import select, func, or_, String
 from models.asn import ASN
 from typing import Optional, List, Tuple
-from utils import page_size
+from utils import page_size, apply_ordering, count_rows
+from repositories.filters import Filter, FilterSpec
+
+
+def _search(search: str):
+    # Handle AS/IX prefix in search
+    search_value = search
+    if search.upper().startswith(("AS", "IX")):
+        try:
+            search_value = str(int(search[2:]))
+        except ValueError:
+            pass
+    return or_(
+        ASN.number.cast(String).contains(search_value),
+        ASN.name.ilike(f"%{search}%")
+    )
+
+
+FILTERS = FilterSpec(
+    Filter("numbers", ASN.number, "in"),
+    Filter("number_gte", ASN.number, "gte"),
+    Filter("number_lte", ASN.number, "lte"),
+    Filter("name", ASN.name, "icontains"),
+    Filter("search", predicate=_search),
+)
 
 
 class NetworksRepository:
@@ -15,37 +39,24 @@ class NetworksRepository:
         number_lte: Optional[int] = None,
         search: Optional[str] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[ASN], int]:
+        order_by: Optional[str] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[ASN], Optional[int]]:
         stmt = select(ASN)
 
         # Apply filters
-        if name:
-            stmt = stmt.where(ASN.name.ilike(f"%{name}%"))
-        if numbers:
-            stmt = stmt.where(ASN.number.in_(numbers))
-        if number_gte:
-            stmt = stmt.where(ASN.number >= number_gte)
-        if number_lte:
-            stmt = stmt.where(ASN.number <= number_lte)
-        if search:
-            # Handle AS/IX prefix in search
-            search_value = search
-            if search.upper().startswith(("AS", "IX")):
-                try:
-                    search_value = str(int(search[2:]))
-                except ValueError:
-                    pass
-            stmt = stmt.where(or_(
-                ASN.number.cast(String).contains(search_value),
-                ASN.name.ilike(f"%{search}%")
-            ))
-
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
+        stmt = FILTERS.apply(db, stmt, dict(
+            name=name,
+            numbers=numbers,
+            number_gte=number_gte,
+            number_lte=number_lte,
+            search=search
+        ))
+
+        total_count = count_rows(db, stmt, count_mode)
 
         # Apply ordering
-        if order_by and hasattr(ASN, order_by):
-            stmt = stmt.order_by(getattr(ASN, order_by))
+        stmt = apply_ordering(stmt, ASN, order_by)
 
         # Apply pagination
         offset = (page - 1) * page_size
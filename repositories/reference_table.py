@@ -0,0 +1,80 @@
+from collections import namedtuple
+from functools import lru_cache
+from sqlalchemy.orm import Session
+from typing import Any, Optional
+import asyncio
+import logging
+import threading
+import time
+
+logger = logging.getLogger("ihr.reference_table")
+
+
+@lru_cache(maxsize=64)
+def row_type(fields: tuple):
+    # Rows with the given columns, built from fetched rows once references are resolved
+    return namedtuple("Row", fields)
+
+
+class ReferenceTable:
+    """
+    Small, slowly changing table (e.g. ASNs or Atlas locations) kept in memory
+    by each worker, so that time-series queries don't need to join it.
+
+    Subclasses implement load(db), whose result is kept for ttl seconds. Lookups
+    of unknown keys (e.g. rows added since the last load) may call reload_on_miss(db),
+    which reloads the table at most every miss_reload_interval seconds.
+    """
+
+    def __init__(self, ttl: float, miss_reload_interval: float):
+        self.ttl = ttl
+        self.miss_reload_interval = miss_reload_interval
+        self._data: Any = None
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def load(self, db: Session) -> Any:
+        raise NotImplementedError
+
+    def data(self, db: Session) -> Any:
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.ttl:
+            self._reload(db, loaded_at)
+        return self._data
+
+    def reload(self, db: Session) -> None:
+        self._data = self.load(db)
+        self._loaded_at = time.monotonic()
+
+    def reload_on_miss(self, db: Session) -> Any:
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.miss_reload_interval:
+            self._reload(db, loaded_at)
+        return self._data
+
+    def _reload(self, db: Session, loaded_at: Optional[float]) -> None:
+        with self._lock:
+            # Another thread may have reloaded the table while this one was waiting
+            if self._loaded_at == loaded_at:
+                self.reload(db)
+
+
+def _reload(table: ReferenceTable) -> None:
+    from config.database import SessionLocal
+
+    with SessionLocal() as db:
+        table.reload(db)
+
+
+async def refresh_reference_table(table: ReferenceTable, interval: float) -> None:
+    """
+    Background task loading table at startup and then every interval seconds, so
+    that requests never wait for it. The ttl of the table should be larger than
+    the interval.
+    """
+    while True:
+        try:
+            await asyncio.to_thread(_reload, table)
+        except Exception:
+            logger.exception("Failed to reload %s", type(table).__name__)
+        await asyncio.sleep(interval)
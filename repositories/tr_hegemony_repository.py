@@ -1,9 +1,43 @@
 from sqlalchemy.orm import Session, aliased, contains_eager
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy import select
 from models.tr_hegemony import TRHegemony
+from models.tr_hegemony_identifier import TRHegemonyIdentifier
 from datetime import datetime
 from typing import List, Optional, Tuple
-from utils import page_size
+from utils import apply_pagination, fetch_page, count_rows
+from repositories.filters import Filter, FilterSpec
+
+
+Origin = aliased(TRHegemonyIdentifier)
+Dependency = aliased(TRHegemonyIdentifier)
+
+FILTERS = FilterSpec(
+    Filter("origin_names", Origin.name, "in", split="|"),
+    Filter("origin_type", Origin.type),
+    Filter("origin_af", Origin.af),
+    Filter("dependency_names", Dependency.name, "in", split="|"),
+    Filter("dependency_type", Dependency.type),
+    Filter("dependency_af", Dependency.af),
+    Filter("timebin", TRHegemony.timebin),
+    Filter("timebin_gte", TRHegemony.timebin, "gte"),
+    Filter("timebin_lte", TRHegemony.timebin, "lte"),
+    Filter("af", TRHegemony.af),
+    Filter("hege", TRHegemony.hege),
+    Filter("hege_gte", TRHegemony.hege, "gte"),
+    Filter("hege_lte", TRHegemony.hege, "lte"),
+    latest=TRHegemony,
+)
+
+
+SELECT = (
+    select(TRHegemony)
+    .join(TRHegemony.origin_relation.of_type(Origin))
+    .join(TRHegemony.dependency_relation.of_type(Dependency))
+    .options(
+        contains_eager(TRHegemony.origin_relation.of_type(Origin)),
+        contains_eager(TRHegemony.dependency_relation.of_type(Dependency))
+    )
+)
 
 
 class TRHegemonyRepository:
@@ -24,64 +58,30 @@ class TRHegemonyRepository:
         hege_lte: Optional[float] = None,
         af: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[TRHegemony], int]:
-        Origin = aliased(TRHegemony.origin_relation.property.mapper.class_)
-        Dependency = aliased(TRHegemony.dependency_relation.property.mapper.class_)
-
-        stmt = (
-            select(TRHegemony)
-            .join(TRHegemony.origin_relation.of_type(Origin))
-            .join(TRHegemony.dependency_relation.of_type(Dependency))
-            .options(
-                contains_eager(TRHegemony.origin_relation.of_type(Origin)),
-                contains_eager(TRHegemony.dependency_relation.of_type(Dependency))
-            )
-        )
-
-        # If no time filters specified, get rows with max timebin
-        if not timebin and not timebin_gte and not timebin_lte:
-            max_timebin = db.scalar(select(func.max(TRHegemony.timebin)))
-            stmt = stmt.where(TRHegemony.timebin == max_timebin)
-
-        if timebin:
-            stmt = stmt.where(TRHegemony.timebin == timebin)
-        if timebin_gte:
-            stmt = stmt.where(TRHegemony.timebin >= timebin_gte)
-        if timebin_lte:
-            stmt = stmt.where(TRHegemony.timebin <= timebin_lte)
-
-        if origin_names:
-            names = origin_names.split('|')
-            stmt = stmt.where(Origin.name.in_(names))
-        if origin_type:
-            stmt = stmt.where(Origin.type == origin_type)
-        if origin_af:
-            stmt = stmt.where(Origin.af == origin_af)
-
-        if dependency_names:
-            names = dependency_names.split('|')
-            stmt = stmt.where(Dependency.name.in_(names))
-        if dependency_type:
-            stmt = stmt.where(Dependency.type == dependency_type)
-        if dependency_af:
-            stmt = stmt.where(Dependency.af == dependency_af)
-
-        if hege:
-            stmt = stmt.where(TRHegemony.hege == hege)
-        if hege_gte:
-            stmt = stmt.where(TRHegemony.hege >= hege_gte)
-        if hege_lte:
-            stmt = stmt.where(TRHegemony.hege <= hege_lte)
-        if af:
-            stmt = stmt.where(TRHegemony.af == af)
-
-        total_count = db.scalar(select(func.count()).select_from(stmt.subquery()))
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[TRHegemony], Optional[int]]:
+        stmt = FILTERS.apply(db, SELECT, dict(
+            timebin=timebin,
+            timebin_gte=timebin_gte,
+            timebin_lte=timebin_lte,
+            origin_names=origin_names,
+            dependency_names=dependency_names,
+            origin_type=origin_type,
+            dependency_type=dependency_type,
+            origin_af=origin_af,
+            dependency_af=dependency_af,
+            hege=hege,
+            hege_gte=hege_gte,
+            hege_lte=hege_lte,
+            af=af
+        ))
 
-        if order_by and hasattr(TRHegemony, order_by):
-            stmt = stmt.order_by(getattr(TRHegemony, order_by))
+        total_count = count_rows(db, stmt, count_mode)
 
-        offset = (page - 1) * page_size
-        results = db.scalars(stmt.offset(offset).limit(page_size)).unique().all()
+        # Apply ordering and pagination
+        stmt = apply_pagination(stmt, TRHegemony, page, order_by, cursor)
+        results = fetch_page(db.scalars(stmt).unique())
 
         return results, total_count
@@ -14,8 +14,9 @@ class CountryService:
         code: Optional[str] = None,
         name: Optional[str] = None,
         page: int = 1,                 # Page number, defaults to 1
-        order_by: Optional[str] = None # Column name to sort by
-    ) -> Tuple[List[CountryDTO], int]:
+        order_by: Optional[str] = None, # Column name to sort by
+        count_mode: str = "exact"
+    ) -> Tuple[List[CountryDTO], Optional[int]]:
         """Fetches paginated countries, applying filters if provided."""
 
         countries, total_count = self.repository.get_all(
@@ -23,6 +24,7 @@ class CountryService:
             code=code,
             name=name,
             page=page,
-            order_by=order_by   
+            order_by=order_by,
+            count_mode=count_mode
         )
         return [CountryDTO(code=c.code, name=c.name) for c in countries], total_count
@@ -32,8 +32,9 @@ class DiscoService:
         ongoing: Optional[str] = None,
         include_probe_details: bool = False,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[DiscoEventsDTO], int]:
+        order_by: Optional[str] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[DiscoEventsDTO], Optional[int]]:
 
         events_data, total_count = self.disco_events_repository.get_disco_events(
             db,
@@ -57,7 +58,8 @@ class DiscoService:
             ongoing=ongoing,
             include_probe_details=include_probe_details,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            count_mode=count_mode
         )
 
         return [DiscoEventsDTO.from_model(event, include_probe_details=include_probe_details) for event in events_data], total_count
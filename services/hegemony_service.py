@@ -1,16 +1,19 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import Row
 from repositories.hegemony_cone_repository import HegemonyConeRepository
-from dtos.hegemony_cone_dto import HegemonyConeDTO
 from repositories.hegemony_alarms_repository import HegemonyAlarmsRepository
 from dtos.hegemony_alarms_dto import HegemonyAlarmsDTO
 from repositories.hegemony_country_repository import HegemonyCountryRepository
-from dtos.hegemony_country_dto import HegemonyCountryDTO
 from repositories.hegemony_repository import HegemonyRepository
-from dtos.hegemony_dto import HegemonyDTO
 from repositories.hegemony_prefix_repository import HegemonyPrefixRepository
-from dtos.hegemony_prefix_dto import HegemonyPrefixDTO
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Iterator
 from datetime import datetime
+from repositories.asn_directory import asn_directory
+from utils import next_cursor, rows_to_dicts
+from collections import namedtuple
+
+# Line of the POST /hegemony/batch response: an origin and all its dependencies
+OriginDependencies = namedtuple("OriginDependencies", ["originasn", "originasn_name", "dependencies"])
 
 
 class HegemonyService:
@@ -29,8 +32,10 @@ class HegemonyService:
         asn_ids: Optional[List[int]] = None,
         af: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[HegemonyConeDTO], int]:
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
         """
         Get hegemony cone data with time-based filtering.
         """
@@ -41,15 +46,13 @@ class HegemonyService:
             asn_ids=asn_ids,
             af=af,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            cursor=cursor,
+            count_mode=count_mode
         )
 
-        return [HegemonyConeDTO(
-            timebin=cone.timebin,
-            asn=cone.asn,
-            conesize=cone.conesize,
-            af=cone.af
-        ) for cone in cones], total_count
+        # Rows are already shaped like HegemonyConeDTO, they are rendered without validation
+        return rows_to_dicts(cones), total_count, next_cursor(cones, order_by)
 
     def get_hegemony_alarms(
         self,
@@ -62,8 +65,10 @@ class HegemonyService:
         deviation_gte: Optional[float] = None,
         deviation_lte: Optional[float] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[HegemonyAlarmsDTO], int]:
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[HegemonyAlarmsDTO], Optional[int], Optional[str]]:
         """
         Get hegemony alarms data with filtering.
         """
@@ -77,7 +82,9 @@ class HegemonyService:
             deviation_gte=deviation_gte,
             deviation_lte=deviation_lte,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            cursor=cursor,
+            count_mode=count_mode
         )
 
         return [HegemonyAlarmsDTO(
@@ -86,9 +93,9 @@ class HegemonyService:
             asn=alarm.asn,
             deviation=alarm.deviation,
             af=alarm.af,
-            asn_name=alarm.asn_relation.name if alarm.asn_relation else None,
-            originasn_name=alarm.originasn_relation.name if alarm.originasn_relation else None
-        ) for alarm in alarms], total_count
+            asn_name=asn_directory.name(db, alarm.asn),
+            originasn_name=asn_directory.name(db, alarm.originasn)
+        ) for alarm in alarms], total_count, next_cursor(alarms, order_by)
 
     def get_hegemony_countries(
         self,
@@ -104,8 +111,10 @@ class HegemonyService:
         hege_gte: Optional[float] = None,
         hege_lte: Optional[float] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[HegemonyCountryDTO], int]:
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
         """
         Get hegemony country data with filtering.
         """
@@ -122,20 +131,13 @@ class HegemonyService:
             hege_gte=hege_gte,
             hege_lte=hege_lte,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            cursor=cursor,
+            count_mode=count_mode
         )
 
-        return [HegemonyCountryDTO(
-            timebin=country.timebin,
-            country=country.country,
-            asn=country.asn,
-            hege=country.hege,
-            af=country.af,
-            asn_name=country.asn_relation.name if country.asn_relation else None,
-            weight=country.weight,
-            weightscheme=country.weightscheme,
-            transitonly=country.transitonly
-        ) for country in countries_data], total_count
+        # Rows are already shaped like HegemonyCountryDTO, they are rendered without validation
+        return rows_to_dicts(countries_data), total_count, next_cursor(countries_data, order_by)
 
     def get_hegemony(
         self,
@@ -148,11 +150,15 @@ class HegemonyService:
         hege: Optional[float] = None,
         hege_gte: Optional[float] = None,
         hege_lte: Optional[float] = None,
+        top: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[HegemonyDTO], int]:
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
         """
-        Get hegemony data with filtering.
+        Get hegemony data with filtering, or only the top dependencies of each
+        origin, af and timebin.
         """
         hegemony_data, total_count = self.hegemony_repository.get_all(
             db,
@@ -164,19 +170,85 @@ class HegemonyService:
             hege=hege,
             hege_gte=hege_gte,
             hege_lte=hege_lte,
+            top=top,
+            page=page,
+            order_by=order_by,
+            cursor=cursor,
+            count_mode=count_mode
+        )
+
+        # Rows are already shaped like HegemonyDTO, they are rendered without validation
+        return rows_to_dicts(hegemony_data), total_count, next_cursor(hegemony_data, order_by)
+
+    def get_hegemony_aggregates(
+        self,
+        db: Session,
+        resolution: str,
+        timebin_gte: Optional[datetime] = None,
+        timebin_lte: Optional[datetime] = None,
+        asn_ids: Optional[List[int]] = None,
+        originasn_ids: Optional[List[int]] = None,
+        af: Optional[int] = None,
+        hege: Optional[float] = None,
+        hege_gte: Optional[float] = None,
+        hege_lte: Optional[float] = None,
+        page: int = 1,
+        order_by: Optional[str] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
+        """
+        Get AS dependencies downsampled to buckets of the given resolution.
+        """
+        aggregates, total_count = self.hegemony_repository.get_aggregates(
+            db,
+            resolution,
+            timebin_gte=timebin_gte,
+            timebin_lte=timebin_lte,
+            asn_ids=asn_ids,
+            originasn_ids=originasn_ids,
+            af=af,
+            hege=hege,
+            hege_gte=hege_gte,
+            hege_lte=hege_lte,
+            page=page,
+            order_by=order_by,
+            count_mode=count_mode
+        )
+
+        # Rows are already shaped like HegemonyAggregateDTO, pages are walked by number only
+        return rows_to_dicts(aggregates), total_count, None
+
+    def get_hegemony_diff(
+        self,
+        db: Session,
+        timebin: Optional[datetime] = None,
+        previous_timebin: Optional[datetime] = None,
+        threshold: float = 0,
+        asn_ids: Optional[List[int]] = None,
+        originasn_ids: Optional[List[int]] = None,
+        af: Optional[int] = None,
+        page: int = 1,
+        order_by: Optional[str] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
+        """
+        Get the AS dependencies that changed between two timebins.
+        """
+        changes, total_count = self.hegemony_repository.get_diff(
+            db,
+            timebin=timebin,
+            previous_timebin=previous_timebin,
+            threshold=threshold,
+            asn_ids=asn_ids,
+            originasn_ids=originasn_ids,
+            af=af,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            count_mode=count_mode
         )
 
-        return [HegemonyDTO(
-            timebin=hegemony.timebin,
-            originasn=hegemony.originasn,
-            asn=hegemony.asn,
-            hege=hegemony.hege,
-            af=hegemony.af,
-            asn_name=hegemony.asn_relation.name if hegemony.asn_relation else None,
-            originasn_name=hegemony.originasn_relation.name if hegemony.originasn_relation else None
-        ) for hegemony in hegemony_data], total_count
+        # Rows are already shaped like HegemonyDiffDTO, pages are walked by number only
+        return rows_to_dicts(changes), total_count, None
 
     def get_hegemony_prefixes(
         self,
@@ -197,8 +269,10 @@ class HegemonyService:
         hege_lte: Optional[float] = None,
         origin_only: Optional[bool] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[HegemonyPrefixDTO], int]:
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
         """
         Get hegemony prefix data with filtering.
         """
@@ -220,24 +294,73 @@ class HegemonyService:
             hege_lte=hege_lte,
             origin_only=origin_only,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            cursor=cursor,
+            count_mode=count_mode
         )
 
-        return [HegemonyPrefixDTO(
-            timebin=prefix.timebin,
-            prefix=prefix.prefix,
-            originasn=prefix.originasn,
-            country=prefix.country,
-            asn=prefix.asn,
-            hege=prefix.hege,
-            af=prefix.af,
-            visibility=prefix.visibility,
-            rpki_status=prefix.rpki_status,
-            irr_status=prefix.irr_status,
-            delegated_prefix_status=prefix.delegated_prefix_status,
-            delegated_asn_status=prefix.delegated_asn_status,
-            descr=prefix.descr,
-            moas=prefix.moas,
-            originasn_name=prefix.originasn_relation.name if prefix.originasn_relation else None,
-            asn_name=prefix.asn_relation.name if prefix.asn_relation else None
-        ) for prefix in prefixes_data], total_count
+        # Rows are already shaped like HegemonyPrefixDTO, they are rendered without validation
+        return rows_to_dicts(prefixes_data), total_count, next_cursor(prefixes_data, order_by)
+
+    def stream_hegemony_cones(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Stream all hegemony cones matching filters, by batches of rows.
+        """
+        return self.hegemony_cone_repository.stream_all(db, order_by=order_by, **filters)
+
+    def stream_hegemony(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Stream all AS dependencies matching filters, by batches of rows.
+        """
+        return self.hegemony_repository.stream_all(db, order_by=order_by, **filters)
+
+    def stream_hegemony_aggregates(self, db: Session, resolution: str, order_by: Optional[str] = None,
+                                   **filters) -> Iterator[List[Row]]:
+        """
+        Stream all downsampled AS dependencies matching filters, by batches of rows.
+        """
+        return self.hegemony_repository.stream_aggregates(db, resolution, order_by=order_by, **filters)
+
+    def stream_hegemony_diff(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Stream all AS dependencies that changed between two timebins, by batches of rows.
+        """
+        return self.hegemony_repository.stream_diff(db, order_by=order_by, **filters)
+
+    def stream_hegemony_countries(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Stream all hegemony country data matching filters, by batches of rows.
+        """
+        return self.hegemony_country_repository.stream_all(db, order_by=order_by, **filters)
+
+    def stream_hegemony_prefixes(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Stream all hegemony prefix data matching filters, by batches of rows.
+        """
+        return self.hegemony_prefix_repository.stream_all(db, order_by=order_by, **filters)
+
+    def stream_hegemony_by_origin(self, db: Session, **filters) -> Iterator[List[OriginDependencies]]:
+        """
+        Stream all AS dependencies matching filters grouped by origin, by batches
+        of origins. An origin is yielded once all its dependencies are read, which
+        may span several batches of rows.
+        """
+        origin = None
+        for rows in self.hegemony_repository.stream_by_origin(db, **filters):
+            completed = []
+            for row in rows:
+                if origin is None or origin.originasn != row.originasn:
+                    if origin is not None:
+                        completed.append(origin)
+                    origin = OriginDependencies(row.originasn, row.originasn_name, [])
+                origin.dependencies.append({
+                    "timebin": row.timebin,
+                    "asn": row.asn,
+                    "asn_name": row.asn_name,
+                    "hege": row.hege,
+                    "af": row.af,
+                })
+            if completed:
+                yield completed
+        if origin is not None:
+            yield [origin]
@@ -5,6 +5,8 @@ from dtos.metis_atlas_deployment_dto import MetisAtlasDeploymentDTO
 from dtos.metis_atlas_selection_dto import MetisAtlasSelectionDTO
 from typing import Optional, List, Tuple
 from datetime import datetime
+from repositories.asn_directory import asn_directory
+from utils import next_cursor
 
 
 class MetisService:
@@ -24,8 +26,10 @@ class MetisService:
         metric: Optional[str] = None,
         af: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[MetisAtlasDeploymentDTO], int]:
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[MetisAtlasDeploymentDTO], Optional[int], Optional[str]]:
         """
         Get Metis Atlas deployment data with filtering.
         """
@@ -40,7 +44,9 @@ class MetisService:
             metric=metric,
             af=af,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            cursor=cursor,
+            count_mode=count_mode
         )
 
         return [MetisAtlasDeploymentDTO(
@@ -50,8 +56,8 @@ class MetisService:
             asn=deployment.asn,
             af=deployment.af,
             nbsamples=deployment.nbsamples,
-            asn_name=deployment.asn_relation.name if deployment.asn_relation else None
-        ) for deployment in deployments], total_count
+            asn_name=asn_directory.name(db, deployment.asn)
+        ) for deployment in deployments], total_count, next_cursor(deployments, order_by)
 
     def get_metis_atlas_selections(
         self,
@@ -65,8 +71,10 @@ class MetisService:
         metric: Optional[str] = None,
         af: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[MetisAtlasSelectionDTO], int]:
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[MetisAtlasSelectionDTO], Optional[int], Optional[str]]:
         """
         Get Metis Atlas selection data with filtering.
         """
@@ -81,7 +89,9 @@ class MetisService:
             metric=metric,
             af=af,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            cursor=cursor,
+            count_mode=count_mode
         )
 
         return [MetisAtlasSelectionDTO(
@@ -90,5 +100,5 @@ class MetisService:
             rank=selection.rank,
             asn=selection.asn,
             af=selection.af,
-            asn_name=selection.asn_relation.name if selection.asn_relation else None
-        ) for selection in selections], total_count
+            asn_name=asn_directory.name(db, selection.asn)
+        ) for selection in selections], total_count, next_cursor(selections, order_by)
@@ -1,12 +1,14 @@
 from sqlalchemy.orm import Session
+from sqlalchemy import Row
 from repositories.atlas_location_repository import AtlasLocationRepository
 from repositories.atlas_delay_repository import AtlasDelayRepository
 from repositories.atlas_delay_alarms_repository import AtlasDelayAlarmsRepository
+from repositories.location_index import location_index
 from dtos.network_delay_locations_dto import NetworkDelayLocationsDTO
-from dtos.network_delay_dto import NetworkDelayDTO
 from dtos.network_delay_alarms_dto import NetworkDelayAlarmsDTO
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Iterator
 from datetime import datetime
+from utils import next_cursor, rows_to_dicts
 
 
 class NetworkDelayService:
@@ -22,8 +24,9 @@ class NetworkDelayService:
         type: Optional[str] = None,
         af: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[NetworkDelayLocationsDTO], int]:
+        order_by: Optional[str] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[NetworkDelayLocationsDTO], Optional[int]]:
         """
         Get locations monitored for network delay measurements.
         """
@@ -33,7 +36,8 @@ class NetworkDelayService:
             type=type,
             af=af,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            count_mode=count_mode
         )
 
         return [NetworkDelayLocationsDTO(
@@ -60,8 +64,10 @@ class NetworkDelayService:
         startpoint_key: Optional[str] = None,
         endpoint_key: Optional[str] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[NetworkDelayDTO], int]:
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
         """
         Get network delays with all possible filters.
         """
@@ -82,10 +88,76 @@ class NetworkDelayService:
             startpoint_key=startpoint_key,
             endpoint_key=endpoint_key,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            cursor=cursor,
+            count_mode=count_mode
         )
 
-        return [NetworkDelayDTO.from_model(atlasDelay) for atlasDelay in atlasDelays], total_count
+        # Rows are already shaped like NetworkDelayDTO, they are rendered without validation
+        return rows_to_dicts(atlasDelays), total_count, next_cursor(atlasDelays, order_by)
+
+    def stream_network_delays(self, db: Session, order_by: Optional[str] = None, **filters) -> Iterator[List[Row]]:
+        """
+        Stream all network delays matching filters, by batches of rows.
+        """
+        return self.atlas_delay_repository.stream_all(db, order_by=order_by, **filters)
+
+    def get_network_delay_aggregates(
+        self,
+        db: Session,
+        resolution: str,
+        timebin: Optional[datetime] = None,
+        timebin_gte: Optional[datetime] = None,
+        timebin_lte: Optional[datetime] = None,
+        startpoint_names: Optional[str] = None,
+        endpoint_names: Optional[str] = None,
+        startpoint_type: Optional[str] = None,
+        endpoint_type: Optional[str] = None,
+        startpoint_af: Optional[int] = None,
+        endpoint_af: Optional[int] = None,
+        median: Optional[float] = None,
+        median_gte: Optional[float] = None,
+        median_lte: Optional[float] = None,
+        startpoint_key: Optional[str] = None,
+        endpoint_key: Optional[str] = None,
+        page: int = 1,
+        order_by: Optional[str] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[dict], Optional[int], Optional[str]]:
+        """
+        Get network delays aggregated in buckets of the given resolution.
+        """
+        aggregates, total_count = self.atlas_delay_repository.get_aggregates(
+            db,
+            resolution,
+            timebin=timebin,
+            timebin_gte=timebin_gte,
+            timebin_lte=timebin_lte,
+            startpoint_names=startpoint_names,
+            endpoint_names=endpoint_names,
+            startpoint_type=startpoint_type,
+            endpoint_type=endpoint_type,
+            startpoint_af=startpoint_af,
+            endpoint_af=endpoint_af,
+            median=median,
+            median_gte=median_gte,
+            median_lte=median_lte,
+            startpoint_key=startpoint_key,
+            endpoint_key=endpoint_key,
+            page=page,
+            order_by=order_by,
+            count_mode=count_mode
+        )
+
+        # Rows are already shaped like NetworkDelayAggregateDTO, pages are walked by number only
+        return rows_to_dicts(aggregates), total_count, None
+
+    def stream_network_delay_aggregates(self, db: Session, resolution: str, order_by: Optional[str] = None,
+                                        **filters) -> Iterator[List[Row]]:
+        """
+        Stream all aggregated network delays matching filters, by batches of rows.
+        """
+        return self.atlas_delay_repository.stream_aggregates(db, resolution, order_by=order_by, **filters)
 
     def get_network_delay_alarms(
         self,
@@ -104,8 +176,10 @@ class NetworkDelayService:
         deviation_gte: Optional[float] = None,
         deviation_lte: Optional[float] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[NetworkDelayAlarmsDTO], int]:
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[NetworkDelayAlarmsDTO], Optional[int], Optional[str]]:
         """
         Get network delay alarms with all possible filters.
         """
@@ -125,7 +199,17 @@ class NetworkDelayService:
             deviation_gte=deviation_gte,
             deviation_lte=deviation_lte,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            cursor=cursor,
+            count_mode=count_mode
         )
 
-        return [NetworkDelayAlarmsDTO.from_model(alarm) for alarm in alarms], total_count
+        alarms_data = []
+        for alarm in alarms:
+            startpoint = location_index.location(db, alarm.startpoint_id)
+            endpoint = location_index.location(db, alarm.endpoint_id)
+            # Alarms of locations missing from ihr_atlas_location are left out, as joining it did
+            if startpoint is not None and endpoint is not None:
+                alarms_data.append(NetworkDelayAlarmsDTO.from_model(alarm, startpoint, endpoint))
+
+        return alarms_data, total_count, next_cursor(alarms, order_by)
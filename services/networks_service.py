@@ -17,8 +17,9 @@ class NetworksService:
         number_lte: Optional[int] = None,
         search: Optional[str] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[NetworksDTO], int]:
+        order_by: Optional[str] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[NetworksDTO], Optional[int]]:
         """
         Get network data with various filtering options.
         """
@@ -30,7 +31,8 @@ class NetworksService:
             number_lte=number_lte,
             search=search,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            count_mode=count_mode
         )
 
         return [NetworksDTO.from_model(network) for network in networks], total_count
@@ -0,0 +1,258 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional, Callable, Awaitable, Any
+from dotenv import load_dotenv
+from fastapi import Request, Response, HTTPException, status
+from repositories.latest_timebin_registry import latest_timebin_registry
+from repositories.filters import canonical_key
+from config.metrics import COALESCED_CALLS, route_label
+from utils import TTLCache, run_with_timeout
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+try:
+    load_dotenv()
+except:
+    pass
+
+logger = logging.getLogger("ihr.response_cache")
+
+# memory: per-process LRU, sqlite: store shared by all workers of the host, none: disabled
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1024))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "/tmp/ihr_response_cache.sqlite")
+RESPONSE_CACHE_HISTORICAL_TTL = float(os.getenv("RESPONSE_CACHE_HISTORICAL_TTL", 86400))
+RESPONSE_CACHE_RECENT_TTL = float(os.getenv("RESPONSE_CACHE_RECENT_TTL", 60))
+
+
+class SqliteCacheBackend:
+    """
+    Cache backend storing pickled values in a local SQLite file, so that all
+    uvicorn workers running on the same host share their cached responses.
+
+    Its calls block on file I/O and locks held by other workers, hence they are
+    run in a thread. SQLite errors (e.g. "database is locked") are logged and
+    handled as misses or skipped writes.
+    """
+    # Whether get and set block on I/O and must be run outside of the event loop
+    blocking = True
+    # Expired entries, then the entries expiring first beyond maxsize, are pruned
+    # every PRUNE_EVERY writes
+    PRUNE_EVERY = 100
+
+    def __init__(self, path: str, maxsize: int):
+        self.maxsize = maxsize
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache "
+            "(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key, default=None):
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value FROM response_cache WHERE key = ? AND expires_at > ?",
+                    (key, time.time())
+                ).fetchone()
+        except sqlite3.Error:
+            logger.warning("Response cache read failed", exc_info=True)
+            return default
+        return pickle.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl: float) -> None:
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, pickle.dumps(value), time.time() + ttl)
+                )
+                self._writes += 1
+                if self._writes % self.PRUNE_EVERY == 0:
+                    self._prune()
+        except sqlite3.Error:
+            logger.warning("Response cache write failed", exc_info=True)
+
+    def _prune(self) -> None:
+        self._conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+        self._conn.execute(
+            "DELETE FROM response_cache WHERE key IN ("
+            "SELECT key FROM response_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,)
+        )
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _not_modified_since(if_modified_since: Optional[str], last_modified: datetime) -> bool:
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have a one second resolution
+    return last_modified.replace(microsecond=0) <= _as_utc(since)
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls: while a call of a given key is in flight,
+    other calls of the same key wait for its result instead of running again.
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            COALESCED_CALLS.labels(route=route_label()).inc()
+            # Unlike awaiting the future, wait() neither cancels the shared call when this
+            # waiter goes away nor raises CancelledError when only the shared call is cancelled
+            await asyncio.wait((future,))
+            if not future.cancelled():
+                return future.result()
+            # The request running the call was cancelled (e.g. the client went away)
+            # while this one is still waiting, hence it runs the call itself
+            return await self.run(key, fn)
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as exc:
+            future.set_exception(exc)
+            # Marks the exception as retrieved, as there may be no waiters
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+class ResponseCache:
+    """
+    Cache of service results keyed by the service method and its normalized parameters.
+
+    Data of past timebins doesn't change, hence results of ranges that end before
+    the latest timebin are kept for RESPONSE_CACHE_HISTORICAL_TTL seconds while results
+    including the latest timebin only live RESPONSE_CACHE_RECENT_TTL seconds.
+    """
+
+    def __init__(self, backend=None,
+                 historical_ttl: float = RESPONSE_CACHE_HISTORICAL_TTL,
+                 recent_ttl: float = RESPONSE_CACHE_RECENT_TTL):
+        self.backend = backend
+        self.historical_ttl = historical_ttl
+        self.recent_ttl = recent_ttl
+        self.single_flight = SingleFlight()
+
+    @staticmethod
+    def make_key(name: str, params: dict) -> str:
+        return canonical_key(name, params)
+
+    def ttl_for(self, model, timebin_lte: Optional[datetime]) -> float:
+        latest = latest_timebin_registry.peek(model)
+        if timebin_lte is not None and latest is not None and _as_utc(timebin_lte) < _as_utc(latest):
+            return self.historical_ttl
+        return self.recent_ttl
+
+    async def check_not_modified(self, request: Request, response: Response, model, db,
+                                 key: str, timebin_lte: Optional[datetime]) -> None:
+        """
+        Set the ETag, Last-Modified and Cache-Control headers of response, and raise
+        a 304 before running the query if the client already has the same content.
+
+        The ETag depends on the query and on the latest timebin relevant to it, i.e.
+        the latest timebin of model but at most timebin_lte.
+        """
+        latest = latest_timebin_registry.peek(model)
+        if latest is None:
+            latest = await run_with_timeout(latest_timebin_registry.get, db, model)
+        if latest is not None:
+            latest = _as_utc(latest)
+            if timebin_lte is not None:
+                latest = min(latest, _as_utc(timebin_lte))
+
+        digest = hashlib.blake2b(f"{request.url.path}|{key}|{latest}".encode(), digest_size=16)
+        headers = {
+            "ETag": f'"{digest.hexdigest()}"',
+            "Cache-Control": f"public, max-age={int(self.ttl_for(model, timebin_lte))}",
+            # The format of some endpoints can be negotiated with the Accept header
+            "Vary": "Accept",
+        }
+        if latest is not None:
+            headers["Last-Modified"] = format_datetime(latest.replace(microsecond=0), usegmt=True)
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            not_modified = "*" in tags or headers["ETag"] in tags
+        else:
+            not_modified = latest is not None and _not_modified_since(
+                request.headers.get("if-modified-since"), latest)
+        if not_modified:
+            raise HTTPException(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        response.headers.update(headers)
+
+    async def run(self, model, fn: Callable, db, /, request: Optional[Request] = None,
+                  response: Optional[Response] = None, **kwargs: Any) -> Any:
+        """
+        Return the cached result of fn(db, **kwargs), or run it with run_with_timeout
+        and cache its result. model is the table queried by fn, used to know if the
+        requested range includes its latest timebin. Identical concurrent calls
+        share a single execution.
+
+        If request and response are given, HTTP caching headers are added to the
+        response and conditional requests are answered with a 304.
+        """
+        key = self.make_key(fn.__qualname__, kwargs)
+        if request is not None:
+            await self.check_not_modified(request, response, model, db, key, kwargs.get("timebin_lte"))
+
+        if self.backend is None:
+            return await self.single_flight.run(key, lambda: run_with_timeout(fn, db, **kwargs))
+
+        result = await self._backend_call(self.backend.get, key)
+        if result is None:
+            result = await self.single_flight.run(key, lambda: self._run_and_store(model, key, fn, db, kwargs))
+        return result
+
+    async def _run_and_store(self, model, key: str, fn: Callable, db, kwargs: dict) -> Any:
+        result = await run_with_timeout(fn, db, **kwargs)
+        await self._backend_call(self.backend.set, key, result, self.ttl_for(model, kwargs.get("timebin_lte")))
+        return result
+
+    async def _backend_call(self, method: Callable, *args) -> Any:
+        if getattr(self.backend, "blocking", False):
+            return await asyncio.to_thread(method, *args)
+        return method(*args)
+
+def _create_backend():
+    if RESPONSE_CACHE_BACKEND == "sqlite":
+        return SqliteCacheBackend(RESPONSE_CACHE_PATH, RESPONSE_CACHE_SIZE)
+    if RESPONSE_CACHE_BACKEND == "memory":
+        return TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_RECENT_TTL)
+    return None
+
+
+response_cache = ResponseCache(_create_backend())
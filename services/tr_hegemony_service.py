@@ -3,6 +3,7 @@ from repositories.tr_hegemony_repository import TRHegemonyRepository
 from dtos.tr_hegemony_dto import TRHegemonyDTO
 from typing import Optional, List, Tuple
 from datetime import datetime
+from utils import next_cursor
 
 
 class TRHegemonyService:
@@ -26,8 +27,10 @@ class TRHegemonyService:
         hege_lte: Optional[float] = None,
         af: Optional[int] = None,
         page: int = 1,
-        order_by: Optional[str] = None
-    ) -> Tuple[List[TRHegemonyDTO], int]:
+        order_by: Optional[str] = None,
+        cursor: Optional[Tuple[datetime, int]] = None,
+        count_mode: str = "exact"
+    ) -> Tuple[List[TRHegemonyDTO], Optional[int], Optional[str]]:
         
         hegemony_data, total_count = self.tr_hegemony_repository.get_tr_hegemony(
             db,
@@ -45,7 +48,9 @@ class TRHegemonyService:
             hege_lte=hege_lte,
             af=af,
             page=page,
-            order_by=order_by
+            order_by=order_by,
+            cursor=cursor,
+            count_mode=count_mode
         )
 
-        return [TRHegemonyDTO.from_model(hegemony) for hegemony in hegemony_data], total_count
\ No newline at end of file
+        return [TRHegemonyDTO.from_model(hegemony) for hegemony in hegemony_data], total_count, next_cursor(hegemony_data, order_by)
\ No newline at end of file
@@ -0,0 +1,46 @@
+from fastapi import HTTPException
+from utils import AdmissionController
+import asyncio
+import pytest
+
+
+def test_idle_server_admits_slow_calls():
+    async def run():
+        controller = AdmissionController(capacity=2, timeout=1)
+        # Calls take longer than the timeout, but slots are free
+        controller.service_time = 5
+        await controller.acquire()
+        await controller.acquire()
+        return controller.running
+
+    assert asyncio.run(run()) == 2
+
+
+def test_calls_that_would_time_out_in_the_queue_are_shed():
+    async def run():
+        controller = AdmissionController(capacity=1, timeout=1)
+        controller.service_time = 2
+        await controller.acquire()
+        await controller.acquire()
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run())
+    assert exc.value.status_code == 503
+    assert int(exc.value.headers["Retry-After"]) >= 1
+
+
+def test_queued_call_gets_the_released_slot():
+    async def run():
+        controller = AdmissionController(capacity=1, timeout=1)
+        controller.service_time = 0.1
+        acquired_at = await controller.acquire()
+
+        async def release_later():
+            await asyncio.sleep(0.05)
+            controller.release(acquired_at)
+
+        asyncio.get_running_loop().create_task(release_later())
+        await controller.acquire()
+        return controller.running, controller.queued
+
+    assert asyncio.run(run()) == (1, 0)
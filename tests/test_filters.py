@@ -0,0 +1,38 @@
+from sqlalchemy.dialects import postgresql
+from models.hegemony import Hegemony
+from repositories.filters import ARRAY_THRESHOLD, Filter, FilterSpec, in_values
+
+
+def compile(predicate):
+    return predicate.compile(dialect=postgresql.dialect())
+
+
+def test_single_value_is_compared_for_equality():
+    compiled = compile(in_values(Hegemony.asn, [2497]))
+    assert " = " in str(compiled)
+    assert list(compiled.params.values()) == [2497]
+
+
+def test_in_lists_are_padded_to_a_power_of_two():
+    compiled = compile(in_values(Hegemony.asn, [1, 2, 3, 4, 5]))
+    values = list(compiled.params.values())[0]
+    assert values == [1, 2, 3, 4, 5, 5, 5, 5]
+
+
+def test_long_lists_are_sent_as_an_array():
+    values = list(range(ARRAY_THRESHOLD + 1))
+    compiled = compile(in_values(Hegemony.asn, values))
+    assert "= ANY" in str(compiled)
+    assert list(compiled.params.values()) == [values]
+
+
+def test_predicates_follow_the_declaration_order():
+    spec = FilterSpec(
+        Filter("originasn_ids", Hegemony.originasn, "in"),
+        Filter("asn_ids", Hegemony.asn, "in"),
+        Filter("af", Hegemony.af),
+    )
+    predicates = spec.predicates({"af": 4, "asn_ids": [3, 1], "originasn_ids": []})
+    assert [p.left.name for p in predicates] == [Hegemony.asn.expression.name, Hegemony.af.expression.name]
+    # List values are sorted
+    assert list(compile(predicates[0]).params.values()) == [[1, 3]]
@@ -0,0 +1,55 @@
+from sqlalchemy import select
+from models.atlas_delay import AtlasDelay
+from repositories.location_index import LocationIndex
+
+
+class Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class Session:
+    """
+    Session returning the (id, type, name, af) rows of ihr_atlas_location.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, stmt):
+        return Result(self.rows)
+
+
+LOCATIONS = [
+    (1, "AS", "2497", 4),
+    (2, "CT", "Tokyo, JP", 4),
+    (3, "CT", "Paris, FR", 4),
+]
+
+
+def apply(**filters):
+    stmt = select(AtlasDelay)
+    return LocationIndex().apply(Session(LOCATIONS), stmt, filters, startpoint=AtlasDelay.startpoint_id)
+
+
+def test_filter_matching_every_location_is_skipped():
+    assert apply(startpoint_af=4).whereclause is None
+
+
+def test_unparsable_keys_are_ignored():
+    assert apply(startpoint_key="x").whereclause is None
+
+
+def test_narrowing_filter_is_applied():
+    stmt = apply(startpoint_type="CT")
+    assert stmt.whereclause is not None
+    assert "startpoint_id IN" in str(stmt.whereclause)
+
+
+def test_filters_are_popped():
+    filters = {"startpoint_names": "2497", "timebin": None}
+    LocationIndex().apply(Session(LOCATIONS), select(AtlasDelay), filters, startpoint=AtlasDelay.startpoint_id)
+    assert filters == {"timebin": None}
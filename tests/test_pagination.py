@@ -0,0 +1,52 @@
+from collections import namedtuple
+from datetime import datetime, timezone
+from fastapi import HTTPException
+from utils import Page, encode_cursor, decode_cursor, next_cursor, next_page_number
+import pytest
+import utils
+
+Row = namedtuple("Row", ["timebin", "id"])
+
+
+def rows(n):
+    return [Row(datetime(2024, 1, 1, tzinfo=timezone.utc), i) for i in range(1, n + 1)]
+
+
+def test_cursor_round_trip():
+    timebin = datetime(2024, 1, 1, 0, 15, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor(timebin, 42)) == (timebin, 42)
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor("not-a-cursor")
+    assert exc.value.status_code == 400
+
+
+def test_cursor_cannot_be_combined_with_ordering():
+    cursor = encode_cursor(datetime(2024, 1, 1, tzinfo=timezone.utc), 1)
+    with pytest.raises(HTTPException):
+        decode_cursor(cursor, "-hege")
+
+
+def test_next_cursor_of_a_page_followed_by_rows():
+    page = Page(rows(utils.page_size), has_more=True)
+    last = page[-1]
+    assert decode_cursor(next_cursor(page)) == (last.timebin, last.id)
+
+
+def test_no_next_cursor_on_a_full_last_page():
+    assert next_cursor(Page(rows(utils.page_size), has_more=False)) is None
+
+
+def test_no_next_cursor_with_ordering():
+    assert next_cursor(Page(rows(utils.page_size), has_more=True), "-hege") is None
+
+
+def test_next_page_number_on_the_last_page():
+    results = rows(utils.page_size)
+    assert next_page_number(2, results, 2 * utils.page_size) is None
+    assert next_page_number(1, results, 2 * utils.page_size) == 2
+    # Without an exact count a full page is assumed to have a successor
+    assert next_page_number(2, results, None, "none") == 3
+    assert next_page_number(2, results[:-1], None, "none") is None
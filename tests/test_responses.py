@@ -0,0 +1,29 @@
+from datetime import datetime
+from fastapi.testclient import TestClient
+from dtos.generic_response_dto import render_response, encode_ndjson
+import json
+import main
+
+
+def test_non_finite_floats_are_rendered_as_null():
+    response = render_response(1, None, None, [
+        {"timebin": datetime(2024, 1, 1), "hege": float("nan"), "median": float("inf"), "entropy": 0.5}
+    ])
+    assert json.loads(response.body)["results"] == [
+        {"timebin": "2024-01-01T00:00:00", "hege": None, "median": None, "entropy": 0.5}
+    ]
+
+
+def test_ndjson_lines_are_valid_json():
+    body = encode_ndjson([{"hege": float("-inf")}, {"hege": 0.5}])
+    assert [json.loads(line) for line in body.decode().splitlines()] == [{"hege": None}, {"hege": 0.5}]
+
+
+def test_unknown_query_parameters_are_rejected():
+    client = TestClient(main.app)
+    response = client.get("/hegemony/", params={"originasn": 2497, "foo": 1})
+    assert response.status_code == 400
+    body = response.json()
+    assert body["error"] == "invalid_query_params"
+    assert body["unexpected"] == ["foo"]
+    assert "originasn" in body["allowed"]
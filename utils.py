@@ -1,11 +1,26 @@
-from typing import Optional, Tuple, Callable, Any
+from typing import Optional, Tuple, Callable, Any, Iterable, List, Iterator
 from datetime import datetime, timedelta, date
 from fastapi import HTTPException
-from datetime import datetime, timedelta
-from typing import Optional
+from fastapi.responses import JSONResponse, StreamingResponse
+from dtos.generic_response_dto import encode_csv, encode_ndjson
+from dtos.columnar import encode_columnar, require_pyarrow
+from config.metrics import (
+    timed, route_label, DB_CALL_DURATION, POOL_WAIT_DURATION, SERIALIZATION_DURATION,
+    ADMISSION_QUEUED, ADMISSION_REJECTED,
+)
 from dotenv import load_dotenv
+from sqlalchemy import select, func, inspect, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from collections import OrderedDict
+from functools import lru_cache
+from contextlib import asynccontextmanager
 import asyncio
+import base64
+import json
+import math
 import os
+import threading
+import time
 
 # Load environment variables from .env file
 try:
@@ -15,19 +30,79 @@ except:
 
 page_size = int(os.getenv("PAGE_SIZE"))
 REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT"))
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", 300))
+COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", 1024))
+# Limit concurrent database calls to the size of the pool, see AdmissionController
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() in ("1", "true", "yes")
+DB_CAPACITY = int(os.getenv("POOL_SIZE")) + int(os.getenv("MAX_OVERFLOW"))
+# Exports (format=ndjson|csv|arrow|parquet) are streamed by batches and may cover longer ranges
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 5000))
+EXPORT_MAX_DAYS = int(os.getenv("EXPORT_MAX_DAYS", 366))
+# Largest number of origin ASNs of a POST /hegemony/batch request
+HEGEMONY_BATCH_MAX_ASNS = int(os.getenv("HEGEMONY_BATCH_MAX_ASNS", 10000))
+# Longest range (days) of a request for each resolution of downsampled time series
+RESOLUTION_MAX_DAYS = {"1h": 31, "1d": 366, "1w": 3660}
+RESOLUTION_BUCKETS = {"1h": timedelta(hours=1), "1d": timedelta(days=1), "1w": timedelta(weeks=1)}
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+EXPORT_FORMAT_DESCRIPTION = f"Response format. With 'ndjson', 'csv', 'arrow' (Arrow IPC stream) or 'parquet' all the results are streamed in a single response, without pagination, and at most {EXPORT_MAX_DAYS} days of data can be fetched. When not given, the format can also be selected with the Accept header."
+
+
+# Key of db.info holding when the session was admitted
+_ADMITTED_AT = "admitted_at"
 
 
 async def run_with_timeout(fn: Callable, db, /, *args: Any, **kwargs: Any) -> Any:
+    if ADMISSION_CONTROL and _ADMITTED_AT not in db.info:
+        # The session keeps its connection until it is closed, so the slot taken
+        # by its first call is only released then (see release_session)
+        db.info[_ADMITTED_AT] = await admission_controller.acquire()
+    return await _run_with_timeout(fn, db, *args, **kwargs)
+
+
+def release_session(db) -> None:
+    """
+    Release the admission slot of db, if run_with_timeout took one. Called by
+    get_db once the session is closed and its connection returned to the pool.
+    """
+    admitted_at = db.info.pop(_ADMITTED_AT, None)
+    if admitted_at is not None:
+        admission_controller.release(admitted_at)
+
+
+async def _run_with_timeout(fn: Callable, db, /, *args: Any, **kwargs: Any) -> Any:
+    if isinstance(db, AsyncSession):
+        # Repositories are written against the synchronous Session API. run_sync
+        # runs them on the event loop, each query being awaited on asyncpg, so no
+        # worker thread is needed. On timeout the task is cancelled, and asyncpg
+        # cancels the in-flight query on the server before releasing the connection.
+        with timed(POOL_WAIT_DURATION):
+            await db.connection()
+        try:
+            with timed(DB_CALL_DURATION):
+                return await asyncio.wait_for(
+                    db.run_sync(fn, *args, **kwargs),
+                    timeout=REQUEST_TIMEOUT,
+                )
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="The request took too long")
+
     # Pre-acquire the connection so we hold a reference to the raw driver
     # connection before the thread starts. psycopg2's cancel() is explicitly
     # thread-safe: it sends PostgreSQL's cancellation signal, causing any
     # in-flight query to fail with pgcode 57014 so the thread exits immediately.
-    driver_conn = db.connection().connection.driver_connection
+    with timed(POOL_WAIT_DURATION):
+        driver_conn = db.connection().connection.driver_connection
     try:
-        return await asyncio.wait_for(
-            asyncio.to_thread(fn, db, *args, **kwargs),
-            timeout=REQUEST_TIMEOUT,
-        )
+        with timed(DB_CALL_DURATION):
+            return await asyncio.wait_for(
+                asyncio.to_thread(fn, db, *args, **kwargs),
+                timeout=REQUEST_TIMEOUT,
+            )
     except asyncio.TimeoutError:
         try:
             driver_conn.cancel()
@@ -63,4 +138,521 @@ def validate_timebin_params(
                 detail=f"The given timebin range is too large. Should be less than {max_days} days."
             )
 
-    return timebin_gte, timebin_lte
\ No newline at end of file
+    return timebin_gte, timebin_lte
+
+
+def encode_cursor(timebin: datetime, id: int) -> str:
+    """
+    Encode the position of the last row of a page into an opaque cursor.
+    """
+    raw = f"{timebin.isoformat()}|{id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], ordering: Optional[str] = None) -> Optional[Tuple[datetime, int]]:
+    """
+    Decode a cursor produced by encode_cursor into a (timebin, id) tuple.
+    Cursors walk the results in (timebin, id) order, so they can't be combined with ordering.
+    """
+    if cursor is None:
+        return None
+    if ordering:
+        raise HTTPException(
+            status_code=400,
+            detail="The cursor parameter cannot be combined with ordering."
+        )
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timebin, id = raw.split("|")
+        return datetime.fromisoformat(timebin), int(id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def apply_pagination(stmt, model, page: int = 1, order_by: Optional[str] = None,
+                     cursor: Optional[Tuple[datetime, int]] = None):
+    """
+    Apply ordering and pagination to a select() over a time-series model.
+
+    Without an explicit ordering rows are sorted by the (timebin, id) primary key,
+    so the last row of a page can be used as the keyset cursor of the next one.
+    With a cursor the page starts right after that row instead of using an offset,
+    which keeps deep pages as cheap as the first one.
+
+    In the default order one more row than a page is selected, telling whether
+    a next cursor is needed; rows should be read with fetch_page().
+    """
+    stmt = stmt.execution_options(query_label="page")
+    if cursor is not None:
+        return (
+            stmt.where(tuple_(model.timebin, model.id) > cursor)
+            .order_by(model.timebin, model.id)
+            .limit(page_size + 1)
+        )
+
+    stmt = apply_ordering(stmt, model, order_by)
+    offset = (page - 1) * page_size
+    return stmt.offset(offset).limit(page_size if order_by else page_size + 1)
+
+
+def parse_ordering(order_by: Optional[str], fields: Iterable[str]) -> List[Tuple[str, bool]]:
+    """
+    Parse order_by, a comma separated list of fields each optionally prefixed by -
+    for descending order (e.g. "-hege,asn"), into (field, descending) pairs.
+    Fields that aren't among fields are rejected with a 400.
+    """
+    if not order_by:
+        return []
+    ordering = []
+    for field in order_by.split(","):
+        field = field.strip()
+        descending = field.startswith("-")
+        name = field[1:] if descending else field
+        if name not in fields:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid ordering field: '{field}'. Allowed fields: {', '.join(sorted(fields))}."
+            )
+        if all(name != ordered for ordered, _ in ordering):
+            ordering.append((name, descending))
+    return ordering
+
+
+@lru_cache(maxsize=None)
+def model_ordering(model) -> Tuple[frozenset, List[List[Tuple[str, bool]]]]:
+    """
+    Fields of model that results can be ordered by (its columns), and the orderings
+    its indexes return rows in: its primary key first, then the __indexes__ created
+    by the migrations, as lists of (field, descending).
+    """
+    mapper = inspect(model)
+    fields = {attr.columns[0].name: attr.key for attr in mapper.column_attrs}
+    indexes = [[(fields[column.name], False) for column in mapper.primary_key]]
+    for index in getattr(model, "__indexes__", ()):
+        columns = [column.split() for column in index["columns"]]
+        if all(column[0] in fields for column in columns):
+            indexes.append([(fields[column[0]], column[-1].upper() == "DESC") for column in columns])
+    return frozenset(fields.values()), indexes
+
+
+def complete_ordering(ordering: List[Tuple[str, bool]],
+                      indexes: List[List[Tuple[str, bool]]]) -> List[Tuple[str, bool]]:
+    """
+    Complete ordering with the next fields of the first index it is a prefix of,
+    in the same or the opposite direction (indexes can be scanned backwards), then
+    with the fields of the primary key (indexes[0]) that it misses.
+
+    Sorted pages can then be read from the index instead of sorting all the
+    matching rows, and rows with equal values are always in the same order.
+    """
+    size = len(ordering)
+    for index in indexes:
+        if [field for field, _ in index[:size]] != [field for field, _ in ordering]:
+            continue
+        reversals = {descending != index_descending
+                     for (_, descending), (_, index_descending) in zip(ordering, index)}
+        if len(reversals) <= 1:
+            reverse = reversals.pop() if reversals else False
+            ordering = ordering + [(field, descending != reverse) for field, descending in index[size:]]
+            break
+
+    ordered = {field for field, _ in ordering}
+    descending = ordering[-1][1] if ordering else False
+    return ordering + [(field, descending) for field, _ in indexes[0] if field not in ordered]
+
+
+def apply_ordering(stmt, model, order_by: Optional[str] = None):
+    """
+    Order a select() over model by order_by (see parse_ordering), completed to follow
+    an index of model (see complete_ordering), or by its primary key by default.
+    model may also be an alias of a model, e.g. selecting from a subquery.
+    """
+    fields, indexes = model_ordering(inspect(model).mapper.class_)
+    ordering = complete_ordering(parse_ordering(order_by, fields), indexes)
+    return stmt.order_by(*(
+        getattr(model, field).desc() if descending else getattr(model, field)
+        for field, descending in ordering
+    ))
+
+
+def apply_label_ordering(stmt, order_by: Optional[str], default: List[str]):
+    """
+    Order a select() by the selected columns labelled in order_by (see parse_ordering),
+    then by the default labels. Used for aggregated results, which have no id to order by.
+    """
+    columns = stmt.selected_columns
+    ordering = parse_ordering(order_by, columns.keys())
+    ordered = {label for label, _ in ordering}
+    ordering += [(label, False) for label in default if label not in ordered]
+    return stmt.order_by(*(
+        columns[label].desc() if descending else columns[label]
+        for label, descending in ordering
+    ))
+
+
+class Page(list):
+    """
+    Rows of a page, and whether rows follow it.
+    """
+
+    def __init__(self, rows, has_more: bool):
+        super().__init__(rows)
+        self.has_more = has_more
+
+
+def fetch_page(result) -> Page:
+    """
+    Fetch the rows of a statement paginated by apply_pagination(), without the
+    extra row selected to tell whether rows follow the page.
+    """
+    rows = result.all()
+    return Page(rows[:page_size], len(rows) > page_size)
+
+
+class RowBatch(list):
+    """
+    Batch of rows along with the SQL types of its columns, keyed by name. Columnar
+    exports are typed with them, as a column may only hold nulls in a batch.
+    """
+
+    def __init__(self, rows, types: dict):
+        super().__init__(rows)
+        self.types = types
+
+
+def stream_rows(db, stmt) -> Iterator[RowBatch]:
+    """
+    Execute stmt with a server-side cursor and yield its rows in batches of
+    EXPORT_BATCH_SIZE, so that large results are never loaded in memory at once.
+    """
+    types = {key: column.type for key, column in stmt.selected_columns.items()}
+    result = db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE, query_label="export"))
+    for rows in result.partitions():
+        yield RowBatch(rows, types)
+
+
+def negotiate_format(request, format: str) -> str:
+    """
+    Use the export format matching the Accept header of the request when
+    the format parameter isn't given.
+    """
+    if "format" in request.query_params:
+        return format
+    accept = request.headers.get("accept", "")
+    for name, media_type in EXPORT_MEDIA_TYPES.items():
+        if media_type in accept:
+            return name
+    return format
+
+
+class ExportResponse(StreamingResponse):
+    """
+    Streaming response whose first chunk is produced before the response starts,
+    so that errors raised while preparing the export (e.g. an invalid ordering)
+    are still answered with their status code. Exports are admitted by the
+    admission controller like the sessions of other requests.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            if not ADMISSION_CONTROL:
+                await self._send(scope, receive, send)
+                return
+            # Exports hold their own connection for the whole response. Their duration
+            # depends on the client, so it isn't added to the moving average.
+            async with admission_controller.admit(observe=False):
+                await self._send(scope, receive, send)
+        except HTTPException as exc:
+            response = JSONResponse({"detail": exc.detail}, status_code=exc.status_code, headers=exc.headers)
+            await response(scope, receive, send)
+
+    async def _send(self, scope, receive, send) -> None:
+        chunks = self.body_iterator
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            first = None
+
+        async def body():
+            if first is not None:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+
+        self.body_iterator = body()
+        await super().__call__(scope, receive, send)
+
+
+def stream_export(fn: Callable, format: str, filename: str, /, **kwargs: Any) -> StreamingResponse:
+    """
+    Stream the batches of rows yielded by fn(db, **kwargs) as NDJSON, CSV,
+    an Arrow IPC stream or a Parquet file.
+
+    The response body is sent after the endpoint returns, so fn gets its own
+    session, opened when the first batch is requested and closed after the last one.
+    """
+    from config.database import SessionLocal
+
+    if format in ("arrow", "parquet"):
+        require_pyarrow()
+
+    def encode(batches: Iterator[List[Any]]) -> Iterator[bytes]:
+        if format in ("arrow", "parquet"):
+            yield from encode_columnar(batches, format)
+            return
+        header = True
+        for rows in batches:
+            if format == "csv":
+                yield encode_csv(rows_to_dicts(rows), header=header)
+                header = False
+            else:
+                yield encode_ndjson(rows_to_dicts(rows))
+
+    def body() -> Iterator[bytes]:
+        fetch_time = 0.0
+
+        def fetch(batches: Iterator[List[Any]]) -> Iterator[List[Any]]:
+            nonlocal fetch_time
+            while True:
+                start = time.perf_counter()
+                rows = next(batches, None)
+                fetch_time += time.perf_counter() - start
+                if rows is None:
+                    return
+                yield rows
+
+        with SessionLocal() as db:
+            # Batches are fetched lazily while encoding, their fetch time is
+            # excluded from the serialization time
+            chunks = encode(fetch(fn(db, **kwargs)))
+            encode_time = 0.0
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                encode_time += time.perf_counter() - start
+                if chunk is None:
+                    break
+                yield chunk
+        SERIALIZATION_DURATION.labels(route=route_label(), format=format).observe(encode_time - fetch_time)
+
+    return ExportResponse(
+        body(),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
+
+
+def next_cursor(results, order_by: Optional[str] = None) -> Optional[str]:
+    """
+    Return the cursor of the page following results (a Page), or None if results is
+    the last page or isn't sorted in the default (timebin, id) order.
+    """
+    if order_by or not results or not results.has_more:
+        return None
+    last = results[-1]
+    return encode_cursor(last.timebin, last.id)
+
+
+def rows_to_dicts(rows) -> List[dict]:
+    """
+    Convert result rows to dicts keyed by column label, without the trailing
+    id column that repositories only select for cursors.
+    """
+    if not rows:
+        return []
+    keys = [key for key in rows[0]._fields if key != "id"]
+    return [dict(zip(keys, row)) for row in rows]
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded mapping whose entries expire after ttl seconds.
+    When maxsize is reached the least recently used entry is evicted.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class AdmissionController:
+    """
+    Admit at most capacity sessions using the database at once, i.e. as many as
+    the pool has connections. Other calls wait on the event loop instead of holding a worker
+    thread blocked on the pool, and are rejected with a 503 and a Retry-After
+    header when their predicted wait would make them exceed the request timeout.
+
+    The wait is predicted from a moving average of the time slots are held for.
+    """
+    # Weight of the latest call in the moving average
+    ALPHA = 0.2
+    # Shortest time a queued call waits for a slot before being rejected
+    MIN_QUEUE_TIMEOUT = 0.1
+
+    def __init__(self, capacity: int = DB_CAPACITY, timeout: float = REQUEST_TIMEOUT):
+        self.capacity = capacity
+        self.timeout = timeout
+        self.service_time = None
+        self.running = 0
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(capacity)
+
+    def predicted_wait(self) -> float:
+        if self.running < self.capacity or self.service_time is None:
+            return 0.0
+        # Running calls end at a rate of capacity per service_time
+        return (self.queued + 1) * self.service_time / self.capacity
+
+    def _reject(self, wait: float) -> None:
+        ADMISSION_REJECTED.labels(route=route_label()).inc()
+        raise HTTPException(
+            status_code=503,
+            detail="The server is overloaded, please retry later",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
+
+    async def acquire(self) -> float:
+        """
+        Wait for a free slot, and return when it was acquired, to be given to release().
+        Calls are only rejected when they have to queue, however slow the calls are.
+        """
+        if self._semaphore.locked():
+            service_time = self.service_time or 0.0
+            wait = self.predicted_wait()
+            if wait + service_time > self.timeout:
+                self._reject(wait)
+
+            self.queued += 1
+            ADMISSION_QUEUED.inc()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(),
+                                       timeout=max(self.timeout - service_time, self.MIN_QUEUE_TIMEOUT))
+            except asyncio.TimeoutError:
+                self._reject(self.predicted_wait())
+            finally:
+                self.queued -= 1
+                ADMISSION_QUEUED.dec()
+        else:
+            # A slot is free, acquiring it doesn't wait
+            await self._semaphore.acquire()
+
+        self.running += 1
+        return time.perf_counter()
+
+    def release(self, acquired_at: float, observe: bool = True) -> None:
+        """
+        Free the slot acquired at acquired_at. Unless observe is False, the time it
+        was held for is added to the moving average.
+        """
+        self.running -= 1
+        self._semaphore.release()
+        if not observe:
+            return
+        elapsed = time.perf_counter() - acquired_at
+        if self.service_time is None:
+            self.service_time = elapsed
+        else:
+            self.service_time = self.ALPHA * elapsed + (1 - self.ALPHA) * self.service_time
+
+    @asynccontextmanager
+    async def admit(self, observe: bool = True):
+        acquired_at = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(acquired_at, observe)
+
+
+admission_controller = AdmissionController()
+
+
+# Exact counts keyed by the structure and parameters of the filtered statement,
+# so that pages 2..N of the same query don't count the rows again.
+_count_cache = TTLCache(maxsize=COUNT_CACHE_SIZE, ttl=COUNT_CACHE_TTL)
+
+
+def _compile(db, stmt):
+    return stmt.compile(dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+
+
+def _statement_key(stmt) -> tuple:
+    # The structure of the statement, as used by SQLAlchemy's compiled cache, and the
+    # values of its parameters: unlike compiling it, this doesn't render any SQL
+    cache_key = stmt._generate_cache_key()
+    return cache_key.key, repr([param.effective_value for param in cache_key.bindparams])
+
+
+def _estimate_count(db, stmt) -> int:
+    """
+    Row count estimated by the query planner (EXPLAIN), without executing the statement.
+    """
+    compiled = _compile(db, stmt)
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    plan = db.connection().exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", params,
+        execution_options={"query_label": "estimate"}
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_rows(db, stmt, count_mode: str = "exact") -> Optional[int]:
+    """
+    Count the rows selected by stmt (a filtered select() without ordering nor pagination).
+
+    count_mode is one of:
+    - exact: COUNT(*) over the statement, cached for COUNT_CACHE_TTL seconds
+    - estimated: the planner's row estimate, cheap but approximate
+    - none: don't count at all and return None
+    """
+    if count_mode == "none":
+        return None
+    if count_mode == "estimated":
+        return _estimate_count(db, stmt)
+
+    key = _statement_key(stmt)
+    total_count = _count_cache.get(key)
+    if total_count is None:
+        total_count = db.scalar(
+            select(func.count()).select_from(stmt.subquery()).execution_options(query_label="count"))
+        _count_cache.set(key, total_count)
+    return total_count
+
+
+def next_page_number(page: int, results: list, total_count: Optional[int], count_mode: str = "exact") -> Optional[int]:
+    """
+    Return the number of the page following page, or None if it is the last one.
+    Without an exact count a full page is assumed to have a successor.
+    """
+    if count_mode == "exact":
+        return page + 1 if (page * page_size) < total_count else None
+    return page + 1 if len(results) == page_size else None